@@ -75,14 +75,26 @@ from pathlib import Path
 from typing import Optional, List
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
 import io
 import csv
+import json
+import numpy as np
 import pandas as pd
 
-from modules import ClimateDataFetcher, SpatialProcessor, ClimateForecaster, GeeMapHelper
+from modules import ClimateDataFetcher, SpatialProcessor, GeeMapHelper
 from modules.utils import create_database, insert_sample_boundaries, rate_limit
 from modules.cache import cache
-from modules.climate_indices import HeatStressCalculator, DroughtIndicator, ExtremeEventAnalyzer
+from modules.climate_indices import HeatStressCalculator, DroughtIndicator
+from modules.classification import DROUGHT, HEAT_STRESS
+from modules.zonal_weights import get_zonal_weights
+from modules.location_resolver import LocationResolver
+from modules.extreme_value import DISTRIBUTIONS, METHODS
+from modules.index_pipeline import index_name, heat_stress_inputs, stored_indices
+from modules.task_pool import TaskPool, TaskPoolBusy
+from modules.model_training import TrainingScheduler
+from modules import analytics_tasks
 
 # Create FastAPI app
 app = FastAPI(
@@ -114,8 +126,19 @@ insert_sample_boundaries()
 
 data_fetcher = ClimateDataFetcher()
 spatial_processor = SpatialProcessor()
-forecaster = ClimateForecaster()
 geemap_helper = GeeMapHelper(data_fetcher)
+location_resolver = LocationResolver(spatial_processor, cache)
+task_pool = TaskPool()
+
+def training_locations():
+    """Locations whose forecast models the training service keeps current"""
+    return [
+        feat['properties']['id']
+        for level in Config.MODEL_TRAINING_LEVELS
+        for feat in spatial_processor.get_boundaries(level)['features']
+    ]
+
+training_scheduler = TrainingScheduler(training_locations)
 
 # Pydantic models for request validation
 class DownloadRequest(BaseModel):
@@ -131,6 +154,108 @@ class CompareRequest(BaseModel):
     variable: str
     time_period: str
 
+class BatchTimeseriesRequest(BaseModel):
+    locations: List[str]
+    variable: str = "temperature"
+    start: str = "2020-01-01"
+    end: Optional[str] = None
+    aggregation: str = "monthly"
+
+class CacheWarmRequest(BaseModel):
+    level: int = 1
+    variables: List[str] = ["temperature", "precipitation"]
+    start: str = "2020-01-01"
+    end: Optional[str] = None
+    aggregation: str = "monthly"
+
+class DroughtBatchRequest(BaseModel):
+    locations: Optional[List[str]] = None
+    level: int = 2
+    start: str = "1991-01-01"
+    end: Optional[str] = None
+    timescales: List[int] = [1, 3, 6, 12, 24]
+
+class ForecastBatchRequest(BaseModel):
+    locations: Optional[List[str]] = None
+    level: int = 2
+    variable: str = "temperature"
+    months_ahead: int = 3
+
+class ReturnLevelRequest(BaseModel):
+    locations: Optional[List[str]] = None
+    level: int = 2
+    variable: str = "temperature"
+    start: str = "1991-01-01"
+    end: Optional[str] = None
+    periods: List[int] = [2, 5, 10, 20, 50, 100]
+    distribution: str = "gumbel"  # gumbel, gev
+    method: str = "lmoments"  # lmoments, mle
+    intervals: bool = False  # bootstrap confidence intervals
+
+async def run_task(fn, *args):
+    """Await fn in the analytics process pool; a full pool or a crashed worker is a 503, a slow task a 504"""
+    try:
+        return await task_pool.run(fn, *args)
+    except TaskPoolBusy:
+        raise HTTPException(status_code=503, detail="Analytics workers are busy, retry shortly",
+                            headers={"Retry-After": "5"})
+    except BrokenProcessPool:
+        raise HTTPException(status_code=503, detail="Analytics worker crashed, retry shortly",
+                            headers={"Retry-After": "5"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Analytics task timed out")
+
+def get_batch_timeseries(location_ids, variable, start, end, aggregation):
+    """Columnar timeseries for many locations: cached ones are reused, the rest come from one batch reduction"""
+    series = {}
+    missing = []
+    
+    for location_id in dict.fromkeys(location_ids):
+        cached_data = cache.get_timeseries(location_id, variable, start, end, aggregation)
+        if cached_data:
+            series[location_id] = cached_data['data']
+        else:
+            missing.append(location_id)
+    
+    if missing:
+        if data_fetcher.initialized:
+            locations = []
+            for location_id in missing:
+                location = location_resolver.resolve(location_id, aggregation)
+                if location is None:
+                    raise HTTPException(status_code=404, detail=f"Unknown location: {location_id}")
+                locations.append(location)
+            
+            try:
+                batch = data_fetcher.extract_batch_timeseries(variable, start, end, locations, aggregation)
+            except Exception as e:
+                print(f"Error fetching real batch timeseries: {e}")
+                batch = data_fetcher.generate_mock_batch_timeseries(variable, start, end, missing, aggregation)
+        else:
+            batch = data_fetcher.generate_mock_batch_timeseries(variable, start, end, missing, aggregation)
+        
+        for location_id in missing:
+            data = [
+                {'date': date, 'value': value}
+                for date, value in zip(batch['dates'], batch['values'][location_id])
+            ]
+            series[location_id] = data
+            cache.set_timeseries(location_id, variable, start, end, {
+                'location': location_id,
+                'variable': variable,
+                'data': data,
+                'aggregation': aggregation
+            }, aggregation)
+    
+    # Align every location onto the union of dates
+    dates = sorted({entry['date'] for data in series.values() for entry in data})
+    values = {}
+    for location_id, data in series.items():
+        by_date = {entry['date']: entry['value'] for entry in data}
+        values[location_id] = [by_date.get(date) for date in dates]
+    
+    return {'dates': dates, 'values': values}
+
 # HTML ROUTES - DISABLED (React frontend is used instead)
 # @app.get("/", response_class=HTMLResponse)
 # async def index(request: Request):
@@ -208,7 +333,18 @@ async def get_map_data(
     
     boundaries = spatial_processor.get_boundaries(level)
     
-    if data_fetcher.initialized:
+    zonal_weights = get_zonal_weights(level)
+    
+    if data_fetcher.initialized and zonal_weights is not None:
+        # Fast path: one pixel download + sparse matrix product for every zone
+        try:
+            grid_values = data_fetcher.fetch_era5_grid([variable], year, month, zonal_weights.grid)
+            means = zonal_weights.zonal_mean(grid_values[variable])
+            climate_data = zonal_weights.to_records(means)
+        except Exception as e:
+            print(f"Error computing local zonal stats: {e}")
+            climate_data = data_fetcher.generate_mock_zonal_stats(variable, date)
+    elif data_fetcher.initialized:
         try:
             image = data_fetcher.fetch_era5_for_map(variable, year, month)
             
@@ -235,9 +371,9 @@ async def get_map_data(
                 })
         except Exception as e:
             print(f"Error fetching real data: {e}")
-            climate_data = data_fetcher.generate_mock_zonal_stats(variable)
+            climate_data = data_fetcher.generate_mock_zonal_stats(variable, date)
     else:
-        climate_data = data_fetcher.generate_mock_zonal_stats(variable)
+        climate_data = data_fetcher.generate_mock_zonal_stats(variable, date)
     
     result = spatial_processor.add_climate_values_to_geojson(
         boundaries, climate_data, variable
@@ -272,16 +408,20 @@ async def get_timeseries(
         return JSONResponse(content=cached_data)
     
     if data_fetcher.initialized:
+        location = location_resolver.resolve(location_id, aggregation)
+        if location is None:
+            raise HTTPException(status_code=404, detail=f"Unknown location: {location_id}")
+        
         try:
-            pakistan_center = ee.Geometry.Point([69.3451, 30.3753])
             data = data_fetcher.extract_timeseries(
-                variable, start, end, pakistan_center, aggregation, location_id
+                variable, start, end, data_fetcher.location_geometry(location),
+                aggregation, location['cache_key']
             )
         except Exception as e:
             print(f"Error fetching real timeseries: {e}")
-            data = data_fetcher.generate_mock_timeseries(variable, start, end)
+            data = data_fetcher.generate_mock_timeseries(variable, start, end, location_id, aggregation)
     else:
-        data = data_fetcher.generate_mock_timeseries(variable, start, end)
+        data = data_fetcher.generate_mock_timeseries(variable, start, end, location_id, aggregation)
     
     result = {
         'location': location_id,
@@ -295,6 +435,57 @@ async def get_timeseries(
     
     return JSONResponse(content=result)
 
+@app.get("/api/timeseries/stream")
+async def stream_timeseries(
+    location_id: str = "punjab",
+    variable: str = "temperature",
+    start: str = "2020-01-01",
+    end: Optional[str] = None,
+    aggregation: str = "hourly"
+):
+    """Stream a long timeseries as NDJSON, one line per fetched time window in date order"""
+    if end is None:
+        end = datetime.now().strftime('%Y-%m-%d')
+    
+    geometry = None
+    cache_key = location_id
+    if data_fetcher.initialized:
+        location = location_resolver.resolve(location_id, aggregation)
+        if location is None:
+            raise HTTPException(status_code=404, detail=f"Unknown location: {location_id}")
+        geometry = data_fetcher.location_geometry(location)
+        cache_key = location['cache_key']
+    
+    def generate():
+        chunks = data_fetcher.iter_timeseries_chunks(
+            variable, start, end, geometry, aggregation, cache_key
+        )
+        for chunk in chunks:
+            yield json.dumps({
+                'location': location_id,
+                'variable': variable,
+                'aggregation': aggregation,
+                'data': chunk
+            }) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/api/timeseries/batch")
+async def get_timeseries_batch(request: BatchTimeseriesRequest):
+    """Get time series for many locations at once as columnar arrays"""
+    end = request.end or datetime.now().strftime('%Y-%m-%d')
+    
+    batch = get_batch_timeseries(request.locations, request.variable, request.start, end, request.aggregation)
+    
+    return JSONResponse(content={
+        'variable': request.variable,
+        'aggregation': request.aggregation,
+        'start': request.start,
+        'end': end,
+        'dates': batch['dates'],
+        'values': batch['values']
+    })
+
 @app.post("/api/compare")
 async def compare_regions(request: CompareRequest):
     """Compare climate data across multiple regions"""
@@ -303,20 +494,23 @@ async def compare_regions(request: CompareRequest):
     except:
         raise HTTPException(status_code=400, detail="Invalid time period format")
     
+    batch = get_batch_timeseries(request.locations, request.variable, start_date, end_date, 'monthly')
+    
     comparison_data = []
     
     for location in request.locations:
-        location_timeseries = data_fetcher.generate_mock_timeseries(
-            request.variable, start_date, end_date
-        )
-        values = [d['value'] for d in location_timeseries]
+        location_values = batch['values'][location]
+        values = [v for v in location_values if v is not None]
         
         comparison_data.append({
             'location': location,
             'mean': round(sum(values) / len(values), 2) if values else 0,
             'min': round(min(values), 2) if values else 0,
             'max': round(max(values), 2) if values else 0,
-            'timeseries': location_timeseries
+            'timeseries': [
+                {'date': date, 'value': value}
+                for date, value in zip(batch['dates'], location_values)
+            ]
         })
     
     return JSONResponse(content={
@@ -338,12 +532,10 @@ async def get_forecast(
         variable: Climate variable to forecast
         horizon: Forecast horizon (monthly, seasonal, annual)
     """
-    historical_data = data_fetcher.generate_mock_timeseries(
-        variable, '2023-01-01', datetime.now().strftime('%Y-%m-%d')
-    )
-    
-    forecast_data = forecaster.predict_future(variable, historical_data, months_ahead=3)
-    model_info = forecaster.get_model_info(variable)
+    # Prediction runs in the task pool; models come from the background training service
+    forecast_data, model_info = await run_task(analytics_tasks.forecast, location_id, variable, 3)
+    if not model_info['trained']:
+        training_scheduler.request_training(location_id, variable)
     
     return JSONResponse(content={
         'location': location_id,
@@ -352,6 +544,37 @@ async def get_forecast(
         'model_info': model_info
     })
 
+@app.post("/api/forecast/batch")
+async def get_forecast_batch(request: ForecastBatchRequest):
+    """
+    Forecasts for many locations, one batched pass per location model
+    
+    Locations default to every administrative unit of the requested level.
+    Locations without a published model get the climatological forecast
+    and are queued for background training.
+    
+    Returns:
+        {'dates', 'forecast': {location_id: [{'date', 'value', 'lower_bound', 'upper_bound'}]}, 'model_info'}
+    """
+    if not 1 <= request.months_ahead <= 24:
+        raise HTTPException(status_code=400, detail="months_ahead must be between 1 and 24")
+    
+    location_ids = request.locations
+    if not location_ids:
+        boundaries = spatial_processor.get_boundaries(request.level)
+        location_ids = [feat['properties']['id'] for feat in boundaries['features']]
+    if not location_ids:
+        raise HTTPException(status_code=404, detail=f"No locations for level {request.level}")
+    
+    result = await run_task(analytics_tasks.forecast_batch, location_ids, request.variable, request.months_ahead)
+    for location_id in result.pop('untrained'):
+        training_scheduler.request_training(location_id, request.variable)
+    
+    return JSONResponse(content={
+        'variable': request.variable,
+        **result
+    })
+
 @app.get("/api/statistics/summary")
 async def get_statistics(period: str = "current_month"):
     """Get summary statistics"""
@@ -380,34 +603,26 @@ async def download_data(request: DownloadRequest):
     """Download climate data in CSV or JSON format"""
     climate_data = []
     
+    location_id = request.location.get('id')
+    if location_id is None and 'lat' in request.location and 'lon' in request.location:
+        location_id = f"{request.location['lat']},{request.location['lon']}"
+    location_id = location_id or 'unknown'
+    
     for variable in request.variables:
-        if data_fetcher.initialized:
-            try:
-                pakistan_center = ee.Geometry.Point([69.3451, 30.3753])
-                timeseries = data_fetcher.extract_timeseries(
-                    variable,
-                    request.start_date,
-                    request.end_date,
-                    pakistan_center,
-                    request.aggregation,
-                    request.location.get('id', 'unknown')
-                )
-            except Exception as e:
-                print(f"Error fetching real data for download: {e}")
-                var_timeseries = data_fetcher.generate_mock_timeseries(
-                    variable, request.start_date, request.end_date
-                )
-        else:
-            var_timeseries = data_fetcher.generate_mock_timeseries(
-                variable, request.start_date, request.end_date
-            )
+        batch = get_batch_timeseries(
+            [location_id], variable, request.start_date, request.end_date, request.aggregation
+        )
+        var_timeseries = [
+            {'date': date, 'value': value}
+            for date, value in zip(batch['dates'], batch['values'][location_id])
+        ]
         
         for entry in var_timeseries:
             climate_data.append({
                 'date': entry['date'],
                 'variable': variable,
                 'value': entry['value'],
-                'location': request.location.get('id', 'unknown'),
+                'location': location_id,
                 'aggregation': request.aggregation,
                 'units': Config.CLIMATE_VARIABLES.get(variable, {}).get('unit', '')
             })
@@ -454,11 +669,19 @@ async def startup_event():
     print(f"GEE Initialized: {GEE_INITIALIZED}")
     print("API Documentation: http://localhost:8000/api/docs")
     print("=" * 60)
+    
+    # Spawn analytics workers now so the first heavy request does not pay for imports
+    task_pool.start()
+    
+    # Forecast models are trained in their own pool, never on the request path
+    training_scheduler.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Run on application shutdown"""
     print("Shutting down Climate Portal...")
+    await training_scheduler.stop()
+    task_pool.shutdown()
 
 # Health check endpoint
 @app.get("/health")
@@ -470,6 +693,7 @@ async def health_check():
         "gee_initialized": GEE_INITIALIZED,
         "redis_connected": cache.connected,
         "cache_stats": cache_stats,
+        "task_pool": task_pool.metrics(),
         "version": "2.0.0"
     }
 
@@ -503,27 +727,36 @@ async def get_heat_stress_index(
     if cached_result:
         return JSONResponse(content=cached_result)
     
-    # Mock data for demonstration (in production, fetch real data)
-    temperature = 35.0  # °C
-    humidity = 65.0     # %
-    wind_speed = 2.5    # m/s
-    solar_radiation = 800  # W/m²
+    try:
+        date = pd.Timestamp(f'{date}-01').strftime('%Y-%m')
+    except:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM")
     
     heat_calc = HeatStressCalculator()
     
+    if index_type not in HEAT_STRESS:
+        raise HTTPException(status_code=400, detail="Invalid index_type")
+    
+    # Stored by the nightly index pipeline; computed from the monthly inputs on a miss
+    stored = stored_indices(location_id, index_name(index_type), date, date)
+    inputs = None
+    
+    if stored:
+        value = stored[0][1]
+    else:
+        _, fields = heat_stress_inputs([location_id], f'{date}-01', f'{date}-01')
+        value = float(heat_calc.heat_stress_array(index_type, fields)[0, 0])
+        inputs = {
+            "temperature": round(float(fields['temperature'][0, 0]), 2),
+            "humidity": round(float(fields['relative_humidity'][0, 0]), 2),
+            "wind_speed": round(float(fields['wind_speed'][0, 0]), 2) if index_type == "wbgt" else None,
+            "solar_radiation": round(float(fields['solar_radiation'][0, 0]), 2) if index_type == "wbgt" else None
+        }
+    
     if index_type == "heat_index":
-        value = heat_calc.heat_index(temperature, humidity)
         classification = heat_calc.classify_heat_stress(value)
-    elif index_type == "wbgt":
-        value = heat_calc.wet_bulb_globe_temperature(
-            temperature, humidity, wind_speed, solar_radiation
-        )
-        classification = {"level": "moderate" if value < 28 else "high" if value < 32 else "extreme"}
-    elif index_type == "humidex":
-        value = heat_calc.humidex(temperature, humidity)
-        classification = {"level": "comfortable" if value < 30 else "some_discomfort" if value < 40 else "great_discomfort"}
     else:
-        raise HTTPException(status_code=400, detail="Invalid index_type")
+        classification = {"level": HEAT_STRESS[index_type].label(value)}
     
     result = {
         "location": location_id,
@@ -531,12 +764,8 @@ async def get_heat_stress_index(
         "index_type": index_type,
         "value": round(value, 2),
         "classification": classification,
-        "inputs": {
-            "temperature": temperature,
-            "humidity": humidity,
-            "wind_speed": wind_speed if index_type == "wbgt" else None,
-            "solar_radiation": solar_radiation if index_type == "wbgt" else None
-        }
+        "source": "stored" if stored else "computed",
+        "inputs": inputs
     }
     
     # Cache for 1 hour
@@ -544,6 +773,114 @@ async def get_heat_stress_index(
     
     return JSONResponse(content=result)
 
+@app.get("/api/indices/heat-stress/map")
+async def get_heat_stress_map(
+    date: Optional[str] = None,
+    index_type: str = "heat_index",  # heat_index, wbgt, humidex
+    level: int = 1
+):
+    """
+    Gridded heat stress for a whole month, summarised per administrative unit
+    
+    Temperature, dewpoint, wind and solar radiation are fetched together in
+    one pixel download, the index is computed on every grid cell and then
+    reduced per zone with the precomputed zonal weights.
+    
+    Args:
+        date: Date in YYYY-MM format (defaults to current month)
+        index_type: Type of heat stress index (heat_index, wbgt, humidex)
+        level: Administrative level to summarise by
+    
+    Returns:
+        Per-zone mean/min/max and class counts, plus a national summary
+    """
+    if date is None:
+        date = datetime.now().strftime('%Y-%m')
+    
+    try:
+        year, month = map(int, date.split('-'))
+    except:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM")
+    
+    if index_type not in HEAT_STRESS:
+        raise HTTPException(status_code=400, detail="Invalid index_type")
+    
+    cache_key = f'heat_stress_map:{index_type}:{date}:{level}'
+    cached_result = cache.get(cache_key)
+    if cached_result:
+        return JSONResponse(content=cached_result)
+    
+    zonal_weights = get_zonal_weights(level)
+    if zonal_weights is None and await run_task(analytics_tasks.zonal_weights_level, level):
+        # Rasterized once in a worker; every process then loads the saved weights
+        zonal_weights = get_zonal_weights(level)
+    if zonal_weights is None:
+        raise HTTPException(status_code=404, detail=f"No boundaries for level {level}")
+    
+    grid = zonal_weights.grid
+    inputs = None
+    source = 'mock'
+    
+    if data_fetcher.initialized:
+        try:
+            inputs = data_fetcher.fetch_heat_stress_inputs(year, month, grid)
+            source = 'era5'
+        except Exception as e:
+            print(f"Error fetching heat stress inputs: {e}")
+    
+    if inputs is None:
+        inputs = data_fetcher.generate_mock_heat_stress_inputs(year, month, grid)
+    
+    heat_calc = HeatStressCalculator()
+    values = heat_calc.heat_stress_array(index_type, inputs)
+    classifier = HEAT_STRESS[index_type]
+    codes = classifier.codes(values)
+    labels = classifier.labels
+    
+    means = zonal_weights.zonal_mean(values)
+    minima, maxima = zonal_weights.zonal_extrema(values)
+    counts, fractions = zonal_weights.zonal_class_counts(codes, len(labels))
+    
+    def rounded(value):
+        return None if np.isnan(value) else round(float(value), 2)
+    
+    zones = []
+    for i, record in enumerate(zonal_weights.to_records(means)):
+        record.update({
+            'min': rounded(minima[i]),
+            'max': rounded(maxima[i]),
+            'class_counts': dict(zip(labels, counts[i].tolist())),
+            'class_fractions': {label: round(float(f), 4) for label, f in zip(labels, fractions[i])},
+            'dominant_class': labels[int(np.argmax(fractions[i]))] if counts[i].any() else None
+        })
+        zones.append(record)
+    
+    # National summary over every pixel inside at least one zone
+    covered = np.asarray(zonal_weights.matrix.sum(axis=0)).ravel() > 0
+    national_values = values.ravel()[covered]
+    national_codes = codes.ravel()[covered]
+    
+    result = {
+        "date": date,
+        "index_type": index_type,
+        "level": level,
+        "unit": Config.CLIMATE_INDICES.get(index_type, {}).get('unit', ''),
+        "source": source,
+        "classes": labels,
+        "grid": {"resolution": grid.resolution, "shape": list(grid.shape)},
+        "zones": zones,
+        "summary": {
+            "mean": rounded(np.nanmean(national_values)) if covered.any() else None,
+            "max": rounded(np.nanmax(national_values)) if covered.any() else None,
+            "class_counts": dict(zip(labels, classifier.counts(national_codes).tolist()))
+        }
+    }
+    
+    # A past month's map never changes, cache for 1 day
+    cache.set(cache_key, result, ttl=86400)
+    
+    return JSONResponse(content=result)
+
 @app.get("/api/indices/drought")
 async def get_drought_index(
     location_id: str = "punjab",
@@ -574,51 +911,32 @@ async def get_drought_index(
     if cached_result:
         return JSONResponse(content=cached_result)
     
-    # Mock precipitation data for demonstration
-    import numpy as np
-    dates = pd.date_range(start_date, end_date, freq='MS')
-    precipitation = np.random.gamma(2, 30, len(dates))  # Realistic precipitation distribution
-    evapotranspiration = np.random.uniform(80, 150, len(dates))
+    if index_type not in ("spi", "spei", "palmer_drought"):
+        raise HTTPException(status_code=400, detail="Invalid index_type")
     
-    drought_calc = DroughtIndicator()
+    # Stored by the nightly index pipeline; computed in the task pool on a miss
+    stored = stored_indices(location_id, index_name(index_type, timescale), start_date, end_date)
     
-    if index_type == "spi":
-        values = drought_calc.standardized_precipitation_index(precipitation, timescale)
-    elif index_type == "spei":
-        values = drought_calc.standardized_precipitation_evapotranspiration_index(
-            precipitation, evapotranspiration, timescale
-        )
-    elif index_type == "palmer_drought":
-        temperature = np.random.uniform(20, 35, len(dates))
-        values = drought_calc.palmer_drought_severity_index(temperature, precipitation)
+    if stored:
+        dates = pd.DatetimeIndex([row[0] for row in stored])
+        values = np.array([np.nan if row[1] is None else row[1] for row in stored], dtype=np.float64)
     else:
-        raise HTTPException(status_code=400, detail="Invalid index_type")
+        month_labels, values = await run_task(
+            analytics_tasks.drought_index, location_id, index_type, timescale, start_date, end_date
+        )
+        dates = pd.DatetimeIndex(month_labels)
     
-    # Create timeseries  
-    drought_timeseries = []
-    for i, date in enumerate(dates):
-        if not np.isnan(values[i]):
-            # Classify drought severity
-            if values[i] >= 2:
-                severity = "extremely_wet"
-            elif values[i] >= 1.5:
-                severity = "very_wet"
-            elif values[i] >= 1:
-                severity = "moderately_wet"
-            elif values[i] >= -1:
-                severity = "normal"
-            elif values[i] >= -1.5:
-                severity = "moderate_drought"
-            elif values[i] >= -2:
-                severity = "severe_drought"
-            else:
-                severity = "extreme_drought"
-            
-            drought_timeseries.append({
-                "date": date.strftime('%Y-%m-%d'),
-                "value": round(float(values[i]), 2),
-                "severity": severity
-            })
+    # Classify every month in one pass
+    codes = DROUGHT.codes(values)
+    severities = DROUGHT.decode(codes)
+    drought_timeseries = [
+        {
+            "date": dates[i].strftime('%Y-%m-%d'),
+            "value": round(float(values[i]), 2),
+            "severity": severities[i]
+        }
+        for i in np.flatnonzero(codes >= 0)
+    ]
     
     result = {
         "location": location_id,
@@ -628,6 +946,7 @@ async def get_drought_index(
         "end_date": end_date,
         "current_value": round(float(values[-1]), 2) if len(values) > 0 and not np.isnan(values[-1]) else None,
         "current_severity": drought_timeseries[-1]["severity"] if drought_timeseries else "unknown",
+        "classes": DROUGHT.table(),
         "timeseries": drought_timeseries
     }
     
@@ -636,6 +955,117 @@ async def get_drought_index(
     
     return JSONResponse(content=result)
 
+@app.post("/api/indices/drought/batch")
+async def get_drought_batch(request: DroughtBatchRequest):
+    """
+    SPI at every requested timescale for many locations in one pass
+    
+    Locations default to every administrative unit of the requested level.
+    
+    Returns:
+        Columnar SPI arrays: {'dates', 'spi': {timescale: {location_id: [...]}}}
+    """
+    end = request.end or datetime.now().strftime('%Y-%m-%d')
+    
+    if any(t < 1 for t in request.timescales):
+        raise HTTPException(status_code=400, detail="Timescales must be positive")
+    
+    location_ids = request.locations
+    if not location_ids:
+        boundaries = spatial_processor.get_boundaries(request.level)
+        location_ids = [feat['properties']['id'] for feat in boundaries['features']]
+    if not location_ids:
+        raise HTTPException(status_code=404, detail=f"No locations for level {request.level}")
+    
+    batch = get_batch_timeseries(location_ids, 'precipitation', request.start, end, 'monthly')
+    if not batch['dates']:
+        raise HTTPException(status_code=404, detail="No precipitation data for the requested period")
+    
+    # Reindex onto a gap-free monthly axis so window sums line up with calendar months
+    months = pd.date_range(batch['dates'][0], batch['dates'][-1], freq='MS')
+    position = {date: i for i, date in enumerate(months.strftime('%Y-%m-%d'))}
+    columns = [position[date] for date in batch['dates']]
+    
+    precipitation = np.full((len(location_ids), len(months)), np.nan)
+    for row, location_id in enumerate(location_ids):
+        precipitation[row, columns] = [np.nan if v is None else v for v in batch['values'][location_id]]
+    
+    spi = DroughtIndicator.spi_batch(precipitation, months[0].month, request.timescales)
+    
+    def column(values):
+        return [None if np.isnan(v) else round(float(v), 2) for v in values]
+    
+    return JSONResponse(content={
+        'start': request.start,
+        'end': end,
+        'dates': list(months.strftime('%Y-%m-%d')),
+        'spi': {
+            str(timescale): {
+                location_id: column(values[row]) for row, location_id in enumerate(location_ids)
+            }
+            for timescale, values in spi.items()
+        }
+    })
+
+@app.post("/api/indices/return-levels")
+async def get_return_levels(request: ReturnLevelRequest):
+    """
+    Return levels for many locations from annual maxima in one batched fit
+    
+    Locations default to every administrative unit of the requested level.
+    
+    Returns:
+        {'periods', 'return_levels': {location_id: {'<T>_year': value}}, 'n_years': {...}}
+    """
+    end = request.end or datetime.now().strftime('%Y-%m-%d')
+    
+    if request.distribution not in DISTRIBUTIONS:
+        raise HTTPException(status_code=400, detail="Invalid distribution")
+    if request.method not in METHODS:
+        raise HTTPException(status_code=400, detail="Invalid method")
+    if any(period <= 1 for period in request.periods):
+        raise HTTPException(status_code=400, detail="Return periods must be greater than 1 year")
+    
+    location_ids = request.locations
+    if not location_ids:
+        boundaries = spatial_processor.get_boundaries(request.level)
+        location_ids = [feat['properties']['id'] for feat in boundaries['features']]
+    if not location_ids:
+        raise HTTPException(status_code=404, detail=f"No locations for level {request.level}")
+    
+    cache_key = (f'return_levels:{request.variable}:{request.start}:{end}:{request.distribution}:'
+                 f'{request.method}:{request.intervals}:{",".join(map(str, request.periods))}:{",".join(location_ids)}')
+    cached_result = cache.get(cache_key)
+    if cached_result:
+        return JSONResponse(content=cached_result)
+    
+    batch = get_batch_timeseries(location_ids, request.variable, request.start, end, 'daily')
+    values = np.array([
+        [np.nan if v is None else v for v in batch['values'][location_id]]
+        for location_id in location_ids
+    ], dtype=np.float64).reshape(len(location_ids), len(batch['dates']))
+    
+    # Fits (MLE in particular) and bootstrap intervals run in the task pool, off the event loop
+    levels = await run_task(
+        analytics_tasks.return_levels, location_ids, request.variable, values, batch['dates'],
+        request.periods, request.distribution, request.method, request.intervals
+    )
+    
+    result = {
+        'variable': request.variable,
+        'start': request.start,
+        'end': end,
+        'distribution': request.distribution,
+        'method': request.method,
+        'periods': request.periods,
+        **levels
+    }
+    
+    # Cache for 12 hours
+    cache.set(cache_key, result, ttl=43200)
+    
+    return JSONResponse(content=result)
+
 @app.get("/api/indices/extreme-events")
 async def get_extreme_events(
     location_id: str = "punjab",
@@ -664,87 +1094,48 @@ async def get_extreme_events(
     if cached_result:
         return JSONResponse(content=cached_result)
     
-    # Mock data for demonstration
-    import numpy as np
-    dates = pd.date_range(start_date, end_date, freq='D')
-    
-    if event_type == "temperature":
-        values = np.random.normal(28, 5, len(dates))
-        thresholds = Config.EXTREME_THRESHOLDS['temperature']
-    elif event_type == "precipitation":
-        values = np.random.gamma(2, 5, len(dates))
-        thresholds = Config.EXTREME_THRESHOLDS['precipitation']
-    elif event_type == "wind_speed":
-        values = np.random.gamma(3, 2, len(dates))
-        thresholds = Config.EXTREME_THRESHOLDS['wind_speed']
-    else:
+    if event_type not in ("temperature", "precipitation", "wind_speed"):
         raise HTTPException(status_code=400, detail="Invalid event_type")
     
-    extreme_calc = ExtremeEventAnalyzer()
-    
-    # Detect extreme events
-    if event_type == "temperature":
-        hot_days = extreme_calc.hot_days(values, thresholds['hot'])
-        very_hot_days = extreme_calc.hot_days(values, thresholds['very_hot'])
-        cold_days = extreme_calc.cold_days(values, thresholds['cold'])
-        
-        extreme_events = [
-            {"type": "hot_days", "count": hot_days, "threshold": thresholds['hot']},
-            {"type": "very_hot_days", "count": very_hot_days, "threshold": thresholds['very_hot']},
-            {"type": "cold_days", "count": cold_days, "threshold": thresholds['cold']}
-        ]
-    elif event_type == "precipitation":
-        heavy_rain = extreme_calc.heavy_precipitation_days(values, thresholds['heavy'])
-        very_heavy_rain = extreme_calc.heavy_precipitation_days(values, thresholds['very_heavy'])
-        extreme_rain = extreme_calc.heavy_precipitation_days(values, thresholds['extreme'])
-        
-        extreme_events = [
-            {"type": "heavy_rain_days", "count": heavy_rain, "threshold": thresholds['heavy']},
-            {"type": "very_heavy_rain_days", "count": very_heavy_rain, "threshold": thresholds['very_heavy']},
-            {"type": "extreme_rain_days", "count": extreme_rain, "threshold": thresholds['extreme']}
-        ]
-    else:  # wind_speed
-        strong_wind = extreme_calc.strong_wind_days(values, thresholds['strong'])
-        gale = extreme_calc.strong_wind_days(values, thresholds['gale'])
-        storm = extreme_calc.strong_wind_days(values, thresholds['storm'])
-        
-        extreme_events = [
-            {"type": "strong_wind_days", "count": strong_wind, "threshold": thresholds['strong']},
-            {"type": "gale_days", "count": gale, "threshold": thresholds['gale']},
-            {"type": "storm_days", "count": storm, "threshold": thresholds['storm']}
-        ]
-    
-    # Calculate return periods for extreme values
-    return_periods = extreme_calc.calculate_return_periods(values, [2, 5, 10, 20, 50, 100])
-    
-    result = {
-        "location": location_id,
-        "event_type": event_type,
-        "start_date": start_date,
-        "end_date": end_date,
-        "total_days": len(dates),
-        "extreme_events": extreme_events,
-        "return_periods": return_periods,
-        "statistics": {
-            "mean": round(float(np.mean(values)), 2),
-            "max": round(float(np.max(values)), 2),
-            "min": round(float(np.min(values)), 2),
-            "std": round(float(np.std(values)), 2),
-            "percentile_95": round(float(np.percentile(values, 95)), 2),
-            "percentile_99": round(float(np.percentile(values, 99)), 2)
-        }
-    }
+    result = await run_task(analytics_tasks.extreme_event_statistics, location_id, event_type, start_date, end_date)
     
     # Cache for 12 hours
     cache.set(cache_key, result, ttl=43200)
     
     return JSONResponse(content=result)
 
+@app.post("/api/cache/warm")
+async def warm_cache(request: CacheWarmRequest):
+    """Pre-populate timeseries caches for every unit at an admin level with one batch call per variable"""
+    end = request.end or datetime.now().strftime('%Y-%m-%d')
+    boundaries = spatial_processor.get_boundaries(request.level)
+    location_ids = [feat['properties']['id'] for feat in boundaries['features']]
+    
+    for variable in request.variables:
+        get_batch_timeseries(location_ids, variable, request.start, end, request.aggregation)
+    
+    return JSONResponse(content={
+        "success": True,
+        "level": request.level,
+        "locations": len(location_ids),
+        "variables": request.variables
+    })
+
 @app.get("/api/cache/stats")
 async def get_cache_statistics():
     """Get Redis cache statistics"""
     return JSONResponse(content=cache.get_stats())
 
+@app.get("/api/tasks/metrics")
+async def get_task_metrics():
+    """Analytics process pool queue depth, throughput and timings"""
+    return JSONResponse(content=task_pool.metrics())
+
+@app.get("/api/models/training")
+async def get_training_status():
+    """Background model training: pending jobs, recent results and pool metrics"""
+    return JSONResponse(content=training_scheduler.status())
+
 @app.post("/api/cache/clear")
 async def clear_cache(pattern: Optional[str] = None):
     """Clear cache (use with caution)"""
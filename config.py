@@ -33,6 +33,7 @@ class Config:
     REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
     REDIS_DB = int(os.environ.get('REDIS_DB', 0))
     CACHE_TIMEOUT = 3600  # 1 hour
+    CLIMATE_MISSING_TTL = 21600  # seconds a month the dataset did not have yet is remembered as missing
     CACHE_PREFIX = 'climate_portal:'
     
     # Google Earth Engine Configuration
@@ -44,13 +45,25 @@ class Config:
     ERA5_DAILY_DATASET = 'ECMWF/ERA5/DAILY'
     ERA5_HOURLY_DATASET = 'ECMWF/ERA5_LAND/HOURLY'
     
+    # Local ERA5 grid (ERA5-Land native 0.1°) used for zonal weights and gridded products
+    ERA5_GRID_RESOLUTION = 0.1
+    ZONAL_WEIGHTS_DIR = 'data/zonal_weights'
+    
     AGGREGATION_TYPES = {
-        'hourly': {'dataset': 'ECMWF/ERA5_LAND/HOURLY', 'scale': 11132},
-        'daily': {'dataset': 'ECMWF/ERA5/DAILY', 'scale': 27830},
-        'monthly': {'dataset': 'ECMWF/ERA5_LAND/MONTHLY_AGGR', 'scale': 11132},
-        'seasonal': {'dataset': 'ECMWF/ERA5_LAND/MONTHLY_AGGR', 'scale': 11132},
-        'annual': {'dataset': 'ECMWF/ERA5_LAND/MONTHLY_AGGR', 'scale': 11132}
+        'hourly': {'dataset': 'ECMWF/ERA5_LAND/HOURLY', 'scale': 11132, 'resolution': 0.1},
+        'daily': {'dataset': 'ECMWF/ERA5/DAILY', 'scale': 27830, 'resolution': 0.25},
+        'monthly': {'dataset': 'ECMWF/ERA5_LAND/MONTHLY_AGGR', 'scale': 11132, 'resolution': 0.1},
+        'seasonal': {'dataset': 'ECMWF/ERA5_LAND/MONTHLY_AGGR', 'scale': 11132, 'resolution': 0.1},
+        'annual': {'dataset': 'ECMWF/ERA5_LAND/MONTHLY_AGGR', 'scale': 11132, 'resolution': 0.1}
+    }
+    
+    # Long high-frequency ranges are fetched in windows of this many days so each
+    # request stays under Earth Engine's per-request element limits
+    GEE_CHUNK_DAYS = {
+        'hourly': 31,
+        'daily': 366
     }
+    GEE_MAX_CONCURRENT_REQUESTS = 4
     
     CLIMATE_VARIABLES = {
         'temperature': {
@@ -95,6 +108,15 @@ class Config:
         }
     }
     
+    # ERA5-Land monthly bands co-fetched for gridded heat-stress maps
+    HEAT_STRESS_BANDS = {
+        'temperature': 'temperature_2m',
+        'dewpoint': 'dewpoint_temperature_2m',
+        'u_wind': 'u_component_of_wind_10m',
+        'v_wind': 'v_component_of_wind_10m',
+        'solar_radiation': 'surface_solar_radiation_downwards_sum'
+    }
+    
     # Derived Climate Indices Configuration
     CLIMATE_INDICES = {
         'heat_index': {
@@ -135,6 +157,69 @@ class Config:
         }
     }
     
+    # Drought index distributions are fitted on this baseline and reused until
+    # they are older than DROUGHT_REFIT_DAYS or the baseline changes
+    DROUGHT_BASELINE = {'start': '1991-01-01', 'end': '2020-12-31'}
+    DROUGHT_REFIT_DAYS = 30
+    DROUGHT_PROVISIONAL_MONTHS = 3   # trailing months re-scored while their inputs are missing or the month is open
+    
+    # Calendar-day percentile climatology (moving window over a fixed baseline)
+    CLIMATOLOGY_DIR = 'data/climatology'
+    CLIMATOLOGY_BASELINE = {'start': '1991-01-01', 'end': '2020-12-31'}
+    CLIMATOLOGY_WINDOW_DAYS = 15
+    CLIMATOLOGY_PERCENTILES = {
+        'temperature': 90,
+        'precipitation': 95,
+        'wind_speed': 95
+    }
+    
+    # Bootstrap confidence intervals for return levels
+    BOOTSTRAP_SAMPLES = 1000
+    BOOTSTRAP_CONFIDENCE = 0.9
+    BOOTSTRAP_CHUNK_ELEMENTS = 20_000_000  # resampled values held in memory at once
+    
+    # Nightly index pipeline (python -m modules.index_pipeline)
+    INDEX_PIPELINE_LOOKBACK_DAYS = 730
+    INDEX_PIPELINE_TIMESCALES = (1, 3, 6, 12)
+    INDEX_PIPELINE_BATCH_SIZE = 5000  # rows per bulk insert
+    
+    # Process pool for CPU-heavy analytics (fits, PDSI, forecasts)
+    TASK_POOL_WORKERS = int(os.environ.get('TASK_POOL_WORKERS', 2))
+    TASK_POOL_MAX_QUEUE = 16     # tasks waiting beyond busy workers before returning 503
+    TASK_POOL_TIMEOUT = 60       # seconds
+    TASK_POOL_START_METHOD = 'spawn'
+    TASK_POOL_PRELOAD = ('numpy', 'scipy.stats', 'scipy.special', 'scipy.signal',
+                         'sklearn.ensemble', 'modules.analytics_tasks')
+    
+    # Forecast intervals: quantiles of the per-tree predictions
+    FORECAST_INTERVAL_QUANTILES = (0.05, 0.95)
+    
+    # Background forecast model training (versioned per location/variable)
+    MODEL_DIR = 'data/models'
+    MODEL_KEEP_VERSIONS = 3
+    MODEL_REGISTRY_SIZE = 64         # loaded model versions kept per worker process (LRU)
+    MODEL_MMAP_MODE = 'r'            # joblib memory-mapping shares model arrays between workers
+    MODEL_N_JOBS = 1                 # cores per training job
+    MODEL_TRAINING_START = '2000-01-01'
+    MODEL_TRAINING_VARIABLES = ('temperature', 'precipitation')
+    MODEL_TRAINING_LEVELS = (1, 2)   # administrative levels kept trained
+    MODEL_TRAINING_INTERVAL = 3600   # seconds between staleness scans
+    MODEL_TRAINING_POLL = 10         # seconds between spooled-request checks and leader elections
+    
+    # Incremental updates: new trees fitted on a recent window are appended as months arrive
+    MODEL_INCREMENTAL_TREES = 10
+    MODEL_INCREMENTAL_WINDOW = 120       # months of rows the new trees are fitted on
+    MODEL_MAX_TREES = 100                # oldest trees are dropped beyond this
+    MODEL_MAX_INCREMENTAL_UPDATES = 6    # consecutive updates before a full retrain
+    MODEL_FULL_RETRAIN_DAYS = 180
+    MODEL_DRIFT_RATIO = 1.5              # new-month RMSE over out-of-bag RMSE forcing a full retrain
+    MODEL_DRIFT_WINDOW = 12              # latest out-of-sample residuals the drift RMSE is taken over
+    MODEL_DRIFT_MIN_MONTHS = 6           # residuals needed before drift can force a retrain
+    MODEL_TRAINING_TIMEOUT = 600     # seconds
+    TRAINING_WORKERS = int(os.environ.get('TRAINING_WORKERS', 1))
+    TRAINING_MAX_QUEUE = 8
+    TRAINING_PRELOAD = ('numpy', 'sklearn.ensemble', 'modules.model_training')
+    
     # Extreme Event Thresholds (based on WMO standards)
     EXTREME_THRESHOLDS = {
         'temperature': {
@@ -0,0 +1,121 @@
+"""
+Local temporal aggregation of monthly climate series
+
+Seasonal (DJF/MAM/JJA/SON) and annual rollups are derived from monthly
+values with vectorized pandas grouping, so switching aggregation never
+needs a fresh Earth Engine computation for months that are already cached.
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+ROLLUP_AGGREGATIONS = ('seasonal', 'annual')
+
+
+def month_starts(start_date: str, end_date: str) -> List[str]:
+    """Month-start dates (YYYY-MM-01) falling in [start_date, end_date)"""
+    months = pd.date_range(start_date, end_date, freq='MS', inclusive='left')
+    return list(months.strftime('%Y-%m-%d'))
+
+
+def month_ranges(months: List[str]) -> List[Tuple[str, str]]:
+    """
+    Group month-start dates into contiguous [start, end) date ranges
+    
+    Args:
+        months: Sorted month-start dates (YYYY-MM-01)
+    
+    Returns:
+        List of (start_date, end_date) tuples, end exclusive
+    """
+    if not months:
+        return []
+    
+    index = pd.DatetimeIndex(months)
+    ordinal = index.year * 12 + index.month
+    breaks = np.flatnonzero(np.diff(ordinal) != 1) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks, [len(months)]]) - 1
+    
+    return [
+        (index[s].strftime('%Y-%m-%d'), (index[e] + pd.offsets.MonthBegin(1)).strftime('%Y-%m-%d'))
+        for s, e in zip(starts, ends)
+    ]
+
+
+def rollup_matrix(dates, values: np.ndarray, aggregation: str) -> Tuple[List[str], np.ndarray]:
+    """
+    Seasonal or annual means for many monthly series sharing one date axis
+    
+    Seasons follow the meteorological convention with a cross-year winter:
+    December counts towards the following year's DJF. Seasons are labelled
+    DJF -> YYYY-01-01, MAM -> YYYY-04-01, JJA -> YYYY-07-01 and
+    SON -> YYYY-10-01, years as YYYY-01-01. Missing (NaN) months are
+    skipped when averaging.
+    
+    Args:
+        dates: Month-start dates, sorted ascending
+        values: Array of shape (n_series, n_months)
+        aggregation: 'seasonal' or 'annual'
+    
+    Returns:
+        Tuple of (period labels, array of shape (n_series, n_periods))
+    """
+    dates = pd.DatetimeIndex(dates)
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    
+    year = dates.year.to_numpy()
+    month = dates.month.to_numpy()
+    
+    if aggregation == 'seasonal':
+        # Dec, Jan, Feb -> 0; Mar-May -> 1; Jun-Aug -> 2; Sep-Nov -> 3
+        period = (month % 12) // 3
+        group_year = year + (month == 12)
+        # A December at the end of the range must not open a season of its own
+        keep = np.isin(group_year, year)
+    else:
+        period = np.zeros(len(year), dtype=np.int64)
+        group_year = year
+        keep = np.ones(len(year), dtype=bool)
+    
+    keys, inverse = np.unique((group_year * 4 + period)[keep], return_inverse=True)
+    membership = np.zeros((int(keep.sum()), len(keys)))
+    membership[np.arange(len(inverse)), inverse] = 1.0
+    
+    kept = values[:, keep]
+    valid = ~np.isnan(kept)
+    sums = np.where(valid, kept, 0.0) @ membership
+    counts = valid.astype(np.float64) @ membership
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    
+    labels = [f'{key // 4:04d}-{3 * (key % 4) + 1:02d}-01' for key in keys]
+    return labels, means
+
+
+def aggregate_monthly(data: List[Dict], aggregation: str, decimals: Optional[int] = 2) -> List[Dict]:
+    """
+    Roll a monthly series up to seasonal or annual means (see rollup_matrix)
+    
+    Args:
+        data: Monthly series as [{'date': 'YYYY-MM-DD', 'value': float}]
+        aggregation: 'seasonal' or 'annual' (anything else is returned as-is)
+        decimals: Rounding applied to the aggregated values
+    
+    Returns:
+        Aggregated series in the same [{'date', 'value'}] layout
+    """
+    if aggregation not in ROLLUP_AGGREGATIONS or not data:
+        return data
+    
+    values = np.array([np.nan if d['value'] is None else d['value'] for d in data], dtype=np.float64)
+    labels, means = rollup_matrix([d['date'] for d in data], values, aggregation)
+    
+    if decimals is not None:
+        means = np.round(means, decimals)
+    
+    return [
+        {'date': label, 'value': None if np.isnan(value) else float(value)}
+        for label, value in zip(labels, means[0])
+    ]
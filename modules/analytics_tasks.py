@@ -0,0 +1,270 @@
+"""
+CPU-heavy analytics run in the task pool's worker processes
+
+Every function here is module-level and takes and returns plain picklable
+values, so endpoints can hand it to TaskPool.run. Worker-level state (the
+forecaster, drought fits) lives in module singletons and
+is created once per worker process.
+"""
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Tuple
+from config import Config
+from modules.cache import cache
+from modules.mock_data import mock_engine
+from modules.climate_indices import DroughtIndicator, ExtremeEventAnalyzer
+from modules.climatology import lookup_thresholds
+from modules.extreme_value import block_maxima, cached_intervals, return_level_table
+from modules.index_pipeline import drought_fits, drought_inputs, event_name, stored_events
+from modules.ml_models import ClimateForecaster, forecast_records
+from modules.forecast_features import epoch_months, month_dates
+from modules.zonal_weights import build_zonal_weights
+
+forecaster = ClimateForecaster()
+
+
+def drought_index(location_id: str, index_type: str, timescale: int,
+                  start_date: str, end_date: str) -> Tuple[List[str], np.ndarray]:
+    """
+    SPI, SPEI or PDSI series for one location
+    
+    Args:
+        location_id: Location identifier
+        index_type: spi, spei or palmer_drought
+        timescale: Accumulation period in months (SPI/SPEI)
+        start_date: Start date (YYYY-MM-DD)
+        end_date: End date (YYYY-MM-DD)
+    
+    Returns:
+        Tuple of (month labels, index values) within the range
+    """
+    if index_type == "palmer_drought":
+        month_labels, precipitation = mock_engine.generate([location_id], 'precipitation', start_date, end_date)
+        temperature = mock_engine.generate([location_id], 'temperature', start_date, end_date)[1][0]
+        return month_labels, DroughtIndicator.palmer_drought_severity_index(temperature, precipitation[0])
+    
+    # Scored against stored per-calendar-month fits; only new months are computed
+    month_labels, values = drought_fits.series(
+        location_id, index_type, timescale, start_date, end_date,
+        drought_inputs(location_id, index_type)
+    )
+    dates = pd.DatetimeIndex(month_labels)
+    in_range = (dates >= pd.Timestamp(start_date).to_period('M').to_timestamp()) & \
+               (dates <= pd.Timestamp(end_date))
+    return [label for label, keep in zip(month_labels, in_range) if keep], values[in_range]
+
+
+def extreme_event_statistics(location_id: str, event_type: str, start_date: str, end_date: str) -> Dict:
+    """
+    Extreme event statistics for one location (see /api/indices/extreme-events)
+    
+    Returns:
+        JSON-ready result with threshold counts, percentile exceedances,
+        return periods with bootstrap intervals and summary statistics
+    """
+    dates = pd.date_range(start_date, end_date, freq='D')
+    values = mock_engine.generate([location_id], event_type, start_date, end_date, 'daily')[1][0]
+    thresholds = Config.EXTREME_THRESHOLDS[event_type]
+    
+    extreme_calc = ExtremeEventAnalyzer()
+    
+    # Detect extreme events
+    if event_type == "temperature":
+        hot_days = extreme_calc.hot_days(values, thresholds['hot'])
+        very_hot_days = extreme_calc.hot_days(values, thresholds['very_hot'])
+        cold_days = extreme_calc.cold_days(values, thresholds['cold'])
+        
+        extreme_events = [
+            {"type": "hot_days", "count": hot_days, "threshold": thresholds['hot']},
+            {"type": "very_hot_days", "count": very_hot_days, "threshold": thresholds['very_hot']},
+            {"type": "cold_days", "count": cold_days, "threshold": thresholds['cold']}
+        ]
+    elif event_type == "precipitation":
+        heavy_rain = extreme_calc.heavy_precipitation_days(values, thresholds['heavy'])
+        very_heavy_rain = extreme_calc.heavy_precipitation_days(values, thresholds['very_heavy'])
+        extreme_rain = extreme_calc.heavy_precipitation_days(values, thresholds['extreme'])
+        
+        extreme_events = [
+            {"type": "heavy_rain_days", "count": heavy_rain, "threshold": thresholds['heavy']},
+            {"type": "very_heavy_rain_days", "count": very_heavy_rain, "threshold": thresholds['very_heavy']},
+            {"type": "extreme_rain_days", "count": extreme_rain, "threshold": thresholds['extreme']}
+        ]
+    else:  # wind_speed
+        strong_wind = extreme_calc.strong_wind_days(values, thresholds['strong'])
+        gale = extreme_calc.strong_wind_days(values, thresholds['gale'])
+        storm = extreme_calc.strong_wind_days(values, thresholds['storm'])
+        
+        extreme_events = [
+            {"type": "strong_wind_days", "count": strong_wind, "threshold": thresholds['strong']},
+            {"type": "gale_days", "count": gale, "threshold": thresholds['gale']},
+            {"type": "storm_days", "count": storm, "threshold": thresholds['storm']}
+        ]
+    
+    # Exceedances of the calendar-day baseline percentile (precomputed climatology)
+    percentile = Config.CLIMATOLOGY_PERCENTILES[event_type]
+    
+    def load_daily(location_ids, start, end):
+        return mock_engine.generate(location_ids, event_type, start, end, 'daily')
+    
+    day_thresholds = lookup_thresholds([location_id], event_type, percentile, dates, load_daily)[0]
+    date_labels = list(dates.strftime('%Y-%m-%d'))
+    
+    # Stored by the nightly index pipeline; detected here on a miss
+    percentile_events = stored_events(location_id, event_name(event_type), start_date, end_date)
+    if percentile_events is not None:
+        for event in percentile_events:
+            in_event = (dates >= event['start_date']) & (dates <= event['end_date'])
+            event['mean_value'] = float(np.mean(values[in_event]))
+    else:
+        if event_type == "temperature":
+            percentile_events = extreme_calc.identify_heatwave(values, date_labels, thresholds=day_thresholds)
+        else:
+            events = extreme_calc.detect_events(values, day_thresholds[None, :], 'above')
+            percentile_events = extreme_calc.events_to_records(events, date_labels, event_name(event_type))
+    
+    # Calculate return periods for extreme values
+    return_periods = extreme_calc.calculate_return_periods(values, [2, 5, 10, 20, 50, 100], dates)
+    
+    # Bootstrap bands, cached per location, variable and the years the maxima cover
+    block_labels, maxima = block_maxima(values, dates)
+    covered = [label for label, value in zip(block_labels, maxima[0]) if not np.isnan(value)]
+    baseline = f'{covered[0]}-{covered[-1]}' if covered else 'none'
+    return_period_intervals = cached_intervals(
+        cache, [location_id], event_type, baseline, maxima, [2, 5, 10, 20, 50, 100]
+    )[location_id]
+    
+    # The series is in memory for the counts above, so exact percentiles cost one partition
+    percentile_95, percentile_99 = np.percentile(values, [95, 99])
+    
+    result = {
+        "location": location_id,
+        "event_type": event_type,
+        "start_date": start_date,
+        "end_date": end_date,
+        "total_days": len(dates),
+        "extreme_events": extreme_events,
+        "percentile_exceedances": {
+            "percentile": percentile,
+            "baseline": Config.CLIMATOLOGY_BASELINE,
+            "window_days": Config.CLIMATOLOGY_WINDOW_DAYS,
+            "days": int(np.sum(values > day_thresholds)),
+            "events": percentile_events
+        },
+        "return_periods": return_periods,
+        "return_period_intervals": {
+            "confidence": Config.BOOTSTRAP_CONFIDENCE,
+            "baseline_years": baseline,
+            "intervals": return_period_intervals
+        },
+        "statistics": {
+            "mean": round(float(np.mean(values)), 2),
+            "max": round(float(np.max(values)), 2),
+            "min": round(float(np.min(values)), 2),
+            "std": round(float(np.std(values)), 2),
+            "percentile_95": round(float(percentile_95), 2),
+            "percentile_99": round(float(percentile_99), 2)
+        }
+    }
+    
+    return result
+
+
+def return_levels(location_ids: List[str], variable: str, values: np.ndarray, dates: List[str],
+                  periods: List[int], distribution: str, method: str, intervals: bool) -> Dict:
+    """
+    Return levels (and optionally bootstrap intervals) for many locations
+    
+    Args:
+        location_ids: Row labels of values
+        variable: Climate variable name
+        values: Daily values of shape (locations, days)
+        dates: Dates of the columns
+        periods: Return periods in years
+        distribution: 'gumbel' or 'gev'
+        method: 'lmoments' or 'mle'
+        intervals: Add bootstrap confidence intervals
+    
+    Returns:
+        {'return_levels', 'n_years'} keyed by location, plus 'confidence'
+        and 'intervals' when requested
+    """
+    table = return_level_table(values, dates, periods, distribution, method)
+    
+    result = {
+        'return_levels': {
+            location_id: {
+                f'{period}_year': None if np.isnan(level) else round(float(level), 2)
+                for period, level in zip(periods, levels)
+            }
+            for location_id, levels in zip(location_ids, table['return_levels'])
+        },
+        'n_years': {
+            location_id: int(np.sum(~np.isnan(maxima)))
+            for location_id, maxima in zip(location_ids, table['maxima'])
+        }
+    }
+    
+    if intervals:
+        covered = [label for label, column in zip(table['blocks'], table['maxima'].T) if not np.isnan(column).all()]
+        baseline = f'{covered[0]}-{covered[-1]}' if covered else 'none'
+        result['confidence'] = Config.BOOTSTRAP_CONFIDENCE
+        result['intervals'] = cached_intervals(
+            cache, location_ids, variable, baseline, table['maxima'], periods, distribution
+        )
+    
+    return result
+
+
+def zonal_weights_level(level: int) -> bool:
+    """
+    Build and store the zonal weights of one administrative level
+    
+    Returns:
+        True when the level has boundaries and its weights were saved; the
+        caller loads them from disk with get_zonal_weights
+    """
+    return level in build_zonal_weights(levels=[level])
+
+
+def forecast(location_id: str, variable: str, months_ahead: int = 3) -> Tuple[List[Dict], Dict]:
+    """
+    Forecast from the published model of a location, or climatology without one
+    
+    Returns:
+        Tuple of (forecast records, model info)
+    """
+    historical_data = mock_engine.timeseries(
+        location_id, variable, '2023-01-01', datetime.now().strftime('%Y-%m-%d'), 'monthly'
+    )
+    forecast_data = forecaster.predict_future(variable, historical_data, months_ahead=months_ahead,
+                                              location_id=location_id)
+    return forecast_data, forecaster.get_model_info(variable, location_id)
+
+
+def forecast_batch(location_ids: List[str], variable: str, months_ahead: int = 3) -> Dict:
+    """
+    Forecasts for many locations in one batched pass per model
+    
+    Returns:
+        {'dates', 'forecast': {location_id: records}, 'model_info', 'untrained': [location_id]}
+    """
+    labels, values = mock_engine.generate(
+        location_ids, variable, '2023-01-01', datetime.now().strftime('%Y-%m-%d'), 'monthly'
+    )
+    result = forecaster.predict_batch(variable, location_ids, epoch_months(labels), values, months_ahead)
+    
+    versions = dict(zip(location_ids, result['versions']))
+    
+    return {
+        'dates': month_dates(result['months']),
+        'forecast': {
+            location_id: forecast_records(result, row) for row, location_id in enumerate(location_ids)
+        },
+        'model_info': {
+            'model_type': 'Random Forest Regressor per location, climatological mean without one',
+            'trained_locations': int(result['trained'].sum()),
+            'versions': versions
+        },
+        'untrained': [location_id for location_id, version in versions.items() if version is None]
+    }
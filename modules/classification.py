@@ -0,0 +1,102 @@
+"""
+Vectorized classification of index values into severity classes
+
+Each scheme is a set of sorted bin edges and one label per bin. Values are
+mapped to compact integer codes with a single searchsorted call, so whole
+series and gridded fields are classified at once; labels are looked up
+from the code table only when a response needs them.
+"""
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+# Code for missing (NaN) values
+MISSING_CODE = -1
+
+
+class BinClassifier:
+    """Sorted bin edges with one label per bin; bin i covers [edges[i-1], edges[i])"""
+    
+    def __init__(self, edges: Sequence[float], labels: Sequence[str]):
+        edges = np.asarray(edges, dtype=np.float64)
+        if np.any(np.diff(edges) <= 0):
+            raise ValueError("Bin edges must be strictly increasing")
+        if len(labels) != len(edges) + 1:
+            raise ValueError("Need exactly one label per bin (len(edges) + 1)")
+        
+        self.edges = edges
+        self.labels = list(labels)
+        self._label_array = np.array(self.labels + [None], dtype=object)
+    
+    def codes(self, values) -> np.ndarray:
+        """
+        Class codes for an array of values
+        
+        Args:
+            values: Index values (array-like, any shape)
+        
+        Returns:
+            int8 codes indexing self.labels, MISSING_CODE where the value is NaN
+        """
+        values = np.asarray(values, dtype=np.float64)
+        codes = np.searchsorted(self.edges, values, side='right')
+        return np.where(np.isnan(values), MISSING_CODE, codes).astype(np.int8)
+    
+    def decode(self, codes) -> np.ndarray:
+        """Labels for an array of codes (None for missing)"""
+        return self._label_array[np.asarray(codes)]
+    
+    def label(self, value: float) -> Optional[str]:
+        """Label of a single value (None when missing)"""
+        return self._label_array[self.codes(value).item()]
+    
+    def counts(self, codes) -> np.ndarray:
+        """Number of non-missing values per class"""
+        codes = np.asarray(codes).ravel()
+        return np.bincount(codes[codes >= 0], minlength=len(self.labels))
+    
+    def table(self) -> List[Dict]:
+        """Code table: code, label and the [lower, upper) bounds of each class"""
+        bounds = np.concatenate([[-np.inf], self.edges, [np.inf]])
+        return [
+            {
+                'code': code,
+                'label': label,
+                'lower': None if np.isinf(bounds[code]) else float(bounds[code]),
+                'upper': None if np.isinf(bounds[code + 1]) else float(bounds[code + 1])
+            }
+            for code, label in enumerate(self.labels)
+        ]
+
+
+# Standardized drought indices (SPI, SPEI) and PDSI
+DROUGHT = BinClassifier(
+    [-2.0, -1.5, -1.0, 1.0, 1.5, 2.0],
+    ['extreme_drought', 'severe_drought', 'moderate_drought', 'normal',
+     'moderately_wet', 'very_wet', 'extremely_wet']
+)
+
+DROUGHT_SEVERITY = {
+    'extreme_drought': 'extreme',
+    'severe_drought': 'severe',
+    'moderate_drought': 'moderate'
+}
+
+# Heat stress indices (NOAA heat index, WBGT, humidex)
+HEAT_STRESS = {
+    'heat_index': BinClassifier(
+        [27, 32, 41, 54], ['normal', 'caution', 'extreme_caution', 'danger', 'extreme_danger']
+    ),
+    'wbgt': BinClassifier([28, 32], ['moderate', 'high', 'extreme']),
+    'humidex': BinClassifier([30, 40], ['comfortable', 'some_discomfort', 'great_discomfort'])
+}
+
+HEAT_INDEX_CAUTIONS = {
+    'normal': 'No heat stress',
+    'caution': 'Fatigue possible with prolonged exposure',
+    'extreme_caution': 'Heat cramps and heat exhaustion possible',
+    'danger': 'Heat exhaustion likely, heat stroke possible',
+    'extreme_danger': 'Heat stroke highly likely'
+}
+
+# Extreme events by the return period of their peak, in years
+EVENT_SEVERITY = BinClassifier([2, 10], ['moderate', 'severe', 'extreme'])
@@ -2,16 +2,22 @@
 Climate indices calculator for heat stress, drought, and extreme events
 Based on internationally standardized definitions (WMO, NOAA, etc.)
 """
+import warnings
 import numpy as np
 import pandas as pd
-from scipy import stats
+from scipy import signal, stats, special
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
+from modules.classification import DROUGHT, DROUGHT_SEVERITY, HEAT_STRESS, HEAT_INDEX_CAUTIONS
 
 
 class HeatStressCalculator:
     """Calculate heat stress indices"""
     
+    # Magnus coefficients for saturation vapour pressure over water
+    MAGNUS_A = 17.625
+    MAGNUS_B = 243.04
+    
     @staticmethod
     def heat_index(temperature_c: float, relative_humidity: float) -> float:
         """
@@ -102,27 +108,371 @@ class HeatStressCalculator:
         
         return humidex
     
+    @staticmethod
+    def _prepare_arrays(*arrays, out: Optional[np.ndarray] = None, dtype=None):
+        """Broadcast inputs to a common floating dtype and allocate (or validate) the output buffer"""
+        if dtype is None:
+            dtype = np.result_type(*[np.asarray(a) for a in arrays], np.float32)
+            if out is not None:
+                dtype = out.dtype
+        
+        arrays = np.broadcast_arrays(*[np.asarray(a, dtype=dtype) for a in arrays])
+        
+        if out is None:
+            out = np.empty(arrays[0].shape, dtype=dtype)
+        elif out.shape != arrays[0].shape:
+            raise ValueError(f"out has shape {out.shape}, expected {arrays[0].shape}")
+        
+        return arrays, out
+    
+    @staticmethod
+    def heat_index_array(temperature_c, relative_humidity,
+                         out: Optional[np.ndarray] = None, dtype=None) -> np.ndarray:
+        """
+        Vectorized Heat Index over arrays of any shape
+        
+        Same NOAA equation as heat_index, with the simple formula, Rothfusz
+        regression and both humidity adjustments evaluated branch-free via
+        masks. float32 inputs are computed in float32.
+        
+        Args:
+            temperature_c: Air temperature in Celsius (array-like)
+            relative_humidity: Relative humidity in percent (array-like, broadcastable)
+            out: Optional output buffer to write into
+            dtype: Computation dtype (defaults to the inputs' floating type)
+        
+        Returns:
+            Heat index in Celsius (out, if given)
+        """
+        (T, RH), out = HeatStressCalculator._prepare_arrays(
+            temperature_c, relative_humidity, out=out, dtype=dtype
+        )
+        T = T * 9/5 + 32
+        
+        simple = 0.5 * (T + 61.0 + ((T - 68.0) * 1.2) + (RH * 0.094))
+        
+        TRH = T * RH
+        HI = (-42.379 + 2.04901523 * T + 10.14333127 * RH
+              - 0.22475541 * TRH - 0.00683783 * T * T
+              - 0.05481717 * RH * RH + 0.00122874 * TRH * T
+              + 0.00085282 * TRH * RH - 0.00000199 * TRH * TRH)
+        
+        # Adjustments (the sqrt argument is clamped so masked-out lanes stay finite)
+        dry = (RH < 13) & (T >= 80) & (T <= 112)
+        humid = (RH > 85) & (T >= 80) & (T <= 87)
+        HI -= dry * ((13 - RH) / 4) * np.sqrt(np.maximum(17 - np.abs(T - 95), 0) / 17)
+        HI += humid * ((RH - 85) / 10) * ((87 - T) / 5)
+        
+        np.subtract(np.where(T < 80, simple, HI), 32, out=out)
+        out *= 5/9
+        return out
+    
+    @staticmethod
+    def wet_bulb_globe_temperature_array(temperature_c, relative_humidity,
+                                         wind_speed_ms=1.0, solar_radiation_wm2=600,
+                                         out: Optional[np.ndarray] = None, dtype=None) -> np.ndarray:
+        """
+        Vectorized WBGT over arrays of any shape (same model as wet_bulb_globe_temperature)
+        
+        Args:
+            temperature_c: Air temperature in Celsius (array-like)
+            relative_humidity: Relative humidity in percent
+            wind_speed_ms: Wind speed in m/s (unused by the simplified model)
+            solar_radiation_wm2: Solar radiation in W/m²
+            out: Optional output buffer to write into
+            dtype: Computation dtype (defaults to the inputs' floating type)
+        
+        Returns:
+            WBGT in Celsius (out, if given)
+        """
+        (T, RH, SR), out = HeatStressCalculator._prepare_arrays(
+            temperature_c, relative_humidity, solar_radiation_wm2, out=out, dtype=dtype
+        )
+        
+        wet_bulb = T * np.arctan(0.151977 * (RH + 8.313659)**0.5) + \
+                   np.arctan(T + RH) - \
+                   np.arctan(RH - 1.676331) + \
+                   0.00391838 * RH**1.5 * np.arctan(0.023101 * RH) - 4.686035
+        
+        globe = T + 0.00184 * SR
+        
+        np.multiply(wet_bulb, 0.7, out=out)
+        out += 0.2 * globe
+        out += 0.1 * T
+        return out
+    
+    @staticmethod
+    def humidex_array(temperature_c, dewpoint_c,
+                      out: Optional[np.ndarray] = None, dtype=None) -> np.ndarray:
+        """
+        Vectorized Humidex over arrays of any shape (same formula as humidex)
+        
+        Args:
+            temperature_c: Air temperature in Celsius (array-like)
+            dewpoint_c: Dewpoint temperature in Celsius
+            out: Optional output buffer to write into
+            dtype: Computation dtype (defaults to the inputs' floating type)
+        
+        Returns:
+            Humidex value (out, if given)
+        """
+        (T, Td), out = HeatStressCalculator._prepare_arrays(
+            temperature_c, dewpoint_c, out=out, dtype=dtype
+        )
+        
+        e = 6.11 * np.exp(5417.7530 * ((1/273.16) - (1/(Td + 273.15))))
+        
+        np.subtract(e, 10.0, out=out)
+        out *= 0.5555
+        out += T
+        return out
+    
+    @staticmethod
+    def relative_humidity_array(temperature_c, dewpoint_c) -> np.ndarray:
+        """Relative humidity in percent from air and dewpoint temperature (Magnus formula)"""
+        a, b = HeatStressCalculator.MAGNUS_A, HeatStressCalculator.MAGNUS_B
+        T = np.asarray(temperature_c, dtype=np.float64)
+        Td = np.asarray(dewpoint_c, dtype=np.float64)
+        return np.clip(100 * np.exp(a * Td / (b + Td) - a * T / (b + T)), 0, 100)
+    
+    @staticmethod
+    def dewpoint_array(temperature_c, relative_humidity) -> np.ndarray:
+        """Dewpoint in Celsius from air temperature and relative humidity (inverse Magnus formula)"""
+        a, b = HeatStressCalculator.MAGNUS_A, HeatStressCalculator.MAGNUS_B
+        T = np.asarray(temperature_c, dtype=np.float64)
+        gamma = np.log(np.clip(relative_humidity, 1e-3, 100) / 100) + a * T / (b + T)
+        return b * gamma / (a - gamma)
+    
+    @staticmethod
+    def heat_stress_array(index_type: str, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Compute a heat stress index over whole fields
+        
+        Args:
+            index_type: heat_index, wbgt or humidex
+            inputs: Arrays keyed temperature, dewpoint, relative_humidity,
+                    wind_speed and solar_radiation (see fetch_heat_stress_inputs)
+        
+        Returns:
+            Index values with the shape of the inputs
+        """
+        if index_type == 'heat_index':
+            return HeatStressCalculator.heat_index_array(inputs['temperature'], inputs['relative_humidity'])
+        if index_type == 'wbgt':
+            return HeatStressCalculator.wet_bulb_globe_temperature_array(
+                inputs['temperature'], inputs['relative_humidity'],
+                inputs['wind_speed'], inputs['solar_radiation']
+            )
+        if index_type == 'humidex':
+            return HeatStressCalculator.humidex_array(inputs['temperature'], inputs['dewpoint'])
+        raise ValueError(f"Unknown heat stress index: {index_type}")
+    
     @staticmethod
     def classify_heat_stress(heat_index_c: float) -> Dict[str, str]:
         """
         Classify heat stress level based on heat index
         Based on NOAA guidelines
         """
-        if heat_index_c < 27:
-            return {'level': 'normal', 'caution': 'No heat stress'}
-        elif 27 <= heat_index_c < 32:
-            return {'level': 'caution', 'caution': 'Fatigue possible with prolonged exposure'}
-        elif 32 <= heat_index_c < 41:
-            return {'level': 'extreme_caution', 'caution': 'Heat cramps and heat exhaustion possible'}
-        elif 41 <= heat_index_c < 54:
-            return {'level': 'danger', 'caution': 'Heat exhaustion likely, heat stroke possible'}
-        else:
-            return {'level': 'extreme_danger', 'caution': 'Heat stroke highly likely'}
+        level = HEAT_STRESS['heat_index'].label(heat_index_c)
+        return {'level': level, 'caution': HEAT_INDEX_CAUTIONS.get(level)}
 
 
 class DroughtIndicator:
     """Calculate drought indicators"""
     
+    # Accumulation periods of the standard SPI family, in months
+    SPI_TIMESCALES = (1, 3, 6, 12, 24)
+    
+    # Minimum non-zero samples needed to fit one calendar month's distribution
+    MIN_FIT_SAMPLES = 3
+    
+    @staticmethod
+    def accumulate_windows(values: np.ndarray, timescales=SPI_TIMESCALES) -> Dict[int, np.ndarray]:
+        """
+        Trailing window sums for several timescales from one cumulative sum
+        
+        Args:
+            values: Monthly values of shape (locations, months); NaN marks a
+                    missing month and invalidates every window containing it
+            timescales: Window lengths in months
+        
+        Returns:
+            Dictionary mapping timescale to sums of shape (locations, months),
+            NaN for the first timescale - 1 months
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        missing = np.isnan(values)
+        
+        zeros = np.zeros((values.shape[0], 1))
+        totals = np.concatenate([zeros, np.cumsum(np.where(missing, 0.0, values), axis=1)], axis=1)
+        gaps = np.concatenate([zeros, np.cumsum(missing, axis=1)], axis=1)
+        
+        windows = {}
+        for timescale in timescales:
+            sums = np.full(values.shape, np.nan)
+            if timescale <= values.shape[1]:
+                window = totals[:, timescale:] - totals[:, :-timescale]
+                complete = gaps[:, timescale:] == gaps[:, :-timescale]
+                sums[:, timescale - 1:] = np.where(complete, window, np.nan)
+            windows[timescale] = sums
+        
+        return windows
+    
+    @staticmethod
+    def _by_calendar_month(values: np.ndarray, first_month: int) -> np.ndarray:
+        """Pad (locations, months) with NaN to whole years and reshape to (locations, years, 12)"""
+        lead = first_month - 1
+        n_years = -(-(lead + values.shape[1]) // 12)
+        padded = np.full((values.shape[0], n_years * 12), np.nan)
+        padded[:, lead:lead + values.shape[1]] = values
+        return padded.reshape(values.shape[0], n_years, 12)
+    
+    @staticmethod
+    def fit_gamma(samples: np.ndarray, axis: int = -1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Vectorized gamma fit with a point mass at zero (Thom's approximate MLE)
+        
+        Args:
+            samples: Non-negative values; NaN entries are ignored
+            axis: Axis holding the samples of each fit
+        
+        Returns:
+            Tuple of (shape alpha, scale beta, zero probability q), NaN where
+            fewer than MIN_FIT_SAMPLES positive values are available
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        valid = ~np.isnan(samples)
+        positive = valid & (samples > 0)
+        
+        n_valid = valid.sum(axis=axis)
+        n_positive = positive.sum(axis=axis)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(positive, samples, 0.0).sum(axis=axis) / n_positive
+            mean_log = np.where(positive, np.log(np.where(positive, samples, 1.0)), 0.0).sum(axis=axis) / n_positive
+            
+            A = np.log(mean) - mean_log
+            alpha = (1 + np.sqrt(1 + 4 * A / 3)) / (4 * A)
+            beta = mean / alpha
+            q = (n_valid - n_positive) / n_valid
+        
+        fitted = (n_positive >= DroughtIndicator.MIN_FIT_SAMPLES) & (A > 0)
+        return (np.where(fitted, alpha, np.nan),
+                np.where(fitted, beta, np.nan),
+                np.where(fitted, q, np.nan))
+    
+    @staticmethod
+    def gamma_spi(values: np.ndarray, alpha, beta, q) -> np.ndarray:
+        """
+        Score accumulated precipitation against fitted mixed-gamma parameters
+        
+        Args:
+            values: Accumulated precipitation (broadcastable with the parameters)
+            alpha: Gamma shape
+            beta: Gamma scale
+            q: Probability of zero accumulation
+        
+        Returns:
+            SPI values clipped to [-3, 3], NaN where values or fits are missing
+        """
+        values = np.asarray(values, dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cdf = q + (1 - q) * special.gammainc(alpha, np.maximum(values, 0) / beta)
+            spi = np.clip(special.ndtri(cdf), -3, 3)
+        return np.where(np.isnan(values), np.nan, spi)
+    
+    @staticmethod
+    def spi_batch(precipitation: np.ndarray, first_month: int = 1,
+                  timescales=SPI_TIMESCALES) -> Dict[int, np.ndarray]:
+        """
+        SPI at several timescales for many locations at once
+        
+        Window sums for every timescale come from one cumulative sum, and a
+        mixed gamma distribution is fitted separately for each location,
+        timescale and calendar month, so seasonality does not leak into the
+        index.
+        
+        Args:
+            precipitation: Monthly totals of shape (locations, months)
+            first_month: Calendar month (1-12) of the first column
+            timescales: Accumulation periods in months
+        
+        Returns:
+            Dictionary mapping timescale to SPI of shape (locations, months)
+        """
+        precipitation = np.atleast_2d(np.asarray(precipitation, dtype=np.float64))
+        n_months = precipitation.shape[1]
+        
+        result = {}
+        for timescale, accumulated in DroughtIndicator.accumulate_windows(precipitation, timescales).items():
+            by_month = DroughtIndicator._by_calendar_month(accumulated, first_month)
+            alpha, beta, q = DroughtIndicator.fit_gamma(by_month, axis=1)
+            
+            spi = DroughtIndicator.gamma_spi(by_month, alpha[:, None, :], beta[:, None, :], q[:, None, :])
+            lead = first_month - 1
+            result[timescale] = spi.reshape(spi.shape[0], -1)[:, lead:lead + n_months]
+        
+        return result
+    
+    @staticmethod
+    def fit_normal(samples: np.ndarray, axis: int = -1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized mean/standard deviation fit used to standardize SPEI
+        
+        Args:
+            samples: Values to fit; NaN entries are ignored
+            axis: Axis holding the samples of each fit
+        
+        Returns:
+            Tuple of (mean, std), NaN where fewer than MIN_FIT_SAMPLES values
+            are available or the spread is zero
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        n_valid = (~np.isnan(samples)).sum(axis=axis)
+        
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean = np.nanmean(samples, axis=axis)
+            std = np.nanstd(samples, axis=axis)
+        
+        fitted = (n_valid >= DroughtIndicator.MIN_FIT_SAMPLES) & (std > 0)
+        return np.where(fitted, mean, np.nan), np.where(fitted, std, np.nan)
+    
+    @staticmethod
+    def normal_spei(values: np.ndarray, mean, std) -> np.ndarray:
+        """Score accumulated water balance against fitted mean/std, clipped to [-3, 3]"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.clip((np.asarray(values, dtype=np.float64) - mean) / std, -3, 3)
+    
+    @staticmethod
+    def spei_batch(precipitation: np.ndarray, evapotranspiration: np.ndarray,
+                   first_month: int = 1, timescales=SPI_TIMESCALES) -> Dict[int, np.ndarray]:
+        """
+        SPEI at several timescales for many locations at once (see spi_batch)
+        
+        Args:
+            precipitation: Monthly totals of shape (locations, months)
+            evapotranspiration: Potential evapotranspiration, same shape
+            first_month: Calendar month (1-12) of the first column
+            timescales: Accumulation periods in months
+        
+        Returns:
+            Dictionary mapping timescale to SPEI of shape (locations, months)
+        """
+        water_balance = np.atleast_2d(np.asarray(precipitation, dtype=np.float64) - evapotranspiration)
+        n_months = water_balance.shape[1]
+        lead = first_month - 1
+        
+        result = {}
+        for timescale, accumulated in DroughtIndicator.accumulate_windows(water_balance, timescales).items():
+            by_month = DroughtIndicator._by_calendar_month(accumulated, first_month)
+            mean, std = DroughtIndicator.fit_normal(by_month, axis=1)
+            
+            spei = DroughtIndicator.normal_spei(by_month, mean[:, None, :], std[:, None, :])
+            result[timescale] = spei.reshape(spei.shape[0], -1)[:, lead:lead + n_months]
+        
+        return result
+    
     @staticmethod
     def standardized_precipitation_index(precipitation: np.ndarray, 
                                         timescale: int = 3) -> np.ndarray:
@@ -220,68 +570,50 @@ class DroughtIndicator:
         Calculate Palmer Drought Severity Index (PDSI)
         Simplified version
         
+        PET is computed once per location, and both recursive smoothing
+        passes are first-order IIR filters run along the time axis, so a
+        whole (locations x months) array is evaluated in linear time.
+        
         Args:
-            temperature: Monthly temperature in Celsius
-            precipitation: Monthly precipitation in mm
+            temperature: Monthly temperature in Celsius, shape (months,) or (locations, months)
+            precipitation: Monthly precipitation in mm, same shape
             available_water_capacity: Soil available water capacity in mm
         
         Returns:
-            PDSI values
+            PDSI values with the shape of the inputs
         """
-        n = len(precipitation)
-        pdsi = np.zeros(n)
+        temperature = np.asarray(temperature, dtype=np.float64)
+        precipitation = np.asarray(precipitation, dtype=np.float64)
+        n = precipitation.shape[-1]
         
         if n < 12:
-            return np.full(n, np.nan)
+            return np.full(precipitation.shape, np.nan)
         
         # Simplified PDSI calculation
-        # Calculate potential evapotranspiration (Thornthwaite method)
-        pet = np.zeros(n)
-        for i in range(n):
-            if temperature[i] > 0:
-                pet[i] = 16 * (10 * temperature[i] / np.mean(temperature[temperature > 0])) ** 1.5
-            else:
-                pet[i] = 0
+        # Calculate potential evapotranspiration (Thornthwaite method), scaled by
+        # each location's mean temperature over its above-freezing months
+        warm = temperature > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            warm_temperature = np.where(warm, temperature, 0.0)
+            warm_mean = warm_temperature.sum(axis=-1, keepdims=True) / warm.sum(axis=-1, keepdims=True)
+            pet = np.where(warm, 16 * (10 * warm_temperature / warm_mean) ** 1.5, 0.0)
         
         # Calculate moisture anomaly
         d = precipitation - pet
         
-        # Calculate Z-index (moisture anomaly index)
-        z = np.zeros(n)
-        for i in range(n):
-            if i > 0:
-                z[i] = 0.897 * z[i-1] + d[i] / 25.0
-            else:
-                z[i] = d[i] / 25.0
-        
-        # Convert to PDSI scale
-        for i in range(n):
-            if i > 0:
-                pdsi[i] = 0.897 * pdsi[i-1] + z[i] / 3.0
-            else:
-                pdsi[i] = z[i] / 3.0
+        # Z-index: z[i] = 0.897 * z[i-1] + d[i] / 25
+        z = signal.lfilter([1 / 25.0], [1, -0.897], d, axis=-1)
         
-        return pdsi
+        # PDSI: pdsi[i] = 0.897 * pdsi[i-1] + z[i] / 3
+        return signal.lfilter([1 / 3.0], [1, -0.897], z, axis=-1)
     
     @staticmethod
     def classify_drought(index_value: float, index_type: str = 'spi') -> Dict[str, str]:
         """
         Classify drought severity based on index value
         """
-        if index_value >= 2.0:
-            return {'category': 'extremely_wet', 'severity': 'none'}
-        elif 1.5 <= index_value < 2.0:
-            return {'category': 'very_wet', 'severity': 'none'}
-        elif 1.0 <= index_value < 1.5:
-            return {'category': 'moderately_wet', 'severity': 'none'}
-        elif -1.0 <= index_value < 1.0:
-            return {'category': 'normal', 'severity': 'none'}
-        elif -1.5 <= index_value < -1.0:
-            return {'category': 'moderate_drought', 'severity': 'moderate'}
-        elif -2.0 <= index_value < -1.5:
-            return {'category': 'severe_drought', 'severity': 'severe'}
-        else:
-            return {'category': 'extreme_drought', 'severity': 'extreme'}
+        category = DROUGHT.label(index_value)
+        return {'category': category, 'severity': DROUGHT_SEVERITY.get(category, 'none')}
 
 
 class ExtremeEventAnalyzer:
@@ -309,35 +641,143 @@ class ExtremeEventAnalyzer:
     
     @staticmethod
     def calculate_return_periods(values: np.ndarray, 
-                                 return_periods: List[int]) -> Dict[str, float]:
+                                 return_periods: List[int],
+                                 dates: Optional[List] = None,
+                                 distribution: str = 'gumbel') -> Dict[str, float]:
         """
         Calculate return period values using Gumbel distribution
         
+        The distribution is fitted by L-moments to annual maxima (see
+        modules.extreme_value), not to every daily value.
+        
         Args:
-            values: Array of extreme values
+            values: Array of extreme values, or a daily series when dates are given
             return_periods: List of return periods in years
+            dates: Dates of a daily series; annual maxima are extracted first
+            distribution: 'gumbel' or 'gev'
         
         Returns:
             Dictionary with return period values
         """
-        from scipy import stats
+        from modules.extreme_value import block_maxima, fit_lmoments, return_levels
         
-        # Fit Gumbel distribution
-        params = stats.gumbel_r.fit(values)
+        if dates is not None:
+            _, maxima = block_maxima(values, dates)
+        else:
+            maxima = np.atleast_2d(np.asarray(values, dtype=np.float64))
         
-        result = {}
-        for period in return_periods:
-            # Calculate value for given return period
-            prob = 1 - (1 / period)
-            value = stats.gumbel_r.ppf(prob, *params)
-            result[f"{period}_year"] = round(float(value), 2)
+        params = fit_lmoments(maxima, distribution)
+        levels = return_levels(params, return_periods, distribution)[0]
         
-        return result
+        return {
+            f"{period}_year": None if np.isnan(value) else round(float(value), 2)
+            for period, value in zip(return_periods, levels)
+        }
+    
+    @staticmethod
+    def detect_events(values: np.ndarray, thresholds, direction: str = 'above',
+                      min_duration: int = 1, max_gap: int = 0) -> Dict[str, np.ndarray]:
+        """
+        Run-length event detection over many series at once
+        
+        Every run of threshold exceedances in a (locations x time) array is
+        found with one diff over the row-padded exceedance mask. Runs of the
+        same location separated by at most max_gap non-exceeding steps are
+        merged into one event; missing values (NaN) never exceed.
+        
+        Args:
+            values: Array of shape (time,) or (locations, time)
+            thresholds: Scalar, per-location (locations,) or per-step
+                        (locations, time) thresholds
+            direction: 'above' (values > threshold) or 'below' (values < threshold)
+            min_duration: Minimum event length in steps, gaps included
+            max_gap: Longest tolerated run of non-exceeding steps inside an event
+        
+        Returns:
+            Columnar event table of equal-length arrays: location (row index),
+            start and end (inclusive step indices), duration, peak (max for
+            'above', min for 'below') and mean over the event span
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        n_locations, n_steps = values.shape
+        
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        if thresholds.ndim == 1 and n_locations > 1:
+            thresholds = thresholds[:, None]
+        
+        with np.errstate(invalid='ignore'):
+            exceed = values > thresholds if direction == 'above' else values < thresholds
+        
+        # A False column on both sides keeps runs from spilling across rows
+        padded = np.zeros((n_locations, n_steps + 2), dtype=np.int8)
+        padded[:, 1:-1] = exceed
+        edges = np.diff(padded, axis=1).ravel()
+        
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        location = starts // (n_steps + 1)
+        starts = starts % (n_steps + 1)
+        ends = ends % (n_steps + 1)
+        
+        if max_gap > 0 and len(starts) > 1:
+            merge = (location[1:] == location[:-1]) & (starts[1:] - ends[:-1] <= max_gap)
+            keep_start = np.concatenate([[True], ~merge])
+            keep_end = np.concatenate([~merge, [True]])
+            location, starts, ends = location[keep_start], starts[keep_start], ends[keep_end]
+        
+        duration = ends - starts
+        keep = duration >= min_duration
+        location, starts, ends, duration = location[keep], starts[keep], ends[keep], duration[keep]
+        
+        # Segment statistics on the flattened series (ends are exclusive here)
+        flat = np.append(values.ravel(), np.nan)
+        first = location * n_steps + starts
+        last = location * n_steps + ends
+        
+        valid = ~np.isnan(flat)
+        sums = np.concatenate([[0.0], np.cumsum(np.where(valid, flat, 0.0))])
+        counts = np.concatenate([[0], np.cumsum(valid)])
+        
+        if len(first):
+            reducer = np.fmax if direction == 'above' else np.fmin
+            peak = reducer.reduceat(flat, np.column_stack([first, last]).ravel())[::2]
+        else:
+            peak = np.array([])
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (sums[last] - sums[first]) / (counts[last] - counts[first])
+        
+        return {
+            'location': location,
+            'start': starts,
+            'end': ends - 1,
+            'duration': duration,
+            'peak': peak,
+            'mean': mean
+        }
+    
+    @staticmethod
+    def events_to_records(events: Dict[str, np.ndarray], dates: List, event_type: str,
+                          duration_key: str = 'duration_days', row: int = 0) -> List[Dict]:
+        """Convert one location's rows of a detect_events table to the per-event dict layout"""
+        selected = np.flatnonzero(events['location'] == row)
+        return [
+            {
+                'start_date': dates[events['start'][i]],
+                'end_date': dates[events['end'][i]],
+                duration_key: int(events['duration'][i]),
+                'peak_value': float(events['peak'][i]),
+                'mean_value': float(events['mean'][i]),
+                'event_type': event_type
+            }
+            for i in selected
+        ]
     
     @staticmethod
     def identify_heatwave(temperature: np.ndarray, dates: List[datetime],
                          threshold_percentile: float = 90,
-                         min_duration: int = 3) -> List[Dict]:
+                         min_duration: int = 3,
+                         thresholds: Optional[np.ndarray] = None) -> List[Dict]:
         """
         Identify heatwave events
         
@@ -346,37 +786,19 @@ class ExtremeEventAnalyzer:
             dates: Corresponding dates
             threshold_percentile: Percentile for extreme heat (default 90th)
             min_duration: Minimum consecutive days (default 3)
+            thresholds: Per-day thresholds (e.g. calendar-day climatology);
+                        when given, threshold_percentile is not used
         
         Returns:
             List of heatwave events with start, end, duration, peak
         """
-        threshold = np.percentile(temperature, threshold_percentile)
-        
-        heatwaves = []
-        in_heatwave = False
-        start_idx = 0
-        
-        for i, temp in enumerate(temperature):
-            if temp > threshold:
-                if not in_heatwave:
-                    in_heatwave = True
-                    start_idx = i
-            else:
-                if in_heatwave:
-                    duration = i - start_idx
-                    if duration >= min_duration:
-                        event_temps = temperature[start_idx:i]
-                        heatwaves.append({
-                            'start_date': dates[start_idx],
-                            'end_date': dates[i-1],
-                            'duration_days': duration,
-                            'peak_value': float(np.max(event_temps)),
-                            'mean_value': float(np.mean(event_temps)),
-                            'event_type': 'heatwave'
-                        })
-                    in_heatwave = False
-        
-        return heatwaves
+        if thresholds is None:
+            threshold = np.percentile(temperature, threshold_percentile)
+        else:
+            threshold = np.asarray(thresholds, dtype=np.float64).reshape(1, -1)
+        
+        events = ExtremeEventAnalyzer.detect_events(temperature, threshold, 'above', min_duration)
+        return ExtremeEventAnalyzer.events_to_records(events, dates, 'heatwave', 'duration_days')
     
     @staticmethod
     def identify_drought_events(spi: np.ndarray, dates: List[datetime],
@@ -385,31 +807,8 @@ class ExtremeEventAnalyzer:
         """
         Identify drought events based on SPI
         """
-        droughts = []
-        in_drought = False
-        start_idx = 0
-        
-        for i, value in enumerate(spi):
-            if not np.isnan(value) and value < threshold:
-                if not in_drought:
-                    in_drought = True
-                    start_idx = i
-            else:
-                if in_drought:
-                    duration = i - start_idx
-                    if duration >= min_duration:
-                        event_values = spi[start_idx:i]
-                        droughts.append({
-                            'start_date': dates[start_idx],
-                            'end_date': dates[i-1],
-                            'duration_months': duration,
-                            'peak_value': float(np.min(event_values)),
-                            'mean_value': float(np.mean(event_values)),
-                            'event_type': 'drought'
-                        })
-                    in_drought = False
-        
-        return droughts
+        events = ExtremeEventAnalyzer.detect_events(spi, threshold, 'below', min_duration)
+        return ExtremeEventAnalyzer.events_to_records(events, dates, 'drought', 'duration_months')
     
     @staticmethod
     def calculate_return_period(values: np.ndarray, threshold: float) -> float:
@@ -433,15 +832,23 @@ class ExtremeEventAnalyzer:
         return 1.0 / probability
     
     @staticmethod
-    def extreme_percentiles(values: np.ndarray) -> Dict[str, float]:
+    def extreme_percentiles(values) -> Dict[str, float]:
         """
         Calculate extreme percentiles for return period analysis
+        
+        Args:
+            values: Raw values, or a QuantileSketch summarising them
+        
+        Returns:
+            Dictionary of percentiles keyed 'p{percentile}'
         """
         percentiles = [50, 75, 90, 95, 99, 99.5]
-        results = {}
         
-        for p in percentiles:
-            results[f'p{p}'] = float(np.percentile(values, p))
+        if hasattr(values, 'percentile'):
+            results = values.percentile(percentiles)
+        else:
+            # One sort for every percentile instead of one per call
+            results = np.percentile(values, percentiles)
         
-        return results
+        return {f'p{p}': float(v) for p, v in zip(percentiles, results)}
 
@@ -0,0 +1,291 @@
+"""
+Precomputed calendar-day percentile thresholds
+
+Operational extreme definitions compare each day against a percentile of
+the same calendar day in a fixed baseline, using a moving window of
+neighbouring days (e.g. the 90th percentile of a 15-day window over
+1991-2020). Thresholds are computed once per location, stored as compact
+(locations x 366) float32 arrays per variable and percentile, and event
+detection looks them up instead of recomputing percentiles over raw
+history on every request.
+"""
+import os
+import json
+import warnings
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Optional, Tuple
+from config import Config
+from modules.utils import atomic_write, file_lock
+
+# Days in the leap-year calendar used to index thresholds (Feb 29 included)
+CALENDAR_DAYS = 366
+
+
+def calendar_index(dates) -> np.ndarray:
+    """
+    Position of each date in a 366-day calendar
+    
+    Non-leap years skip the Feb 29 slot, so a given calendar day always maps
+    to the same index regardless of the year.
+    
+    Args:
+        dates: Dates (anything accepted by pd.DatetimeIndex)
+    
+    Returns:
+        Integer array of indices in [0, 366)
+    """
+    dates = pd.DatetimeIndex(dates)
+    doy = dates.dayofyear.to_numpy() - 1
+    return doy + ((~dates.is_leap_year) & (doy >= 59))
+
+
+def percentile_thresholds(values: np.ndarray, dates, percentile: float = 90,
+                          window: int = None) -> np.ndarray:
+    """
+    Calendar-day percentiles over a centred moving window
+    
+    Args:
+        values: Daily values of shape (locations, days); NaN is ignored
+        dates: Dates of the columns (consecutive days)
+        percentile: Percentile to compute (0-100)
+        window: Window length in days, centred on each calendar day
+    
+    Returns:
+        Thresholds of shape (locations, 366)
+    """
+    window = window or Config.CLIMATOLOGY_WINDOW_DAYS
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    dates = pd.DatetimeIndex(dates)
+    
+    # Lay every year out on the 366-day calendar so neighbours are contiguous
+    years = dates.year.to_numpy()
+    year_index = years - years.min()
+    n_years = int(year_index.max()) + 1
+    
+    cube = np.full((values.shape[0], n_years * CALENDAR_DAYS), np.nan)
+    cube[:, year_index * CALENDAR_DAYS + calendar_index(dates)] = values
+    
+    # Empty Feb 29 slots of non-leap years sit inside the flattened axis, so
+    # windows spanning them simply see one NaN more
+    half = window // 2
+    padded = np.pad(cube, ((0, 0), (half, half)), constant_values=np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)
+    
+    samples = windows.reshape(values.shape[0], n_years, CALENDAR_DAYS, window)
+    samples = samples.transpose(0, 2, 1, 3).reshape(values.shape[0], CALENDAR_DAYS, -1)
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanpercentile(samples, percentile, axis=-1)
+
+
+class ThresholdTable:
+    """Per-location calendar-day thresholds for one variable and percentile"""
+    
+    def __init__(self, variable: str, percentile: float, location_ids: List[str],
+                 thresholds: np.ndarray, baseline: Dict[str, str] = None, window: int = None):
+        self.variable = variable
+        self.percentile = percentile
+        self.location_ids = list(location_ids)
+        self.thresholds = np.asarray(thresholds, dtype=np.float32).reshape(-1, CALENDAR_DAYS)
+        self.baseline = dict(baseline or Config.CLIMATOLOGY_BASELINE)
+        self.window = window or Config.CLIMATOLOGY_WINDOW_DAYS
+        self._rows = {location_id: i for i, location_id in enumerate(self.location_ids)}
+    
+    def missing(self, location_ids: List[str]) -> List[str]:
+        return [location_id for location_id in dict.fromkeys(location_ids) if location_id not in self._rows]
+    
+    def add(self, location_ids: List[str], thresholds: np.ndarray):
+        """Append or replace rows for the given locations"""
+        thresholds = np.asarray(thresholds, dtype=np.float32).reshape(-1, CALENDAR_DAYS)
+        new_rows = []
+        
+        for location_id, row in zip(location_ids, thresholds):
+            if location_id in self._rows:
+                self.thresholds[self._rows[location_id]] = row
+            else:
+                self._rows[location_id] = len(self.location_ids)
+                self.location_ids.append(location_id)
+                new_rows.append(row)
+        
+        if new_rows:
+            self.thresholds = np.vstack([self.thresholds, np.array(new_rows, dtype=np.float32)])
+    
+    def lookup(self, location_ids: List[str], dates) -> np.ndarray:
+        """
+        Thresholds for every (location, date) pair
+        
+        Args:
+            location_ids: Locations, all present in the table
+            dates: Dates to look up
+        
+        Returns:
+            Array of shape (locations, len(dates))
+        """
+        rows = np.array([self._rows[location_id] for location_id in location_ids], dtype=np.int64)
+        return self.thresholds[rows[:, None], calendar_index(dates)[None, :]].astype(np.float64)
+    
+    def save(self, path: str):
+        """Persist as a single uncompressed .npz file, replaced atomically"""
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    thresholds=self.thresholds,
+                    location_ids=np.array(self.location_ids, dtype=str),
+                    meta=np.array(json.dumps({
+                        'variable': self.variable,
+                        'percentile': self.percentile,
+                        'baseline': self.baseline,
+                        'window': self.window
+                    }))
+                )
+        
+        atomic_write(path, write)
+    
+    @classmethod
+    def load(cls, path: str) -> 'ThresholdTable':
+        with np.load(path, allow_pickle=False) as f:
+            meta = json.loads(str(f['meta']))
+            return cls(
+                meta['variable'],
+                meta['percentile'],
+                f['location_ids'].tolist(),
+                f['thresholds'],
+                meta['baseline'],
+                meta['window']
+            )
+
+
+# Loaded tables with the file stamp they were read at, keyed by (variable, percentile)
+_tables: Dict[Tuple[str, float], Tuple[Tuple[int, int], ThresholdTable]] = {}
+
+
+def table_path(variable: str, percentile: float) -> str:
+    return os.path.join(Config.CLIMATOLOGY_DIR, f'{variable}_p{percentile:g}.npz')
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    """(inode, mtime) of a file; every atomic save replaces the inode"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _read_table(path: str) -> Optional[ThresholdTable]:
+    try:
+        table = ThresholdTable.load(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Failed to load climatology {path}: {e}")
+        return None
+    
+    # A baseline or window change invalidates every stored row
+    if table.baseline != Config.CLIMATOLOGY_BASELINE or table.window != Config.CLIMATOLOGY_WINDOW_DAYS:
+        return None
+    return table
+
+
+def get_threshold_table(variable: str, percentile: float) -> Optional[ThresholdTable]:
+    """
+    Return the stored table for a variable and percentile, or None if not built yet
+    
+    The loaded copy is reused until another process saves a new file.
+    """
+    key = (variable, percentile)
+    path = table_path(variable, percentile)
+    stamp = _file_stamp(path)
+    if stamp is None:
+        return None
+    
+    cached = _tables.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    
+    table = _read_table(path)
+    if table is not None:
+        _tables[key] = (stamp, table)
+    return table
+
+
+def build_thresholds(location_ids: List[str], variable: str, percentile: float,
+                     load_daily: Callable[[List[str], str, str], Tuple[List[str], np.ndarray]]) -> ThresholdTable:
+    """
+    Compute baseline thresholds for locations and add them to the stored table
+    
+    Several task pool workers may build at once: the stored table is
+    re-read under a file lock and the new rows merged into it, so rows
+    added by other workers since it was loaded are kept.
+    
+    Args:
+        location_ids: Locations to (re)compute
+        variable: Climate variable name
+        percentile: Percentile to compute (0-100)
+        load_daily: Callable (location_ids, start, end) -> (dates, values of
+                    shape (locations, days)) returning baseline daily data
+    
+    Returns:
+        The updated ThresholdTable
+    """
+    baseline = Config.CLIMATOLOGY_BASELINE
+    dates, values = load_daily(location_ids, baseline['start'], baseline['end'])
+    thresholds = percentile_thresholds(values, dates, percentile)
+    
+    path = table_path(variable, percentile)
+    with file_lock(path):
+        table = _read_table(path)
+        if table is None:
+            table = ThresholdTable(variable, percentile, [], np.empty((0, CALENDAR_DAYS)))
+        table.add(location_ids, thresholds)
+        table.save(path)
+        _tables[(variable, percentile)] = (_file_stamp(path), table)
+    
+    return table
+
+
+def lookup_thresholds(location_ids: List[str], variable: str, percentile: float, dates,
+                      load_daily: Callable[[List[str], str, str], Tuple[List[str], np.ndarray]]) -> np.ndarray:
+    """
+    Per-day thresholds for locations, computing any that are not stored yet
+    
+    Args:
+        location_ids: Locations to look up
+        variable: Climate variable name
+        percentile: Percentile (0-100)
+        dates: Dates to look up
+        load_daily: Baseline loader used for locations missing from the table
+    
+    Returns:
+        Array of shape (locations, len(dates))
+    """
+    table = get_threshold_table(variable, percentile)
+    missing = table.missing(location_ids) if table is not None else list(dict.fromkeys(location_ids))
+    
+    if missing:
+        table = build_thresholds(missing, variable, percentile, load_daily)
+    
+    return table.lookup(location_ids, dates)
+
+
+if __name__ == '__main__':
+    from modules.spatial_processor import SpatialProcessor
+    from modules.mock_data import mock_engine
+    
+    spatial_processor = SpatialProcessor()
+    location_ids = [
+        feature['properties']['id']
+        for level in spatial_processor.get_levels()
+        for feature in spatial_processor.get_boundaries(level)['features']
+    ]
+    
+    # Same synthetic source the extreme-events endpoint scores against
+    def load_daily(ids, start, end):
+        return mock_engine.generate(ids, variable, start, end, 'daily')
+    
+    for variable, percentile in Config.CLIMATOLOGY_PERCENTILES.items():
+        table = build_thresholds(location_ids, variable, percentile, load_daily)
+        print(f"Climatology {variable} p{percentile:g}: {len(table.location_ids)} locations")
@@ -0,0 +1,133 @@
+"""
+Array-backed tree ensemble for fast forecast inference
+
+A fitted sklearn forest is flattened into five contiguous arrays over the
+nodes of all trees (split feature, threshold, left child, right child,
+node value) plus the root of each tree. Leaves point to themselves, so a
+batch of rows descends every tree at once in max_depth vectorized steps
+with no Python-level per-tree work. The object holds nothing but numpy
+arrays: it is small to store, loads without rebuilding sklearn trees, and
+memory-maps cleanly through joblib.
+"""
+import numpy as np
+from typing import Sequence
+
+# Leaves compare against +inf, so every row stays on the (self-looping) left branch
+_LEAF_THRESHOLD = np.inf
+
+
+class CompactForest:
+    """Flattened regression forest; predictions match the sklearn forest it was built from"""
+    
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, depths: np.ndarray, n_features: int):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.depths = depths
+        self.n_features_in_ = n_features
+    
+    @classmethod
+    def from_sklearn(cls, model) -> 'CompactForest':
+        """Flatten a fitted RandomForestRegressor (or any single-output tree ensemble)"""
+        return cls.from_trees([estimator.tree_ for estimator in model.estimators_], model.n_features_in_)
+    
+    @classmethod
+    def from_trees(cls, trees: Sequence, n_features: int) -> 'CompactForest':
+        sizes = np.array([tree.node_count for tree in trees], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        
+        feature = np.concatenate([tree.feature for tree in trees]).astype(np.int32)
+        threshold = np.concatenate([tree.threshold for tree in trees]).astype(np.float64)
+        children_left = np.concatenate([tree.children_left for tree in trees]).astype(np.int64)
+        children_right = np.concatenate([tree.children_right for tree in trees]).astype(np.int64)
+        value = np.concatenate([tree.value[:, 0, 0] for tree in trees]).astype(np.float64)
+        
+        # Child indices are per tree; shift them to the concatenated node axis
+        node_offsets = np.repeat(offsets, sizes)
+        nodes = np.arange(len(feature), dtype=np.int64)
+        leaf = children_left < 0
+        left = np.where(leaf, nodes, children_left + node_offsets).astype(np.int32)
+        right = np.where(leaf, nodes, children_right + node_offsets).astype(np.int32)
+        feature[leaf] = 0
+        threshold[leaf] = _LEAF_THRESHOLD
+        
+        return cls(feature, threshold, left, right, value, offsets.astype(np.int32),
+                   np.array([tree.max_depth for tree in trees], dtype=np.int32), n_features)
+    
+    @classmethod
+    def concatenate(cls, forests: Sequence['CompactForest']) -> 'CompactForest':
+        """One forest holding the trees of every input forest, in order"""
+        n_features = {forest.n_features_in_ for forest in forests}
+        if len(n_features) != 1:
+            raise ValueError("Forests must share the same features")
+        
+        offsets = np.concatenate([[0], np.cumsum([forest.n_nodes for forest in forests])[:-1]])
+        return cls(
+            np.concatenate([forest.feature for forest in forests]),
+            np.concatenate([forest.threshold for forest in forests]),
+            np.concatenate([forest.left + offset for forest, offset in zip(forests, offsets)]).astype(np.int32),
+            np.concatenate([forest.right + offset for forest, offset in zip(forests, offsets)]).astype(np.int32),
+            np.concatenate([forest.value for forest in forests]),
+            np.concatenate([forest.roots + offset for forest, offset in zip(forests, offsets)]).astype(np.int32),
+            np.concatenate([forest.depths for forest in forests]),
+            n_features.pop()
+        )
+    
+    def newest(self, n_trees: int) -> 'CompactForest':
+        """The last n_trees trees (the forest itself when it has no more than that)"""
+        if n_trees >= self.n_estimators:
+            return self
+        
+        # Trees occupy consecutive node ranges, so the newest ones are a suffix of every array
+        start = int(self.roots[-n_trees])
+        return CompactForest(
+            np.array(self.feature[start:]), np.array(self.threshold[start:]),
+            (self.left[start:] - start).astype(np.int32), (self.right[start:] - start).astype(np.int32),
+            np.array(self.value[start:]), (self.roots[-n_trees:] - start).astype(np.int32),
+            np.array(self.depths[-n_trees:]), self.n_features_in_
+        )
+    
+    @property
+    def n_estimators(self) -> int:
+        return len(self.roots)
+    
+    @property
+    def max_depth(self) -> int:
+        return int(self.depths.max()) if len(self.depths) else 0
+    
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.feature, self.threshold, self.left, self.right,
+                                              self.value, self.roots, self.depths))
+    
+    def apply(self, X) -> np.ndarray:
+        """Global leaf index reached in every tree, shape (rows, n_trees)"""
+        # Same comparison as sklearn: float32 features against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got shape {X.shape}")
+        
+        flat = X.ravel()
+        row_offsets = (np.arange(X.shape[0], dtype=np.int64) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).astype(np.int64)
+        
+        # One step per level: every row moves one level down in every tree
+        for _ in range(self.max_depth):
+            go_left = flat[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+    
+    def predict_trees(self, X) -> np.ndarray:
+        """Prediction of every tree for every row, shape (rows, n_trees)"""
+        return self.value[self.apply(X)]
+    
+    def predict(self, X) -> np.ndarray:
+        return self.predict_trees(X).mean(axis=1)
@@ -1,8 +1,10 @@
 import os
-import random
 from datetime import datetime, timedelta
+from itertools import islice
 from config import Config
-from modules.utils import get_cached_climate_data, cache_climate_data
+from modules.utils import get_cached_climate_series, cache_climate_data_bulk
+from modules.aggregation import ROLLUP_AGGREGATIONS, month_starts, month_ranges, aggregate_monthly
+from modules.mock_data import mock_engine
 
 class ClimateDataFetcher:
     def __init__(self):
@@ -57,6 +59,89 @@ class ClimateDataFetcher:
         
         return image
     
+    def fetch_era5_bands(self, bands, year, month, grid):
+        """Fetch one month of raw ERA5 bands on a GridSpec in one computePixels call"""
+        if not self.initialized:
+            return None
+        
+        bands = list(dict.fromkeys(bands))
+        
+        start_date = f'{year}-{month:02d}-01'
+        if month == 12:
+            end_date = f'{year + 1}-01-01'
+        else:
+            end_date = f'{year}-{month + 1:02d}-01'
+        
+        image = self.ee.ImageCollection(Config.ERA5_MONTHLY_DATASET) \
+            .filterDate(start_date, end_date) \
+            .select(bands) \
+            .mean()
+        
+        pixels = self.ee.data.computePixels({
+            'expression': image,
+            'fileFormat': 'NUMPY_NDARRAY',
+            'grid': {
+                'dimensions': {'width': grid.nx, 'height': grid.ny},
+                'affineTransform': grid.affine_transform(),
+                'crsCode': 'EPSG:4326'
+            }
+        })
+        
+        import numpy as np
+        
+        return {band: np.asarray(pixels[band], dtype=np.float64) for band in bands}
+    
+    def fetch_era5_grid(self, variables, year, month, grid):
+        """Fetch one month of ERA5 variables as scaled arrays on a GridSpec in one computePixels call"""
+        if not self.initialized:
+            return None
+        
+        bands = [Config.CLIMATE_VARIABLES.get(v, {}).get('gee_band', 'temperature_2m') for v in variables]
+        pixels = self.fetch_era5_bands(bands, year, month, grid)
+        
+        result = {}
+        for variable, band in zip(variables, bands):
+            var_config = Config.CLIMATE_VARIABLES.get(variable, {})
+            result[variable] = pixels[band] * var_config.get('scale_factor', 1) + var_config.get('offset', 0)
+        
+        return result
+    
+    def fetch_heat_stress_inputs(self, year, month, grid):
+        """
+        Fetch every heat-stress input for one month in a single pixel download
+        
+        Args:
+            year: Year
+            month: Month (1-12)
+            grid: Target GridSpec
+        
+        Returns:
+            Dictionary of (ny, nx) arrays: temperature and dewpoint (°C),
+            relative_humidity (%), wind_speed (m/s) and solar_radiation (W/m²)
+        """
+        if not self.initialized:
+            return None
+        
+        import numpy as np
+        from modules.climate_indices import HeatStressCalculator
+        
+        bands = Config.HEAT_STRESS_BANDS
+        pixels = self.fetch_era5_bands(list(bands.values()), year, month, grid)
+        
+        temperature = pixels[bands['temperature']] - 273.15
+        dewpoint = pixels[bands['dewpoint']] - 273.15
+        
+        # Monthly accumulated J/m² -> mean flux in W/m²
+        seconds = (datetime(year + month // 12, month % 12 + 1, 1) - datetime(year, month, 1)).total_seconds()
+        
+        return {
+            'temperature': temperature,
+            'dewpoint': dewpoint,
+            'relative_humidity': HeatStressCalculator.relative_humidity_array(temperature, dewpoint),
+            'wind_speed': np.hypot(pixels[bands['u_wind']], pixels[bands['v_wind']]),
+            'solar_radiation': pixels[bands['solar_radiation']] / seconds
+        }
+    
     def calculate_zonal_stats(self, image, boundaries, variable):
         var_config = Config.CLIMATE_VARIABLES.get(variable, {})
         gee_band = var_config.get('gee_band', 'temperature_2m')
@@ -73,27 +158,114 @@ class ClimateDataFetcher:
         zonal_fc = boundaries.map(compute_mean)
         return zonal_fc
     
+    def location_geometry(self, location):
+        """Earth Engine geometry for a resolved location (polygon, or snapped grid-cell centre)"""
+        if location['type'] == 'point':
+            return self.ee.Geometry.Point(location['geometry']['coordinates'])
+        return self.ee.Geometry(location['geometry'])
+    
     def extract_timeseries(self, variable, start_date, end_date, geometry, aggregation='monthly', location_id='pakistan_center'):
         if not self.initialized:
-            return self.generate_mock_timeseries(variable, start_date, end_date)
+            return self.generate_mock_timeseries(variable, start_date, end_date, location_id, aggregation)
+        
+        data = []
+        for chunk in self.iter_timeseries_chunks(variable, start_date, end_date, geometry, aggregation, location_id):
+            data.extend(chunk)
+        
+        return data
+    
+    def iter_timeseries_chunks(self, variable, start_date, end_date, geometry, aggregation='monthly', location_id='pakistan_center'):
+        """Yield a timeseries window by window, in date order.
+        
+        Long hourly/daily ranges are split into windows that stay under Earth Engine
+        element limits. Windows are fetched concurrently (bounded by
+        GEE_MAX_CONCURRENT_REQUESTS) and each is cached as soon as it arrives.
+        """
+        if not self.initialized:
+            yield self.generate_mock_timeseries(variable, start_date, end_date, location_id, aggregation)
+            return
+        
+        if aggregation in ROLLUP_AGGREGATIONS:
+            yield self._rollup_from_monthly(variable, start_date, end_date, geometry, aggregation, location_id)
+            return
+        
+        def fetch(window_start, window_end):
+            return self._fetch_timeseries_window(
+                variable, window_start, window_end, geometry, aggregation, location_id
+            )
+        
+        yield from self._map_windows(fetch, self._time_windows(start_date, end_date, aggregation))
+    
+    def _rollup_from_monthly(self, variable, start_date, end_date, geometry, aggregation, location_id):
+        """Seasonal/annual series built locally from cached monthly values; only missing months hit GEE"""
+        months = month_starts(start_date, end_date)
+        cached = get_cached_climate_series([location_id], variable, start_date, end_date, 'monthly')[location_id]
+        
+        missing = [month for month in months if month not in cached]
+        for range_start, range_end in month_ranges(missing):
+            for entry in self._fetch_timeseries_window(variable, range_start, range_end, geometry, 'monthly', location_id):
+                cached[entry['date']] = entry['value']
+        
+        # Months the dataset does not have yet are remembered briefly instead of refetched on every call
+        unavailable = [month for month in missing if cached.get(month) is None]
+        if unavailable:
+            cache_climate_data_bulk([(location_id, variable, month, None) for month in unavailable], 'monthly')
+        
+        monthly = [{'date': month, 'value': cached.get(month)} for month in months]
+        return aggregate_monthly(monthly, aggregation)
+    
+    def _time_windows(self, start_date, end_date, aggregation):
+        """Split [start_date, end_date) into windows of GEE_CHUNK_DAYS for the aggregation"""
+        chunk_days = Config.GEE_CHUNK_DAYS.get(aggregation)
+        if not chunk_days:
+            return [(start_date, end_date)]
+        
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        
+        windows = []
+        while start < end:
+            window_end = min(start + timedelta(days=chunk_days), end)
+            windows.append((start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+            start = window_end
+        
+        return windows or [(start_date, end_date)]
+    
+    def _map_windows(self, fetch, windows):
+        """Run fetch(start, end) over windows with bounded concurrency, yielding results in window order"""
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+        
+        windows = iter(windows)
+        max_workers = Config.GEE_MAX_CONCURRENT_REQUESTS
         
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # Keep at most max_workers windows in flight so memory stays bounded
+            pending = deque(pool.submit(fetch, *window) for window in islice(windows, max_workers))
+            
+            while pending:
+                result = pending.popleft().result()
+                
+                next_window = next(windows, None)
+                if next_window is not None:
+                    pending.append(pool.submit(fetch, *next_window))
+                
+                yield result
+    
+    def _fetch_timeseries_window(self, variable, start_date, end_date, geometry, aggregation, location_id):
         var_config = Config.CLIMATE_VARIABLES.get(variable, {})
         gee_band = var_config.get('gee_band', 'temperature_2m')
         agg_config = Config.AGGREGATION_TYPES.get(aggregation, Config.AGGREGATION_TYPES['monthly'])
         dataset = agg_config['dataset']
         scale = agg_config['scale']
+        date_format = 'YYYY-MM-dd HH:mm' if aggregation == 'hourly' else 'YYYY-MM-dd'
         
         image_collection = self.ee.ImageCollection(dataset) \
             .filterDate(start_date, end_date) \
             .select(gee_band)
         
-        if aggregation == 'seasonal':
-            image_collection = self._aggregate_seasonal(image_collection, gee_band)
-        elif aggregation == 'annual':
-            image_collection = self._aggregate_annual(image_collection, gee_band)
-        
         def extract_value(image):
-            date = image.date().format('YYYY-MM-dd')
+            date = image.date().format(date_format)
             value = image.reduceRegion(
                 reducer=self.ee.Reducer.mean(),
                 geometry=geometry,
@@ -112,168 +284,170 @@ class ClimateDataFetcher:
         timeseries_info = timeseries_fc.getInfo()
         
         data = []
+        cache_rows = []
         for feat in timeseries_info['features']:
             props = feat['properties']
             date_str = props['date']
             value = props['value']
             
-            cached_value = get_cached_climate_data(location_id, variable, date_str, aggregation)
+            if value is not None:
+                value = round(value, 2)
+                cache_rows.append((location_id, variable, date_str, value))
             
-            if cached_value is not None:
-                data.append({
-                    'date': date_str,
-                    'value': round(cached_value, 2)
-                })
-            else:
-                if value is not None:
-                    rounded_value = round(value, 2)
-                    cache_climate_data(location_id, variable, date_str, rounded_value, aggregation)
-                    data.append({
-                        'date': date_str,
-                        'value': rounded_value
-                    })
-                else:
-                    data.append({
-                        'date': date_str,
-                        'value': None
-                    })
+            data.append({
+                'date': date_str,
+                'value': value
+            })
+        
+        if cache_rows:
+            cache_climate_data_bulk(cache_rows, aggregation)
         
         return data
     
-    def _aggregate_seasonal(self, collection, band):
-        years = collection.aggregate_array('system:time_start').map(
-            lambda t: self.ee.Date(t).get('year')
-        ).distinct()
+    def extract_batch_timeseries(self, variable, start_date, end_date, locations, aggregation='monthly'):
+        """Extract one variable for many resolved locations in a single remote reduction.
+        
+        Every image is reduced over all location geometries with reduceRegions and the
+        results are pulled back as one flat list, so N locations cost one request
+        (per time window for long hourly/daily ranges).
+        Returns columnar data: {'dates': [...], 'values': {location_id: [...]}}.
+        """
+        location_ids = [location['id'] for location in locations]
+        
+        if not self.initialized:
+            return self.generate_mock_batch_timeseries(variable, start_date, end_date, location_ids, aggregation)
         
-        def create_seasonal_images(year):
-            year_start = self.ee.Date.fromYMD(year, 1, 1)
+        import numpy as np
+        
+        if aggregation in ROLLUP_AGGREGATIONS:
+            return self._batch_rollup_from_monthly(variable, start_date, end_date, locations, aggregation)
+        
+        var_config = Config.CLIMATE_VARIABLES.get(variable, {})
+        gee_band = var_config.get('gee_band', 'temperature_2m')
+        agg_config = Config.AGGREGATION_TYPES.get(aggregation, Config.AGGREGATION_TYPES['monthly'])
+        date_format = 'YYYY-MM-dd HH:mm' if aggregation == 'hourly' else 'YYYY-MM-dd'
+        
+        regions = self.ee.FeatureCollection([
+            self.ee.Feature(self.location_geometry(location), {'loc': location['id']})
+            for location in locations
+        ])
+        loc_index = {location_id: i for i, location_id in enumerate(location_ids)}
+        
+        def reduce_image(image):
+            date = image.date().format(date_format)
+            reduced = image.reduceRegions(
+                collection=regions,
+                reducer=self.ee.Reducer.mean().setOutputs(['value']),
+                scale=agg_config['scale']
+            )
+            return reduced.map(lambda feature: feature.set('date', date))
+        
+        def fetch(window_start, window_end):
+            image_collection = self.ee.ImageCollection(agg_config['dataset']) \
+                .filterDate(window_start, window_end) \
+                .select(gee_band)
             
-            winter_months = [12, 1, 2]
-            spring_months = [3, 4, 5]
-            summer_months = [6, 7, 8]
-            fall_months = [9, 10, 11]
+            rows = image_collection.map(reduce_image).flatten() \
+                .reduceColumns(self.ee.Reducer.toList(3), ['loc', 'date', 'value']) \
+                .get('list') \
+                .getInfo()
             
-            winter = collection.filter(
-                self.ee.Filter.Or(
-                    self.ee.Filter.And(
-                        self.ee.Filter.calendarRange(year.subtract(1), year.subtract(1), 'year'),
-                        self.ee.Filter.calendarRange(12, 12, 'month')
-                    ),
-                    self.ee.Filter.And(
-                        self.ee.Filter.calendarRange(year, year, 'year'),
-                        self.ee.Filter.calendarRange(1, 2, 'month')
-                    )
-                )
-            ).mean().set('system:time_start', year_start.advance(0, 'month').millis())
+            dates = sorted({row[1] for row in rows})
+            date_index = {date: i for i, date in enumerate(dates)}
             
-            spring = collection.filter(
-                self.ee.Filter.And(
-                    self.ee.Filter.calendarRange(year, year, 'year'),
-                    self.ee.Filter.calendarRange(3, 5, 'month')
-                )
-            ).mean().set('system:time_start', year_start.advance(3, 'month').millis())
+            values = np.full((len(location_ids), len(dates)), np.nan)
+            for location_id, date, value in rows:
+                if value is not None:
+                    values[loc_index[location_id], date_index[date]] = value
             
-            summer = collection.filter(
-                self.ee.Filter.And(
-                    self.ee.Filter.calendarRange(year, year, 'year'),
-                    self.ee.Filter.calendarRange(6, 8, 'month')
-                )
-            ).mean().set('system:time_start', year_start.advance(6, 'month').millis())
+            values = np.round(values * var_config.get('scale_factor', 1) + var_config.get('offset', 0), 2)
             
-            fall = collection.filter(
-                self.ee.Filter.And(
-                    self.ee.Filter.calendarRange(year, year, 'year'),
-                    self.ee.Filter.calendarRange(9, 11, 'month')
-                )
-            ).mean().set('system:time_start', year_start.advance(9, 'month').millis())
+            cache_rows = []
+            for location, row in zip(locations, values):
+                for date, value in zip(dates, row):
+                    if not np.isnan(value):
+                        cache_rows.append((location['cache_key'], variable, date, float(value)))
+            if cache_rows:
+                cache_climate_data_bulk(cache_rows, aggregation)
             
-            return [winter, spring, summer, fall]
-        
-        seasonal_images = years.map(create_seasonal_images).flatten()
-        return self.ee.ImageCollection(seasonal_images)
-    
-    def _aggregate_annual(self, collection, band):
-        years = collection.aggregate_array('system:time_start').map(
-            lambda t: self.ee.Date(t).get('year')
-        ).distinct()
-        
-        def create_annual_image(year):
-            annual = collection.filter(
-                self.ee.Filter.calendarRange(year, year, 'year')
-            ).mean()
-            return annual.set('system:time_start', self.ee.Date.fromYMD(year, 1, 1).millis())
-        
-        annual_collection = self.ee.ImageCollection(years.map(create_annual_image))
-        return annual_collection
-    
-    def generate_mock_zonal_stats(self, variable):
-        provinces = ['Punjab', 'Sindh', 'Khyber Pakhtunkhwa', 'Balochistan', 'Gilgit-Baltistan', 'Azad Kashmir']
-        
-        value_ranges = {
-            'temperature': (15, 35),
-            'precipitation': (0, 150),
-            'humidity': (30, 80),
-            'wind_speed': (2, 12)
-        }
+            return dates, values
         
-        min_val, max_val = value_ranges.get(variable, (10, 30))
+        chunks = list(self._map_windows(fetch, self._time_windows(start_date, end_date, aggregation)))
+        dates = [date for chunk_dates, _ in chunks for date in chunk_dates]
+        values = np.concatenate([chunk_values for _, chunk_values in chunks], axis=1)
         
-        data = []
-        for province in provinces:
-            value = round(random.uniform(min_val, max_val), 2)
-            data.append({
-                'name': province,
-                'value': value
-            })
-        
-        return data
+        return {
+            'dates': dates,
+            'values': {
+                location_id: [None if np.isnan(v) else float(v) for v in row]
+                for location_id, row in zip(location_ids, values)
+            }
+        }
     
-    def generate_mock_timeseries(self, variable, start_date, end_date):
-        start = datetime.strptime(start_date, '%Y-%m-%d')
-        end = datetime.strptime(end_date, '%Y-%m-%d')
+    def _batch_rollup_from_monthly(self, variable, start_date, end_date, locations, aggregation):
+        """Batch seasonal/annual rollups; only the uncached months are fetched, batched across locations"""
+        months = month_starts(start_date, end_date)
+        cached = get_cached_climate_series(
+            [location['cache_key'] for location in locations], variable, start_date, end_date, 'monthly'
+        )
         
-        base_values = {
-            'temperature': 25,
-            'precipitation': 50,
-            'humidity': 60,
-            'wind_speed': 7
-        }
+        # Locations missing the same month range share one batch fetch for it
+        groups = {}
+        missing = {}
+        for location in locations:
+            missing[location['cache_key']] = [month for month in months if month not in cached[location['cache_key']]]
+            for month_range in month_ranges(missing[location['cache_key']]):
+                groups.setdefault(month_range, []).append(location)
         
-        seasonal_amplitude = {
-            'temperature': 8,
-            'precipitation': 40,
-            'humidity': 15,
-            'wind_speed': 3
-        }
+        for (range_start, range_end), group in groups.items():
+            fetched = self.extract_batch_timeseries(variable, range_start, range_end, group, 'monthly')
+            for location in group:
+                by_date = cached[location['cache_key']]
+                for date, value in zip(fetched['dates'], fetched['values'][location['id']]):
+                    by_date[date] = value
         
-        base = base_values.get(variable, 20)
-        amplitude = seasonal_amplitude.get(variable, 5)
+        # Months the dataset does not have yet are remembered briefly instead of refetched on every call
+        unavailable = [
+            (cache_key, variable, month, None)
+            for cache_key, months_missing in missing.items()
+            for month in months_missing if cached[cache_key].get(month) is None
+        ]
+        if unavailable:
+            cache_climate_data_bulk(unavailable, 'monthly')
         
-        data = []
-        current = start
+        dates = []
+        values = {}
+        for location in locations:
+            by_date = cached[location['cache_key']]
+            rolled = aggregate_monthly([{'date': month, 'value': by_date.get(month)} for month in months], aggregation)
+            dates = [d['date'] for d in rolled]
+            values[location['id']] = [d['value'] for d in rolled]
         
-        while current <= end:
-            month_factor = (current.month - 1) / 12 * 2 * 3.14159
-            seasonal_value = base + amplitude * (1 + random.uniform(-0.3, 0.3)) * \
-                           (1 if variable == 'temperature' else -1) * \
-                           (1 if current.month in [5, 6, 7, 8] else 0.5)
-            
-            if variable == 'precipitation':
-                if current.month in [7, 8, 9]:
-                    seasonal_value = base + amplitude * random.uniform(1.5, 2.5)
-                else:
-                    seasonal_value = base * random.uniform(0.3, 0.8)
-            
-            value = round(max(0, seasonal_value + random.uniform(-5, 5)), 2)
-            
-            data.append({
-                'date': current.strftime('%Y-%m-%d'),
-                'value': value
-            })
-            
-            if current.month == 12:
-                current = current.replace(year=current.year + 1, month=1)
-            else:
-                current = current.replace(month=current.month + 1)
+        return {'dates': dates, 'values': values}
+    
+    def generate_mock_batch_timeseries(self, variable, start_date, end_date, location_ids, aggregation='monthly'):
+        """Mock counterpart of extract_batch_timeseries with the same columnar layout"""
+        return mock_engine.batch_timeseries(location_ids, variable, start_date, end_date, aggregation)
+    
+    def generate_mock_zonal_stats(self, variable, date=None, names=None):
+        provinces = names or ['Punjab', 'Sindh', 'Khyber Pakhtunkhwa', 'Balochistan', 'Gilgit-Baltistan', 'Azad Kashmir']
+        return mock_engine.zonal_stats(variable, provinces, date)
+    
+    def generate_mock_heat_stress_inputs(self, year, month, grid):
+        """Mock counterpart of fetch_heat_stress_inputs with the same arrays"""
+        from modules.climate_indices import HeatStressCalculator
         
-        return data
+        fields = mock_engine.grid_fields(
+            ['temperature', 'humidity', 'wind_speed', 'solar_radiation'], f'{year}-{month:02d}', grid
+        )
+        
+        return {
+            'temperature': fields['temperature'],
+            'dewpoint': HeatStressCalculator.dewpoint_array(fields['temperature'], fields['humidity']),
+            'relative_humidity': fields['humidity'],
+            'wind_speed': fields['wind_speed'],
+            'solar_radiation': fields['solar_radiation']
+        }
+    
+    def generate_mock_timeseries(self, variable, start_date, end_date, location_id='pakistan_center', aggregation='monthly'):
+        return mock_engine.timeseries(location_id, variable, start_date, end_date, aggregation)
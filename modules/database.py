@@ -123,6 +123,24 @@ class ExtremeEvent(Base):
     )
 
 
+class IndexCoverage(Base):
+    """Date range the index pipeline has computed per location and index"""
+    __tablename__ = 'index_coverage'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    location_id = Column(String(50), nullable=False)
+    index_name = Column(String(50), nullable=False)  # climate_indices.index_name or extreme_events.event_type
+    
+    start_date = Column(DateTime, nullable=False)
+    end_date = Column(DateTime, nullable=False)
+    
+    computed_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_coverage_lookup', 'location_id', 'index_name', unique=True),
+    )
+
+
 class MLPrediction(Base):
     """Machine learning predictions and forecasts"""
     __tablename__ = 'ml_predictions'
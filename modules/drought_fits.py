@@ -0,0 +1,280 @@
+"""
+Persisted SPI/SPEI distribution fits with incremental scoring
+
+Each (location, index, timescale) record stores the fitted parameters for
+all twelve calendar months, the scored series and the trailing inputs of
+the current accumulation window. Months that arrive after the last scored
+one are appended in O(1) against the stored fits; the full history is only
+refitted when the record is older than Config.DROUGHT_REFIT_DAYS, the
+baseline period changes, or an earlier start date is requested. A fit
+always covers the whole baseline, whatever range the request asked for.
+
+The scored series is cached in calendar-year segments next to a small
+record head, so an append rewrites the head and the last year only. Scores
+of the open month and of recent months whose inputs were missing are
+provisional: the record keeps the window state from before the first of
+them, and the next request re-scores from there.
+"""
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from config import Config
+from modules.climate_indices import DroughtIndicator
+
+# Upper bound on in-process records (one per location, index and timescale)
+MAX_FIT_RECORDS = 4096
+
+# Records outlive the refit schedule so a stale fit can still be compared against
+FIT_TTL = 90 * 86400
+
+# Record fields cached as yearly segments rather than in the record head
+_SERIES_FIELDS = ('dates', 'values')
+
+
+def _month(date: str) -> pd.Timestamp:
+    return pd.Timestamp(date).to_period('M').to_timestamp()
+
+
+def _to_list(values) -> List[Optional[float]]:
+    return [None if np.isnan(v) else float(v) for v in np.asarray(values, dtype=np.float64)]
+
+
+def _to_array(values) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _first_provisional(labels: List[str], inputs: np.ndarray) -> int:
+    """
+    Index of the first month whose score may still change (len(labels) when none)
+    
+    Only the last Config.DROUGHT_PROVISIONAL_MONTHS months are considered, so
+    a month whose data never arrives eventually becomes final.
+    """
+    months = pd.DatetimeIndex(labels)
+    open_month = pd.Timestamp.now().to_period('M').to_timestamp()
+    recent = np.arange(len(months)) >= len(months) - Config.DROUGHT_PROVISIONAL_MONTHS
+    provisional = np.flatnonzero(recent & (np.isnan(inputs) | (months >= open_month)))
+    return int(provisional[0]) if len(provisional) else len(months)
+
+
+def _window_tail(inputs: np.ndarray, timescale: int) -> List[Optional[float]]:
+    """Trailing timescale - 1 inputs of an accumulation window, NaN-padded for short histories"""
+    if timescale <= 1:
+        return []
+    tail = np.full(timescale - 1, np.nan)
+    recent = inputs[max(len(inputs) - (timescale - 1), 0):]
+    tail[len(tail) - len(recent):] = recent
+    return _to_list(tail)
+
+
+class DroughtFitStore:
+    """Cache-backed SPI/SPEI fits, keyed by location, index and timescale"""
+    
+    INDEX_TYPES = ('spi', 'spei')
+    
+    def __init__(self, cache=None):
+        self.cache = cache
+        self._records: Dict[str, Dict] = {}
+    
+    @staticmethod
+    def _key(location_id: str, index_type: str, timescale: int) -> str:
+        return f'drought_fit:{index_type}:{timescale}:{location_id}'
+    
+    @staticmethod
+    def _segment_key(key: str, year: int) -> str:
+        return f'{key}:{year}'
+    
+    def _remember(self, key: str, record: Dict):
+        if key not in self._records and len(self._records) >= MAX_FIT_RECORDS:
+            self._records.pop(next(iter(self._records)))
+        self._records[key] = record
+    
+    def _get(self, key: str) -> Optional[Dict]:
+        if key in self._records:
+            return self._records[key]
+        if self.cache is None:
+            return None
+        
+        head = self.cache.get(key)
+        if head is None or 'n_months' not in head:
+            return None
+        
+        dates = pd.date_range(head['start'], periods=head['n_months'], freq='MS')
+        values = []
+        for year in range(dates[0].year, dates[-1].year + 1):
+            segment = self.cache.get(self._segment_key(key, year))
+            if segment is None:
+                return None
+            values.extend(segment)
+        if len(values) != len(dates):
+            # A segment from another write is still missing; refit rather than mix them
+            return None
+        
+        record = {name: value for name, value in head.items() if name not in ('start', 'n_months')}
+        record.update(dates=list(dates.strftime('%Y-%m-%d')), values=values)
+        self._remember(key, record)
+        return record
+    
+    def _put(self, key: str, record: Dict, changed_from: int = 0):
+        """Keep a record and cache its head plus the yearly segments from changed_from on"""
+        self._remember(key, record)
+        if self.cache is None:
+            return
+        
+        years = pd.DatetimeIndex(record['dates']).year
+        for year in np.unique(years[changed_from:]):
+            rows = np.flatnonzero(years == year)
+            self.cache.set(self._segment_key(key, year),
+                           record['values'][rows[0]:rows[-1] + 1], ttl=FIT_TTL)
+        
+        head = {name: value for name, value in record.items() if name not in _SERIES_FIELDS}
+        head.update(start=record['dates'][0], n_months=len(record['dates']))
+        self.cache.set(key, head, ttl=FIT_TTL)
+    
+    def _is_stale(self, record: Dict, history_start: pd.Timestamp) -> bool:
+        fitted_at = datetime.fromisoformat(record['fitted_at'])
+        return (
+            record['baseline'] != Config.DROUGHT_BASELINE
+            or datetime.now() - fitted_at > timedelta(days=Config.DROUGHT_REFIT_DAYS)
+            or _month(record['dates'][0]) > history_start
+            # Params fitted on part of the baseline would score every later month differently
+            or _month(record.get('fitted_through', record['dates'][0])) < _month(Config.DROUGHT_BASELINE['end'])
+        )
+    
+    def series(self, location_id: str, index_type: str, timescale: int, start_date: str, end_date: str,
+               load_inputs: Callable[[str, str], Tuple[List[str], np.ndarray]]) -> Tuple[List[str], np.ndarray]:
+        """
+        Drought index series up to end_date, refitting only when needed
+        
+        Args:
+            location_id: Location identifier
+            index_type: 'spi' or 'spei'
+            timescale: Accumulation period in months
+            start_date: Earliest date the caller needs (YYYY-MM-DD)
+            end_date: Last date to score (YYYY-MM-DD)
+            load_inputs: Callable (start, end) -> (month labels, values) returning
+                         gap-free monthly precipitation (SPI) or water balance (SPEI)
+        
+        Returns:
+            Tuple of (month labels, index values) covering at least
+            [start_date, end_date]
+        """
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"Unsupported drought index: {index_type}")
+        
+        key = self._key(location_id, index_type, timescale)
+        record = self._get(key)
+        
+        history_start = min(_month(Config.DROUGHT_BASELINE['start']), _month(start_date))
+        
+        if record is None or self._is_stale(record, history_start):
+            # Always fit on the whole baseline, whatever range the first request asked for
+            fit_end = max(pd.Timestamp(end_date), pd.Timestamp(Config.DROUGHT_BASELINE['end']))
+            labels, inputs = load_inputs(history_start.strftime('%Y-%m-%d'), fit_end.strftime('%Y-%m-%d'))
+            record = self.fit(index_type, timescale, labels, inputs)
+            if not record['dates']:
+                return [], np.array([])
+            self._put(key, record)
+        else:
+            # Provisional months are dropped and scored again with the inputs now available
+            pending = record.get('pending', len(record['dates']))
+            if pending < len(record['dates']):
+                restart = _month(record['dates'][pending])
+            else:
+                restart = _month(record['dates'][-1]) + pd.offsets.MonthBegin(1)
+            
+            if restart <= _month(end_date):
+                labels, inputs = load_inputs(restart.strftime('%Y-%m-%d'), end_date)
+                if len(labels):
+                    del record['dates'][pending:], record['values'][pending:]
+                    self.append(record, labels, inputs)
+                    self._put(key, record, changed_from=pending)
+        
+        return record['dates'], _to_array(record['values'])
+    
+    def fit(self, index_type: str, timescale: int, labels: List[str], inputs: np.ndarray) -> Dict:
+        """
+        Fit per-calendar-month parameters on the baseline and score the full history
+        
+        Args:
+            index_type: 'spi' or 'spei'
+            timescale: Accumulation period in months
+            labels: Gap-free month-start labels of the inputs
+            inputs: Monthly precipitation (SPI) or water balance (SPEI)
+        
+        Returns:
+            Record holding params, the scored series, the window tail and
+            the index of the first provisional month ('pending')
+        """
+        inputs = np.asarray(inputs, dtype=np.float64)
+        months = pd.DatetimeIndex(labels)
+        accumulated = DroughtIndicator.accumulate_windows(inputs[None, :], [timescale])[timescale]
+        
+        baseline = (months >= _month(Config.DROUGHT_BASELINE['start'])) & \
+                   (months <= pd.Timestamp(Config.DROUGHT_BASELINE['end']))
+        by_month = DroughtIndicator._by_calendar_month(
+            np.where(baseline, accumulated, np.nan), int(months[0].month) if len(months) else 1
+        )
+        
+        if index_type == 'spi':
+            alpha, beta, q = DroughtIndicator.fit_gamma(by_month, axis=1)
+            params = {'alpha': _to_list(alpha[0]), 'beta': _to_list(beta[0]), 'q': _to_list(q[0])}
+        else:
+            mean, std = DroughtIndicator.fit_normal(by_month, axis=1)
+            params = {'mean': _to_list(mean[0]), 'std': _to_list(std[0])}
+        
+        record = {
+            'index_type': index_type,
+            'timescale': timescale,
+            'baseline': dict(Config.DROUGHT_BASELINE),
+            'fitted_at': datetime.now().isoformat(),
+            'fitted_through': months[-1].strftime('%Y-%m-%d') if len(months) else None,
+            'params': params,
+            'dates': list(months.strftime('%Y-%m-%d')),
+            'values': _to_list(self._score(params, index_type, accumulated[0], months.month - 1))
+        }
+        
+        # Window state as of the first provisional month, where the next append resumes
+        pending = _first_provisional(labels, inputs)
+        record.update(pending=pending, tail=_window_tail(inputs[:pending], timescale))
+        return record
+    
+    def append(self, record: Dict, labels: List[str], inputs: np.ndarray):
+        """
+        Score new months against the stored fits, one constant-time step per month
+        
+        Args:
+            record: Record returned by fit (updated in place)
+            labels: Month-start labels following the record's last final month
+            inputs: Monthly precipitation (SPI) or water balance (SPEI)
+        """
+        inputs = np.asarray(inputs, dtype=np.float64)
+        tail = _to_array(record['tail'])
+        timescale = record['timescale']
+        pending = _first_provisional(labels, inputs)
+        
+        for i, (label, value) in enumerate(zip(labels, inputs)):
+            if i == pending:
+                record['tail'] = _to_list(tail) if timescale > 1 else []
+            window = tail.sum() + value if timescale > 1 else value
+            calendar_month = pd.Timestamp(label).month - 1
+            
+            score = self._score(record['params'], record['index_type'], np.array([window]), calendar_month)
+            record['dates'].append(pd.Timestamp(label).strftime('%Y-%m-%d'))
+            record['values'].extend(_to_list(score))
+            
+            if timescale > 1:
+                tail = np.append(tail[1:], value)
+        
+        if pending == len(labels):
+            record['tail'] = _to_list(tail) if timescale > 1 else []
+        record['pending'] = len(record['dates']) - len(labels) + pending
+    
+    @staticmethod
+    def _score(params: Dict, index_type: str, windows: np.ndarray, calendar_months) -> np.ndarray:
+        params = {name: _to_array(values)[calendar_months] for name, values in params.items()}
+        
+        if index_type == 'spi':
+            return DroughtIndicator.gamma_spi(windows, params['alpha'], params['beta'], params['q'])
+        return DroughtIndicator.normal_spei(windows, params['mean'], params['std'])
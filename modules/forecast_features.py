@@ -0,0 +1,134 @@
+"""
+Columnar lag-feature construction for the climate forecaster
+
+Series are handled as epoch months (months since 1970-01) plus float
+values. They are laid out on a gap-free monthly axis, so a missing month
+stays a NaN in its own slot instead of shifting later values onto the
+wrong dates. Lags and trailing rolling means are shifted views of one
+NaN-padded array, and any row that touches a gap is masked out. One call
+builds the training set for a single series or for many locations at once.
+"""
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+# Default design: lag-1/3/6 values plus month of year
+DEFAULT_LAGS = (1, 3, 6)
+
+
+def epoch_months(dates) -> np.ndarray:
+    """Months since 1970-01 for ISO date strings or datetime64 values"""
+    return np.asarray(dates, dtype='datetime64[M]').astype(np.int64)
+
+
+def month_dates(months) -> List[str]:
+    """First-of-month ISO dates for epoch months"""
+    return np.asarray(months, dtype=np.int64).astype('datetime64[M]').astype('datetime64[D]').astype(str).tolist()
+
+
+def series_arrays(timeseries_data: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """Columnar (epoch months, values) from [{'date', 'value'}] records; None becomes NaN"""
+    months = epoch_months([d['date'] for d in timeseries_data])
+    values = np.array([np.nan if d['value'] is None else d['value'] for d in timeseries_data], dtype=np.float64)
+    return months, values
+
+
+def regularize(months: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Place values on a gap-free monthly axis
+    
+    Args:
+        months: Epoch months of the columns (any order, no duplicates)
+        values: Values of shape (T,) or (locations, T)
+    
+    Returns:
+        Tuple of (consecutive epoch months, values with NaN in missing months)
+    """
+    months = np.asarray(months, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if not len(months):
+        return months, values
+    
+    axis = np.arange(months.min(), months.max() + 1)
+    regular = np.full(values.shape[:-1] + (len(axis),), np.nan)
+    regular[..., months - axis[0]] = values
+    return axis, regular
+
+
+def feature_names(lags: Sequence[int] = DEFAULT_LAGS, rolling: Sequence[int] = (),
+                  include_month: bool = True) -> List[str]:
+    names = [f'lag_{lag}_month' for lag in lags] + [f'rolling_mean_{window}_month' for window in rolling]
+    return names + (['month_of_year'] if include_month else [])
+
+
+def _feature_stack(months: np.ndarray, values: np.ndarray, lags: Sequence[int],
+                   rolling: Sequence[int], include_month: bool) -> np.ndarray:
+    """Features for every column, shape (locations, T, F); column t uses values before t"""
+    n_steps = values.shape[-1]
+    depth = max(list(lags) + list(rolling) + [1])
+    padded = np.concatenate([np.full(values.shape[:-1] + (depth,), np.nan), values], axis=-1)
+    
+    # Value at t - lag is column depth + t - lag of the padded array
+    columns = [padded[..., depth - lag:depth - lag + n_steps] for lag in lags]
+    
+    for window in rolling:
+        windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=-1)
+        # Window ending at t - 1 starts at padded column depth + t - window
+        columns.append(windows[..., depth - window:depth - window + n_steps, :].mean(axis=-1))
+    
+    if include_month:
+        month_of_year = (months % 12 + 1).astype(np.float64)
+        columns.append(np.broadcast_to(month_of_year, values.shape))
+    
+    return np.stack(columns, axis=-1)
+
+
+def build_lag_features(months, values, lags: Sequence[int] = DEFAULT_LAGS, rolling: Sequence[int] = (),
+                       include_month: bool = True, min_history: Optional[int] = None):
+    """
+    Training matrix of lagged values, trailing means and month of year
+    
+    Args:
+        months: Epoch months of the columns (gaps allowed)
+        values: Values of shape (T,) or (locations, T); NaN marks a gap
+        lags: Lags in months
+        rolling: Window lengths (months) of trailing means ending one month back
+        include_month: Append the month of year (1-12) of the target
+        min_history: Skip the first min_history months of every series
+                     (default: the longest lag or window)
+    
+    Returns:
+        Tuple of (X of shape (rows, features), y, row locations, row epoch months),
+        keeping only rows whose target and features are all present
+    """
+    months, values = regularize(months, values)
+    values = np.atleast_2d(values)
+    if not len(months):
+        n_features = len(feature_names(lags, rolling, include_month))
+        return np.empty((0, n_features)), np.empty(0), np.empty(0, dtype=np.int64), months
+    
+    features = _feature_stack(months, values, lags, rolling, include_month)
+    
+    depth = max(list(lags) + list(rolling) + [1]) if min_history is None else min_history
+    valid = np.isfinite(values) & np.isfinite(features).all(axis=-1)
+    valid[:, :depth] = False
+    
+    rows, columns = np.nonzero(valid)
+    return features[rows, columns], values[rows, columns], rows, months[columns]
+
+
+def next_features(months, values, lags: Sequence[int] = DEFAULT_LAGS, rolling: Sequence[int] = (),
+                  include_month: bool = True) -> Tuple[np.ndarray, int]:
+    """
+    Feature rows for the month after the last one of each series
+    
+    Returns:
+        Tuple of (features of shape (locations, F), epoch month being predicted);
+        a row holds NaN where its lags fall into a gap
+    """
+    months, values = regularize(months, values)
+    values = np.atleast_2d(values)
+    target = int(months[-1]) + 1
+    
+    extended = np.concatenate([values, np.full((values.shape[0], 1), np.nan)], axis=-1)
+    features = _feature_stack(np.append(months, target), extended, lags, rolling, include_month)
+    return features[:, -1], target
@@ -86,7 +86,7 @@ class GeeMapHelper:
             geojson_data = json.load(f)
             
             var_config = Config.CLIMATE_VARIABLES.get(variable, {})
-            mock_data = self.data_fetcher.generate_mock_zonal_stats(variable)
+            mock_data = self.data_fetcher.generate_mock_zonal_stats(variable, f'{year}-{month:02d}')
             
             def style_function(feature):
                 province_name = feature['properties'].get('name', '')
@@ -0,0 +1,464 @@
+"""
+Batch computation and storage of climate indices
+
+Computes heat stress (heat index, WBGT, humidex), SPI/SPEI/PDSI and
+percentile-exceedance events for every location over a recent period and
+bulk-inserts them, with their severity classes, into the climate_indices
+and extreme_events tables. index_coverage records which range each
+(location, index) pair holds, so endpoints can answer with one indexed
+query and fall back to computing on a miss.
+
+Run nightly, e.g. from cron:
+    
+    python -m modules.index_pipeline --days 730
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from config import Config
+from modules.cache import cache
+from modules.mock_data import mock_engine
+from modules.climate_indices import HeatStressCalculator, DroughtIndicator, ExtremeEventAnalyzer
+from modules.drought_fits import DroughtFitStore
+from modules.climatology import lookup_thresholds
+from modules.extreme_value import block_maxima, fit_lmoments
+from modules.classification import DROUGHT, EVENT_SEVERITY, HEAT_STRESS
+
+try:
+    from modules.database import SessionLocal, ClimateIndex, ExtremeEvent, IndexCoverage, check_database_connection
+    INDEX_STORE_AVAILABLE = check_database_connection()
+except Exception:
+    INDEX_STORE_AVAILABLE = False
+    print("Index store not available, indices will be computed on request")
+
+# Minimum run length per variable, matching the extreme-events endpoint
+EVENT_MIN_DURATION = {'temperature': 3}
+
+drought_fits = DroughtFitStore(cache)
+
+
+def index_name(index_type: str, timescale: int = None) -> str:
+    """Stored name of an index, e.g. 'spi_3' or 'heat_index'"""
+    return f'{index_type}_{timescale}' if index_type in DroughtFitStore.INDEX_TYPES else index_type
+
+
+def event_name(variable: str) -> str:
+    """Stored event type for a variable's percentile exceedances"""
+    if variable == 'temperature':
+        return 'heatwave'
+    return f'{variable}_p{Config.CLIMATOLOGY_PERCENTILES[variable]}'
+
+
+def _month(date) -> pd.Timestamp:
+    return pd.Timestamp(date).to_period('M').to_timestamp()
+
+
+# ============================================
+# COMPUTATION
+# ============================================
+
+def heat_stress_inputs(location_ids: List[str], start_date: str, end_date: str) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """
+    Monthly heat stress inputs for many locations
+    
+    Returns:
+        Tuple of (month labels, arrays of shape (locations, months) keyed as
+        HeatStressCalculator.heat_stress_array expects)
+    """
+    labels, temperature = mock_engine.generate(location_ids, 'temperature', start_date, end_date)
+    inputs = {'temperature': temperature}
+    for key, variable in (('relative_humidity', 'humidity'), ('wind_speed', 'wind_speed'),
+                          ('solar_radiation', 'solar_radiation')):
+        inputs[key] = mock_engine.generate(location_ids, variable, start_date, end_date)[1]
+    inputs['dewpoint'] = HeatStressCalculator.dewpoint_array(temperature, inputs['relative_humidity'])
+    return labels, inputs
+
+
+def _drought_input_arrays(location_ids: List[str], index_type: str, start: str,
+                          end: str) -> Tuple[List[str], np.ndarray]:
+    """Monthly precipitation (SPI) or water balance (SPEI) of shape (locations, months)"""
+    month_labels, precipitation = mock_engine.generate(location_ids, 'precipitation', start, end)
+    if index_type == 'spei':
+        _, evapotranspiration = mock_engine.generate(location_ids, 'evapotranspiration', start, end)
+        return month_labels, precipitation - evapotranspiration
+    return month_labels, precipitation
+
+
+def drought_inputs(location_id: str, index_type: str) -> Callable[[str, str], Tuple[List[str], np.ndarray]]:
+    """Loader of monthly precipitation (SPI) or water balance (SPEI) for DroughtFitStore.series"""
+    def load_inputs(start, end):
+        month_labels, values = _drought_input_arrays([location_id], index_type, start, end)
+        return month_labels, values[0]
+    
+    return load_inputs
+
+
+def batch_drought_inputs(location_ids: List[str], index_type: str) -> Dict[str, Callable]:
+    """
+    drought_inputs loaders for many locations that share one read per range
+    
+    Locations scored in the same run nearly always ask for the same months
+    (a full history on refit, or the months since the last run), so each
+    distinct range is loaded once for every location and sliced per row.
+    """
+    loaded = {}
+    
+    def loader(row):
+        def load_inputs(start, end):
+            if (start, end) not in loaded:
+                loaded[(start, end)] = _drought_input_arrays(location_ids, index_type, start, end)
+            month_labels, values = loaded[(start, end)]
+            return month_labels, values[row]
+        return load_inputs
+    
+    return {location_id: loader(row) for row, location_id in enumerate(location_ids)}
+
+
+def _index_rows(location_ids: List[str], dates, name: str, category: str,
+                values: np.ndarray, classifier) -> List[Dict]:
+    """climate_indices rows for every non-missing (location, date) value"""
+    dates = pd.DatetimeIndex(dates).to_pydatetime()
+    rows, columns = np.nonzero(~np.isnan(values))
+    codes = classifier.codes(values)
+    labels = classifier.labels
+    return [
+        {
+            'location_id': location_ids[r],
+            'index_name': name,
+            'date': dates[c],
+            'value': float(values[r, c]),
+            'category': category,
+            'severity': labels[codes[r, c]]
+        }
+        for r, c in zip(rows, columns)
+    ]
+
+
+def compute_heat_stress(location_ids: List[str], start_date: str, end_date: str) -> Dict[str, List[Dict]]:
+    """Monthly heat index, WBGT and humidex rows for every location, keyed by index name"""
+    labels, inputs = heat_stress_inputs(location_ids, start_date, end_date)
+    
+    results = {}
+    for index_type, classifier in HEAT_STRESS.items():
+        values = HeatStressCalculator.heat_stress_array(index_type, inputs)
+        results[index_type] = _index_rows(location_ids, labels, index_type, 'heat_stress', values, classifier)
+    
+    return results
+
+
+def compute_drought(location_ids: List[str], start_date: str, end_date: str,
+                    timescales=None) -> Dict[str, List[Dict]]:
+    """
+    SPI/SPEI at every timescale and PDSI rows for every location, keyed by index name
+    
+    SPI/SPEI go through the persisted per-calendar-month fits, so a nightly
+    run only scores the months added since the previous one. Fits are kept
+    per location and scored location by location, but their inputs are
+    read once per index type for all locations (batch_drought_inputs). PDSI
+    is computed for all locations in one batched pass.
+    """
+    timescales = timescales or Config.INDEX_PIPELINE_TIMESCALES
+    first_month = _month(start_date)
+    
+    results = {}
+    for index_type in DroughtFitStore.INDEX_TYPES:
+        loaders = batch_drought_inputs(location_ids, index_type)
+        for timescale in timescales:
+            name = index_name(index_type, timescale)
+            results[name] = []
+            for location_id in location_ids:
+                month_labels, values = drought_fits.series(
+                    location_id, index_type, timescale, start_date, end_date, loaders[location_id]
+                )
+                dates = pd.DatetimeIndex(month_labels)
+                in_range = (dates >= first_month) & (dates <= pd.Timestamp(end_date))
+                values = values[in_range][None, :]
+                results[name].extend(_index_rows(
+                    [location_id], dates[in_range], name, 'drought', values, DROUGHT
+                ))
+    
+    month_labels, precipitation = mock_engine.generate(location_ids, 'precipitation', start_date, end_date)
+    temperature = mock_engine.generate(location_ids, 'temperature', start_date, end_date)[1]
+    values = DroughtIndicator.palmer_drought_severity_index(temperature, precipitation)
+    results['palmer_drought'] = _index_rows(
+        location_ids, month_labels, 'palmer_drought', 'drought', values, DROUGHT
+    )
+    
+    return results
+
+
+def _baseline_fits(location_ids: List[str], variable: str) -> Dict[str, np.ndarray]:
+    """Gumbel fits of annual maxima over the climatology baseline"""
+    baseline = Config.CLIMATOLOGY_BASELINE
+    labels, values = mock_engine.generate(location_ids, variable, baseline['start'], baseline['end'], 'daily')
+    _, maxima = block_maxima(values, labels)
+    return fit_lmoments(maxima, 'gumbel')
+
+
+def compute_events(location_ids: List[str], start_date: str, end_date: str) -> Dict[str, List[Dict]]:
+    """
+    Calendar-day percentile exceedance events for every location, keyed by event type
+    
+    Each event's return period is the Gumbel return period of its peak over
+    the baseline annual maxima, and its severity follows EVENT_SEVERITY.
+    """
+    dates = pd.date_range(start_date, end_date, freq='D')
+    
+    results = {}
+    for variable, percentile in Config.CLIMATOLOGY_PERCENTILES.items():
+        def load_daily(ids, start, end):
+            return mock_engine.generate(ids, variable, start, end, 'daily')
+        
+        values = load_daily(location_ids, start_date, end_date)[1]
+        thresholds = lookup_thresholds(location_ids, variable, percentile, dates, load_daily)
+        events = ExtremeEventAnalyzer.detect_events(
+            values, thresholds, 'above', EVENT_MIN_DURATION.get(variable, 1)
+        )
+        
+        params = _baseline_fits(location_ids, variable)
+        rows = events['location']
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            reduced = (events['peak'] - params['loc'][rows]) / params['scale'][rows]
+            return_periods = 1 / -np.expm1(-np.exp(-reduced))
+        severities = EVENT_SEVERITY.decode(EVENT_SEVERITY.codes(return_periods))
+        
+        name = event_name(variable)
+        results[name] = [
+            {
+                'location_id': location_ids[rows[i]],
+                'event_type': name,
+                'start_date': dates[events['start'][i]].to_pydatetime(),
+                'end_date': dates[events['end'][i]].to_pydatetime(),
+                'peak_value': float(events['peak'][i]),
+                'duration_days': int(events['duration'][i]),
+                'severity': severities[i],
+                'return_period_years': None if np.isnan(return_periods[i]) else float(return_periods[i])
+            }
+            for i in range(len(rows))
+        ]
+    
+    return results
+
+
+# ============================================
+# STORAGE
+# ============================================
+
+def _update_coverage(db, location_ids: List[str], names: List[str], start: datetime, end: datetime,
+                     step: pd.DateOffset):
+    """
+    Extend coverage records the new range overlaps or abuts, replace disjoint ones
+    
+    step is the spacing of the stored rows (a month for monthly indices, a
+    day for events): a range starting one step after a record's end extends
+    it, anything further apart would claim the gap as covered.
+    """
+    existing = {
+        (record.location_id, record.index_name): record
+        for record in db.query(IndexCoverage).filter(
+            IndexCoverage.location_id.in_(location_ids),
+            IndexCoverage.index_name.in_(names)
+        )
+    }
+    
+    for location_id in location_ids:
+        for name in names:
+            record = existing.get((location_id, name))
+            if record is None:
+                db.add(IndexCoverage(location_id=location_id, index_name=name, start_date=start, end_date=end))
+            elif record.start_date <= end + step and record.end_date + step >= start:
+                record.start_date = min(record.start_date, start)
+                record.end_date = max(record.end_date, end)
+            else:
+                record.start_date, record.end_date = start, end
+
+
+def store_rows(model, results: Dict[str, List[Dict]], location_ids: List[str],
+               start: datetime, end: datetime) -> int:
+    """
+    Replace a model's rows for the locations, names and range with new ones
+    
+    Args:
+        model: ClimateIndex or ExtremeEvent
+        results: Rows keyed by index name / event type
+        location_ids: Locations the rows were computed for
+        start: Start of the computed range
+        end: End of the computed range
+    
+    Returns:
+        Number of rows inserted
+    """
+    names = list(results)
+    rows = [row for name_rows in results.values() for row in name_rows]
+    
+    db = SessionLocal()
+    try:
+        if model is ClimateIndex:
+            stale = db.query(ClimateIndex).filter(
+                ClimateIndex.location_id.in_(location_ids),
+                ClimateIndex.index_name.in_(names),
+                ClimateIndex.date >= start,
+                ClimateIndex.date <= end
+            )
+        else:
+            stale = db.query(ExtremeEvent).filter(
+                ExtremeEvent.location_id.in_(location_ids),
+                ExtremeEvent.event_type.in_(names),
+                ExtremeEvent.end_date >= start,
+                ExtremeEvent.start_date <= end
+            )
+        stale.delete(synchronize_session=False)
+        
+        batch_size = Config.INDEX_PIPELINE_BATCH_SIZE
+        for i in range(0, len(rows), batch_size):
+            db.bulk_insert_mappings(model, rows[i:i + batch_size])
+        
+        step = pd.DateOffset(months=1) if model is ClimateIndex else pd.DateOffset(days=1)
+        _update_coverage(db, location_ids, names, start, end, step)
+        db.commit()
+        return len(rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def run_pipeline(location_ids: List[str], start_date: str, end_date: str, timescales=None) -> Dict[str, int]:
+    """
+    Compute and store every index for the locations and period
+    
+    Returns:
+        Number of rows stored per table
+    """
+    first_month, last_month = _month(start_date).to_pydatetime(), _month(end_date).to_pydatetime()
+    
+    indices = compute_heat_stress(location_ids, start_date, end_date)
+    indices.update(compute_drought(location_ids, start_date, end_date, timescales))
+    events = compute_events(location_ids, start_date, end_date)
+    
+    return {
+        'climate_indices': store_rows(ClimateIndex, indices, location_ids, first_month, last_month),
+        'extreme_events': store_rows(
+            ExtremeEvent, events, location_ids,
+            pd.Timestamp(start_date).to_pydatetime(), pd.Timestamp(end_date).to_pydatetime()
+        )
+    }
+
+
+# ============================================
+# READS
+# ============================================
+
+def _covered(db, location_id: str, name: str, start: datetime, end: datetime) -> bool:
+    record = db.query(IndexCoverage).filter(
+        IndexCoverage.location_id == location_id,
+        IndexCoverage.index_name == name
+    ).first()
+    return record is not None and record.start_date <= start and record.end_date >= end
+
+
+def stored_indices(location_id: str, name: str, start_date: str, end_date: str,
+                   monthly: bool = True) -> Optional[List[Tuple[datetime, float, str]]]:
+    """
+    Stored index values for a range, or None when the pipeline has not covered it
+    
+    Args:
+        location_id: Location identifier
+        name: Stored index name (see index_name)
+        start_date: Start date (YYYY-MM-DD or YYYY-MM)
+        end_date: End date (YYYY-MM-DD or YYYY-MM)
+        monthly: Compare whole months, as monthly indices are stored on month starts
+    
+    Returns:
+        List of (date, value, severity) ordered by date
+    """
+    if not INDEX_STORE_AVAILABLE:
+        return None
+    
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    if monthly:
+        start, end = _month(start), _month(end)
+    start, end = start.to_pydatetime(), end.to_pydatetime()
+    
+    db = SessionLocal()
+    try:
+        if not _covered(db, location_id, name, start, end):
+            return None
+        return db.query(ClimateIndex.date, ClimateIndex.value, ClimateIndex.severity).filter(
+            ClimateIndex.location_id == location_id,
+            ClimateIndex.index_name == name,
+            ClimateIndex.date >= start,
+            ClimateIndex.date <= end
+        ).order_by(ClimateIndex.date).all()
+    except Exception as e:
+        print(f"Index store read failed: {e}")
+        return None
+    finally:
+        db.close()
+
+
+def stored_events(location_id: str, event_type: str, start_date: str, end_date: str) -> Optional[List[Dict]]:
+    """
+    Stored events inside a range in the events_to_records layout, or None when not covered
+    
+    The events table has no mean value column; callers holding the series
+    add 'mean_value' themselves.
+    """
+    if not INDEX_STORE_AVAILABLE:
+        return None
+    
+    start, end = pd.Timestamp(start_date).to_pydatetime(), pd.Timestamp(end_date).to_pydatetime()
+    
+    db = SessionLocal()
+    try:
+        if not _covered(db, location_id, event_type, start, end):
+            return None
+        events = db.query(ExtremeEvent).filter(
+            ExtremeEvent.location_id == location_id,
+            ExtremeEvent.event_type == event_type,
+            ExtremeEvent.start_date >= start,
+            ExtremeEvent.end_date <= end
+        ).order_by(ExtremeEvent.start_date).all()
+        return [
+            {
+                'start_date': event.start_date.strftime('%Y-%m-%d'),
+                'end_date': event.end_date.strftime('%Y-%m-%d'),
+                'duration_days': event.duration_days,
+                'peak_value': event.peak_value,
+                'event_type': event_type
+            }
+            for event in events
+        ]
+    except Exception as e:
+        print(f"Index store read failed: {e}")
+        return None
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    from modules.spatial_processor import SpatialProcessor
+    
+    parser = argparse.ArgumentParser(description='Compute and store climate indices for all locations')
+    parser.add_argument('--level', type=int, action='append', help='Administrative level (repeatable, default: all)')
+    parser.add_argument('--days', type=int, default=Config.INDEX_PIPELINE_LOOKBACK_DAYS, help='Days back from --end')
+    parser.add_argument('--end', default=None, help='End date (YYYY-MM-DD, default: today)')
+    args = parser.parse_args()
+    
+    if not INDEX_STORE_AVAILABLE:
+        raise SystemExit("Index store database is not reachable")
+    
+    end_date = args.end or datetime.now().strftime('%Y-%m-%d')
+    start_date = (pd.Timestamp(end_date) - pd.Timedelta(days=args.days)).strftime('%Y-%m-%d')
+    
+    spatial_processor = SpatialProcessor()
+    for level in args.level or spatial_processor.get_levels():
+        location_ids = [feature['properties']['id'] for feature in spatial_processor.get_boundaries(level)['features']]
+        if not location_ids:
+            continue
+        counts = run_pipeline(location_ids, start_date, end_date)
+        print(f"Level {level}: {len(location_ids)} locations, {counts['climate_indices']} indices, "
+              f"{counts['extreme_events']} events ({start_date} to {end_date})")
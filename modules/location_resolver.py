@@ -0,0 +1,113 @@
+"""
+Resolve location identifiers to extraction geometries
+
+A location_id is either an administrative unit id (extracted as the polygon
+mean) or a point written as "lat,lon" / "point:lat,lon" (extracted from the
+nearest grid cell). Points are snapped to the centre of their ERA5 cell, so
+every point inside the same cell shares one cache key; points outside the
+grid do not resolve.
+"""
+import re
+from typing import Dict, Optional
+from config import Config
+from modules.zonal_weights import GridSpec
+
+_POINT_PATTERN = re.compile(r'^(?:point:)?\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+# Upper bound on in-process resolved locations (arbitrary points are unbounded)
+MAX_RESOLVED_LOCATIONS = 4096
+
+
+class LocationResolver:
+    """Map location ids to polygon or grid-cell geometries, with caching"""
+    
+    def __init__(self, spatial_processor, cache=None):
+        self.spatial_processor = spatial_processor
+        self.cache = cache
+        self._resolved: Dict[str, Dict] = {}
+        self._grids: Dict[float, GridSpec] = {}
+    
+    def _grid(self, aggregation: str) -> GridSpec:
+        """Grid index for the dataset behind an aggregation (0.1° ERA5-Land, 0.25° ERA5)"""
+        agg_config = Config.AGGREGATION_TYPES.get(aggregation, Config.AGGREGATION_TYPES['monthly'])
+        resolution = agg_config.get('resolution', Config.ERA5_GRID_RESOLUTION)
+        
+        if resolution not in self._grids:
+            self._grids[resolution] = GridSpec(resolution)
+        return self._grids[resolution]
+    
+    def resolve(self, location_id: str, aggregation: str = 'monthly') -> Optional[Dict]:
+        """
+        Resolve a location id to its extraction geometry
+        
+        Args:
+            location_id: Administrative unit id, or "lat,lon" for a point
+            aggregation: Aggregation type, which selects the dataset grid
+        
+        Returns:
+            Dictionary with 'type' ('polygon' or 'point'), GeoJSON 'geometry'
+            and a 'cache_key' identifying the extracted series, or None if
+            the location is unknown
+        """
+        grid = self._grid(aggregation)
+        memo_key = f'{location_id}:{grid.resolution}'
+        
+        if memo_key in self._resolved:
+            return self._resolved[memo_key]
+        
+        cache_key = f'location:{memo_key}'
+        resolved = self.cache.get(cache_key) if self.cache is not None else None
+        
+        if resolved is None:
+            resolved = self._resolve_uncached(location_id, grid)
+            if resolved is None:
+                return None
+            if self.cache is not None:
+                # Geometries rarely change, cache for 1 week
+                self.cache.set(cache_key, resolved, ttl=604800)
+        
+        if len(self._resolved) >= MAX_RESOLVED_LOCATIONS:
+            self._resolved.pop(next(iter(self._resolved)))
+        self._resolved[memo_key] = resolved
+        return resolved
+    
+    def _resolve_uncached(self, location_id: str, grid: GridSpec) -> Optional[Dict]:
+        if location_id == 'pakistan_center':
+            return self._resolve_point(location_id, Config.PAKISTAN_CENTER['lat'], Config.PAKISTAN_CENTER['lon'], grid)
+        
+        match = _POINT_PATTERN.match(location_id)
+        if match:
+            return self._resolve_point(location_id, float(match.group(1)), float(match.group(2)), grid)
+        
+        unit = self.spatial_processor.get_unit(location_id)
+        if unit is None or unit['geometry'] is None:
+            return None
+        
+        return {
+            'id': location_id,
+            'type': 'polygon',
+            'name': unit['name'],
+            'level': unit['level'],
+            'geometry': unit['geometry'],
+            'cache_key': location_id
+        }
+    
+    def _resolve_point(self, location_id: str, lat: float, lon: float, grid: GridSpec) -> Optional[Dict]:
+        pixel = int(grid.nearest_index(lon, lat))
+        if pixel < 0:
+            # Outside the dataset grid; snapping to an edge cell would return another place's data
+            return None
+        
+        row, col = divmod(pixel, grid.nx)
+        cell_lon = float(grid.lon_centers()[col])
+        cell_lat = float(grid.lat_centers()[row])
+        
+        return {
+            'id': location_id,
+            'type': 'point',
+            'lat': lat,
+            'lon': lon,
+            'pixel': pixel,
+            'geometry': {'type': 'Point', 'coordinates': [round(cell_lon, 4), round(cell_lat, 4)]},
+            'cache_key': f'cell_{grid.resolution}_{pixel}'
+        }
@@ -1,165 +1,304 @@
 import numpy as np
-from datetime import datetime, timedelta
+from scipy import special
 from sklearn.ensemble import RandomForestRegressor
-import pickle
 import os
+from config import Config
+from modules import model_store
+from modules.compact_forest import CompactForest
+from modules.forecast_features import (
+    DEFAULT_LAGS, series_arrays, regularize, build_lag_features, next_features, feature_names, month_dates
+)
+
+
+def leaf_value_table(model):
+    """
+    Leaf predictions of every tree as one (n_trees, max_nodes) array
+    
+    Built once per fitted forest and kept on the model, so per-tree
+    predictions become a single gather over model.apply's leaf indices.
+    """
+    table = getattr(model, 'leaf_values_', None)
+    if table is None:
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        table = np.zeros((len(trees), max(tree.node_count for tree in trees)))
+        for i, tree in enumerate(trees):
+            table[i, :tree.node_count] = tree.value[:, 0, 0]
+        model.leaf_values_ = table
+    return table
+
+
+def tree_predictions(model, X):
+    """Predictions of every tree for every row in one pass, shape (rows, n_trees)"""
+    if isinstance(model, CompactForest):
+        return model.predict_trees(X)
+    
+    leaves = model.apply(np.asarray(X, dtype=np.float32))
+    table = leaf_value_table(model)
+    return table[np.arange(table.shape[0]), leaves]
+
+
+def _trim_trailing_gaps(months, values):
+    """Regular monthly axis ending at the last month any series has a value for"""
+    months, values = regularize(months, values)
+    values = np.atleast_2d(values)
+    observed = np.flatnonzero(~np.isnan(values).all(axis=0))
+    end = observed[-1] + 1 if len(observed) else 0
+    return months[:end], values[:, :end]
+
+
+def forecast_batch(model, months, values, months_ahead=3, lags=DEFAULT_LAGS, rolling=(), quantiles=None):
+    """
+    Recursive multi-step forecast for many series with per-tree intervals
+    
+    Each step builds the next lag row of every series, evaluates all trees
+    for all rows in one pass, and feeds the forest mean back as the newest
+    value.
+    
+    Args:
+        model: CompactForest or fitted RandomForestRegressor
+        months: Epoch months of the columns
+        values: Monthly values of shape (T,) or (locations, T)
+        months_ahead: Number of months to forecast
+        lags, rolling: Feature design the model was trained with
+        quantiles: (lower, upper) quantiles of the tree predictions
+    
+    Returns:
+        Dict with 'months' (target epoch months) and 'mean', 'lower', 'upper',
+        'std' arrays of shape (locations, months_ahead); NaN for rows whose
+        lags fall into a gap
+    """
+    quantiles = quantiles or Config.FORECAST_INTERVAL_QUANTILES
+    months, values = _trim_trailing_gaps(months, values)
+    shape = (values.shape[0], months_ahead)
+    result = {key: np.full(shape, np.nan) for key in ('mean', 'lower', 'upper', 'std')}
+    targets = []
+    
+    for step in range(months_ahead):
+        features, target = next_features(months, values, lags, rolling)
+        complete = np.isfinite(features).all(axis=1)
+        
+        if complete.any():
+            predictions = tree_predictions(model, features[complete])
+            result['mean'][complete, step] = predictions.mean(axis=1)
+            result['std'][complete, step] = predictions.std(axis=1)
+            result['lower'][complete, step], result['upper'][complete, step] = \
+                np.quantile(predictions, quantiles, axis=1)
+        
+        targets.append(target)
+        months = np.append(months, target)
+        values = np.concatenate([values, result['mean'][:, step:step + 1]], axis=1)
+    
+    result['months'] = np.array(targets, dtype=np.int64)
+    return result
+
+
+def climatological_batch(months, values, months_ahead=3, quantiles=None):
+    """
+    Calendar-month means with normal intervals, in the forecast_batch layout
+    """
+    quantiles = quantiles or Config.FORECAST_INTERVAL_QUANTILES
+    months, values = _trim_trailing_gaps(months, values)
+    present = ~np.isnan(values)
+    
+    # Per-row sums and counts for each calendar month in one product
+    one_hot = np.eye(12)[months % 12]
+    sums = np.where(present, values, 0.0) @ one_hot
+    counts = present.astype(np.float64) @ one_hot
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        overall_mean = sums.sum(axis=1) / counts.sum(axis=1)
+        overall_std = np.sqrt(np.where(present, (values - overall_mean[:, None]) ** 2, 0.0).sum(axis=1) / counts.sum(axis=1))
+        monthly_means = np.where(counts > 0, sums / counts, overall_mean[:, None])
+    
+    targets = months[-1] + 1 + np.arange(months_ahead)
+    mean = monthly_means[:, targets % 12]
+    z_lower, z_upper = special.ndtri(quantiles)
+    
+    return {
+        'months': targets,
+        'mean': mean,
+        'lower': mean + z_lower * overall_std[:, None],
+        'upper': mean + z_upper * overall_std[:, None],
+        'std': np.repeat(overall_std[:, None], months_ahead, axis=1)
+    }
+
+
+def forecast_records(result, row=0):
+    """One series of a forecast_batch result as [{'date', 'value', 'lower_bound', 'upper_bound'}]"""
+    return [
+        {
+            'date': date,
+            'value': round(float(result['mean'][row, i]), 2),
+            'lower_bound': round(float(result['lower'][row, i]), 2),
+            'upper_bound': round(float(result['upper'][row, i]), 2)
+        }
+        for i, date in enumerate(month_dates(result['months']))
+    ]
+
 
 class ClimateForecaster:
-    def __init__(self):
-        self.models = {}
-        self.model_dir = 'data/models'
+    """
+    Random forest forecasts from per location/variable model versions
+    
+    Models are trained and published by the background training service
+    (modules.model_training); the request path only loads the published
+    version and falls back to climatology when there is none yet.
+    """
+    
+    def __init__(self, lags=DEFAULT_LAGS, rolling=(), model_dir=None, registry=None):
+        self.model_dir = model_dir or Config.MODEL_DIR
+        self.registry = registry or model_store.ModelRegistry(root=self.model_dir)
+        self.lags = tuple(lags)
+        self.rolling = tuple(rolling)
         os.makedirs(self.model_dir, exist_ok=True)
     
+    @property
+    def feature_names(self):
+        return feature_names(self.lags, self.rolling)
+    
     def prepare_features(self, timeseries_data):
         if len(timeseries_data) < 12:
             return None, None
         
-        values = [d['value'] for d in timeseries_data if d['value'] is not None]
-        dates = [datetime.strptime(d['date'], '%Y-%m-%d') for d in timeseries_data]
-        
-        X = []
-        y = []
-        
-        for i in range(6, len(values)):
-            lag_1 = values[i-1]
-            lag_3 = values[i-3] if i >= 3 else values[0]
-            lag_6 = values[i-6] if i >= 6 else values[0]
-            month = dates[i].month
-            
-            X.append([lag_1, lag_3, lag_6, month])
-            y.append(values[i])
-        
-        return np.array(X), np.array(y)
+        months, values = series_arrays(timeseries_data)
+        X, y, _, _ = build_lag_features(months, values, self.lags, self.rolling)
+        return X, y
     
-    def train_model(self, variable, timeseries_data):
+    def train_model(self, timeseries_data):
+        """Fit a model on [{'date', 'value'}] records (None with too little history)"""
         X, y = self.prepare_features(timeseries_data)
-        
+        return self.fit(X, y)
+    
+    def train_model_arrays(self, months, values):
+        """Fit one model on every series of a (locations, T) array"""
+        X, y, _, _ = build_lag_features(months, values, self.lags, self.rolling)
+        return self.fit(X, y)
+    
+    def fit(self, X, y, n_estimators=50, random_state=42, oob_score=False):
         if X is None or len(X) < 10:
             return None
         
+        # Training runs in the background training pool; one core per job
         model = RandomForestRegressor(
-            n_estimators=50,
+            n_estimators=n_estimators,
             max_depth=10,
-            random_state=42,
-            n_jobs=-1
+            random_state=random_state,
+            oob_score=oob_score,
+            n_jobs=Config.MODEL_N_JOBS
         )
         
         model.fit(X, y)
+        return model
+    
+    def load_entry(self, variable, location_id):
+        """
+        Published model and its metadata for a location and variable, from the model registry
+        
+        Returns:
+            Tuple of (model, metadata), or None when no usable version exists
+        """
+        # A model saved with another feature design waits for retraining
+        return self.registry.get(
+            location_id, variable,
+            validate=lambda model: getattr(model, 'n_features_in_', None) == len(self.feature_names)
+        )
+    
+    def load_model(self, variable, location_id):
+        entry = self.load_entry(variable, location_id)
+        return entry[0] if entry is not None else None
+    
+    def predict_future(self, variable, historical_data, months_ahead=3, location_id=None):
+        model = self.load_model(variable, location_id) if location_id is not None else None
         
-        self.models[variable] = model
+        # Never trained inline: without a published model the forecast is climatological
+        if model is None:
+            return self.generate_climatological_forecast(variable, historical_data, months_ahead)
         
-        model_path = os.path.join(self.model_dir, f'{variable}_model.pkl')
-        with open(model_path, 'wb') as f:
-            pickle.dump(model, f)
+        months, values = series_arrays(historical_data)
+        result = forecast_batch(model, months, values, months_ahead, self.lags, self.rolling)
         
-        return model
+        if np.isnan(result['mean']).any():
+            # Recent gaps leave no complete lag row to predict from
+            return self.generate_climatological_forecast(variable, historical_data, months_ahead)
+        
+        return forecast_records(result, 0)
     
-    def load_model(self, variable):
-        if variable in self.models:
-            return self.models[variable]
+    def predict_batch(self, variable, location_ids, months, values, months_ahead=3):
+        """
+        Forecast many locations at once
         
-        model_path = os.path.join(self.model_dir, f'{variable}_model.pkl')
+        Rows sharing a model are evaluated in one pass over its trees.
         
-        if os.path.exists(model_path):
-            with open(model_path, 'rb') as f:
-                model = pickle.load(f)
-                self.models[variable] = model
-                return model
+        Args:
+            variable: Climate variable
+            location_ids: Location of each row
+            months: Epoch months of the columns
+            values: Monthly values of shape (locations, T)
+            months_ahead: Number of months to forecast
         
-        return None
-    
-    def predict_future(self, variable, historical_data, months_ahead=3):
-        model = self.load_model(variable)
+        Returns:
+            forecast_batch result plus a boolean 'trained' row mask and the
+            model 'versions' resolved per row (None without a published
+            model); rows without a model, or that cannot be forecast from
+            lags, hold the climatological forecast
+        """
+        months, values = _trim_trailing_gaps(months, values)
+        result = climatological_batch(months, values, months_ahead)
+        trained = np.zeros(len(location_ids), dtype=bool)
+        versions = [None] * len(location_ids)
         
-        if model is None:
-            model = self.train_model(variable, historical_data)
+        # Versions are taken here; the registry may evict them before the batch ends
+        groups = {}
+        for row, location_id in enumerate(location_ids):
+            entry = self.load_entry(variable, location_id)
+            if entry is not None:
+                model, meta = entry
+                versions[row] = meta['version']
+                groups.setdefault(id(model), (model, []))[1].append(row)
         
-        if model is None:
-            return self.generate_climatological_forecast(variable, historical_data, months_ahead)
+        for model, rows in groups.values():
+            forecast = forecast_batch(model, months, values[rows], months_ahead, self.lags, self.rolling)
+            if not np.array_equal(forecast['months'], result['months']):
+                # Every row of the group ends early; their lags cannot reach the batch's targets
+                continue
+            complete = ~np.isnan(forecast['mean']).any(axis=1)
+            rows = np.asarray(rows)[complete]
+            for key in ('mean', 'lower', 'upper', 'std'):
+                result[key][rows] = forecast[key][complete]
+            trained[rows] = True
         
-        values = [d['value'] for d in historical_data if d['value'] is not None]
-        last_date = datetime.strptime(historical_data[-1]['date'], '%Y-%m-%d')
-        
-        forecasts = []
-        current_values = values[-6:]
-        
-        for i in range(months_ahead):
-            next_date = last_date + timedelta(days=30 * (i + 1))
-            next_month = next_date.month
-            
-            features = [
-                current_values[-1],
-                current_values[-3] if len(current_values) >= 3 else current_values[0],
-                current_values[-6] if len(current_values) >= 6 else current_values[0],
-                next_month
-            ]
-            
-            prediction = model.predict([features])[0]
-            
-            trees_predictions = [tree.predict([features])[0] for tree in model.estimators_]
-            std = np.std(trees_predictions)
-            
-            forecasts.append({
-                'date': next_date.strftime('%Y-%m-%d'),
-                'value': round(prediction, 2),
-                'lower_bound': round(prediction - 1.96 * std, 2),
-                'upper_bound': round(prediction + 1.96 * std, 2)
-            })
-            
-            current_values.append(prediction)
-            current_values = current_values[-6:]
-        
-        return forecasts
+        result['trained'] = trained
+        result['versions'] = versions
+        return result
     
     def generate_climatological_forecast(self, variable, historical_data, months_ahead=3):
-        values = [d['value'] for d in historical_data if d['value'] is not None]
-        last_date = datetime.strptime(historical_data[-1]['date'], '%Y-%m-%d')
-        
-        monthly_means = {}
-        for data_point in historical_data:
-            if data_point['value'] is not None:
-                month = datetime.strptime(data_point['date'], '%Y-%m-%d').month
-                if month not in monthly_means:
-                    monthly_means[month] = []
-                monthly_means[month].append(data_point['value'])
-        
-        for month in monthly_means:
-            monthly_means[month] = np.mean(monthly_means[month])
-        
-        overall_mean = np.mean(values)
-        overall_std = np.std(values)
-        
-        forecasts = []
-        for i in range(months_ahead):
-            next_date = last_date + timedelta(days=30 * (i + 1))
-            next_month = next_date.month
-            
-            predicted_value = monthly_means.get(next_month, overall_mean)
-            
-            forecasts.append({
-                'date': next_date.strftime('%Y-%m-%d'),
-                'value': round(predicted_value, 2),
-                'lower_bound': round(predicted_value - 1.96 * overall_std, 2),
-                'upper_bound': round(predicted_value + 1.96 * overall_std, 2)
-            })
-        
-        return forecasts
-    
-    def get_model_info(self, variable):
-        model = self.models.get(variable)
+        months, values = series_arrays(historical_data)
+        return forecast_records(climatological_batch(months, values, months_ahead), 0)
+    
+    def get_model_info(self, variable, location_id=None):
+        entry = self.registry.peek(location_id, variable)
         
-        if model is None:
+        if entry is None:
             return {
                 'model_type': 'Climatological Mean',
                 'trained': False,
                 'description': 'Using historical monthly averages for prediction'
             }
         
+        model, meta = entry
         return {
             'model_type': 'Random Forest Regressor',
             'trained': True,
+            'engine': 'compact' if isinstance(model, CompactForest) else 'sklearn',
+            'version': meta['version'],
+            'trained_at': meta.get('trained_at'),
+            'training_window': {'start': meta.get('first_month'), 'end': meta.get('last_month')},
+            'training_samples': meta.get('samples'),
+            'size_bytes': meta.get('size_bytes'),
+            'load_seconds': meta.get('load_seconds'),
+            'loaded_at': meta.get('loaded_at'),
             'n_estimators': model.n_estimators,
             'max_depth': model.max_depth,
-            'features': ['lag_1_month', 'lag_3_month', 'lag_6_month', 'month_of_year'],
+            'features': self.feature_names,
             'description': 'ML model trained on historical climate patterns'
         }
@@ -0,0 +1,251 @@
+"""
+Vectorized, deterministic synthetic climate data
+
+Used whenever Earth Engine is unavailable. Every value is derived from a
+counter-based hash of (location, variable, timestamp) instead of a global
+random state, so a given date always produces the same value no matter
+which range was requested. Responses are therefore cacheable, and decades
+of daily data for hundreds of zones come out of a handful of array ops.
+"""
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy import special
+from typing import Dict, List, Optional, Tuple
+from modules.aggregation import ROLLUP_AGGREGATIONS, rollup_matrix
+
+# Seasonal climatology per variable. Values are monthly means (monthly totals for
+# precipitation/evapotranspiration), with the annual cycle peaking on peak_doy.
+VARIABLE_PROFILES = {
+    'temperature': {
+        'mean': 24.0, 'amplitude': 10.0, 'peak_doy': 172,
+        'noise': 1.2, 'diurnal': 6.0, 'location_spread': 6.0, 'clip': (-40.0, 55.0)
+    },
+    'humidity': {
+        'mean': 50.0, 'amplitude': 15.0, 'peak_doy': 220,
+        'noise': 5.0, 'diurnal': -12.0, 'location_spread': 12.0, 'clip': (5.0, 100.0)
+    },
+    'wind_speed': {
+        'mean': 4.0, 'amplitude': 1.5, 'peak_doy': 160,
+        'noise': 0.8, 'diurnal': 1.5, 'location_spread': 1.5, 'clip': (0.0, 40.0)
+    },
+    'solar_radiation': {
+        'mean': 220.0, 'amplitude': 70.0, 'peak_doy': 172,
+        'noise': 15.0, 'diurnal': 0.0, 'location_spread': 20.0, 'clip': (0.0, 1400.0)
+    },
+    'evapotranspiration': {
+        'mean': 110.0, 'amplitude': 60.0, 'peak_doy': 172,
+        'noise': 8.0, 'diurnal': 0.0, 'location_spread': 20.0, 'clip': (0.0, 400.0),
+        'accumulated': True
+    },
+    'precipitation': {
+        # Monsoon peak in late July/August plus a smaller western-disturbance peak in late winter
+        'mean': 8.0, 'monsoon': 80.0, 'monsoon_doy': 215, 'winter': 25.0, 'winter_doy': 60,
+        'location_spread': 0.7, 'accumulated': True
+    }
+}
+
+# Noise grows at finer time resolution
+NOISE_SCALE = {'hourly': 2.0, 'daily': 2.0, 'monthly': 1.0}
+
+DAYS_PER_MONTH = 365.25 / 12
+
+# Pakistan Standard Time, used for the diurnal cycle of hourly data
+UTC_OFFSET_HOURS = 5
+
+_MIX_TIME = np.uint64(0x9E3779B97F4A7C15)
+_MIX_STREAM = np.uint64(0xD1B54A32D192ED03)
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer applied elementwise to a uint64 array"""
+    with np.errstate(over='ignore'):
+        z = x + _MIX_TIME
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _key(*parts) -> np.uint64:
+    digest = hashlib.blake2b('|'.join(str(p) for p in parts).encode(), digest_size=8).digest()
+    return np.uint64(int.from_bytes(digest, 'little'))
+
+
+def _gamma_quantile(z: np.ndarray, shape: float) -> np.ndarray:
+    """Wilson-Hilferty approximation of unit-scale gamma quantiles from standard normal scores"""
+    c = 1.0 / (9.0 * shape)
+    return shape * np.maximum(1.0 - c + z * np.sqrt(c), 0.0) ** 3
+
+
+class MockDataEngine:
+    """Reproducible synthetic climate series seeded by (location, variable, date)"""
+    
+    def timestamps(self, start_date: str, end_date: str, aggregation: str = 'monthly') -> pd.DatetimeIndex:
+        """Timestamps covered by [start_date, end_date] at the aggregation's base resolution"""
+        if aggregation == 'hourly':
+            return pd.date_range(start_date, pd.Timestamp(end_date) + pd.Timedelta(days=1), freq='h', inclusive='left')
+        if aggregation == 'daily':
+            return pd.date_range(start_date, end_date, freq='D')
+        
+        first_month = pd.Timestamp(start_date).to_period('M').to_timestamp()
+        return pd.date_range(first_month, end_date, freq='MS')
+    
+    def _uniform(self, location_keys: np.ndarray, hours: np.ndarray, stream: int) -> np.ndarray:
+        """Uniform(0, 1) draws of shape (locations, time), one independent stream per purpose"""
+        with np.errstate(over='ignore'):
+            x = location_keys[:, None] ^ (hours[None, :] * _MIX_TIME) ^ (np.uint64(stream) * _MIX_STREAM)
+        bits = _splitmix64(x) >> np.uint64(11)
+        return (bits.astype(np.float64) + 0.5) * 2.0 ** -53
+    
+    def _location_factor(self, location_ids: List[str], variable: str) -> np.ndarray:
+        """Fixed per-location climate offset in [-1, 1], so zones differ from each other"""
+        keys = np.array([_key(location_id, variable, 'climate') for location_id in location_ids], dtype=np.uint64)
+        return self._uniform(keys, np.zeros(1, dtype=np.uint64), 0)[:, 0] * 2.0 - 1.0
+    
+    def generate(self, location_ids: List[str], variable: str, start_date: str, end_date: str,
+                 aggregation: str = 'monthly') -> Tuple[List[str], np.ndarray]:
+        """
+        Generate synthetic series for many locations at once
+        
+        Args:
+            location_ids: Locations to generate (each gets its own climate)
+            variable: Climate variable name
+            start_date: Start date (YYYY-MM-DD)
+            end_date: End date (YYYY-MM-DD, inclusive)
+            aggregation: hourly, daily, monthly, seasonal or annual
+        
+        Returns:
+            Tuple of (date labels, array of shape (locations, time))
+        """
+        location_keys = np.array([_key(location_id, variable) for location_id in location_ids], dtype=np.uint64)
+        location_factor = self._location_factor(location_ids, variable)
+        return self._generate(location_keys, location_factor, variable, start_date, end_date, aggregation)
+    
+    def _generate(self, location_keys, location_factor, variable, start_date, end_date, aggregation):
+        base = 'monthly' if aggregation in ROLLUP_AGGREGATIONS else aggregation
+        if base not in NOISE_SCALE:
+            base = 'monthly'
+        
+        times = self.timestamps(start_date, end_date, base)
+        profile = VARIABLE_PROFILES.get(variable, VARIABLE_PROFILES['temperature'])
+        
+        hours = ((times - pd.Timestamp('1970-01-01')) // pd.Timedelta(hours=1)).to_numpy().astype(np.uint64)
+        location_factor = location_factor[:, None]
+        
+        # Seasonal phase at the middle of each period
+        half_period = {'hourly': 0.0, 'daily': 0.5, 'monthly': DAYS_PER_MONTH / 2}[base]
+        doy = (times.dayofyear.to_numpy() + half_period)[None, :]
+        
+        # Accumulated variables are monthly totals; scale them down for daily/hourly steps
+        per_step = {'hourly': 1.0 / (24 * DAYS_PER_MONTH), 'daily': 1.0 / DAYS_PER_MONTH, 'monthly': 1.0}[base]
+        
+        if variable == 'precipitation':
+            values = self._precipitation(profile, location_keys, hours, location_factor, doy, base, per_step)
+        else:
+            values = self._continuous(profile, location_keys, hours, location_factor, doy, times, base, per_step)
+        
+        if aggregation in ROLLUP_AGGREGATIONS:
+            labels, values = rollup_matrix(times, values, aggregation)
+        else:
+            fmt = '%Y-%m-%d %H:%M' if base == 'hourly' else '%Y-%m-%d'
+            labels = list(times.strftime(fmt))
+        
+        return labels, np.round(values, 2)
+    
+    def _continuous(self, profile, location_keys, hours, location_factor, doy, times, base, per_step):
+        cycle = np.cos(2 * np.pi * (doy - profile['peak_doy']) / 365.25)
+        mean = profile['mean'] + profile['location_spread'] * location_factor + profile['amplitude'] * cycle
+        
+        z = special.ndtri(self._uniform(location_keys, hours, 1))
+        values = mean + profile['noise'] * NOISE_SCALE[base] * z
+        
+        if base == 'hourly':
+            local_hour = ((times.hour.to_numpy() + UTC_OFFSET_HOURS) % 24)[None, :]
+            if profile is VARIABLE_PROFILES['solar_radiation']:
+                # Daytime half-cosine whose daily mean equals the profile mean
+                values = values * np.pi * np.maximum(np.cos(2 * np.pi * (local_hour - 12.5) / 24), 0.0)
+            else:
+                values = values + profile['diurnal'] * np.cos(2 * np.pi * (local_hour - 15) / 24)
+        
+        if profile.get('accumulated'):
+            values = values * per_step
+        
+        low, high = profile['clip']
+        return np.clip(values, low * per_step if profile.get('accumulated') else low, high)
+    
+    def _precipitation(self, profile, location_keys, hours, location_factor, doy, base, per_step):
+        # Monthly climatological total, then scaled to the step length
+        climatology = profile['mean'] \
+            + profile['monsoon'] * np.exp(-0.5 * ((doy - profile['monsoon_doy']) / 28.0) ** 2) \
+            + profile['winter'] * np.exp(-0.5 * ((doy - profile['winter_doy']) / 30.0) ** 2)
+        step_mean = climatology * (1.0 + profile['location_spread'] * location_factor) * per_step
+        
+        amount_z = special.ndtri(self._uniform(location_keys, hours, 1))
+        
+        if base == 'monthly':
+            shape = 2.0
+            return step_mean / shape * _gamma_quantile(amount_z, shape)
+        
+        # Wet/dry occurrence with gamma-distributed amounts on wet steps
+        shape = 0.8
+        wet_probability = np.clip(step_mean / (step_mean + (4.0 if base == 'daily' else 1.5)), 0.01, 0.7)
+        if base == 'hourly':
+            wet_probability = wet_probability / 4
+        
+        wet = self._uniform(location_keys, hours, 2) < wet_probability
+        amount = step_mean / wet_probability / shape * _gamma_quantile(amount_z, shape)
+        return np.where(wet, amount, 0.0)
+    
+    def timeseries(self, location_id: str, variable: str, start_date: str, end_date: str,
+                   aggregation: str = 'monthly') -> List[Dict]:
+        """Single-location series in the [{'date', 'value'}] layout used by the API"""
+        dates, values = self.generate([location_id], variable, start_date, end_date, aggregation)
+        return [{'date': date, 'value': float(value)} for date, value in zip(dates, values[0])]
+    
+    def batch_timeseries(self, location_ids: List[str], variable: str, start_date: str, end_date: str,
+                         aggregation: str = 'monthly') -> Dict:
+        """Columnar series for many locations: {'dates': [...], 'values': {location_id: [...]}}"""
+        dates, values = self.generate(location_ids, variable, start_date, end_date, aggregation)
+        return {
+            'dates': dates,
+            'values': {location_id: row.tolist() for location_id, row in zip(location_ids, values)}
+        }
+    
+    def zonal_stats(self, variable: str, names: List[str], date: Optional[str] = None) -> List[Dict]:
+        """One month's value per named zone, as the [{'name', 'value'}] list used by the map API"""
+        month = pd.Timestamp(date or pd.Timestamp.now()).to_period('M').to_timestamp().strftime('%Y-%m-%d')
+        _, values = self.generate(names, variable, month, month, 'monthly')
+        return [{'name': name, 'value': float(value)} for name, value in zip(names, values[:, 0])]
+    
+    def grid_fields(self, variables: List[str], date: str, grid) -> Dict[str, np.ndarray]:
+        """
+        One month of several variables on every pixel of a GridSpec
+        
+        Pixels are keyed by their flat index, so the same grid and month
+        always produce the same fields without hashing a string per pixel.
+        
+        Args:
+            variables: Climate variable names
+            date: Month (YYYY-MM or YYYY-MM-DD)
+            grid: Target GridSpec
+        
+        Returns:
+            Dictionary mapping variable to an array of shape (ny, nx)
+        """
+        month = pd.Timestamp(date).to_period('M').to_timestamp().strftime('%Y-%m-%d')
+        pixels = np.arange(grid.n_pixels, dtype=np.uint64)
+        
+        fields = {}
+        for variable in variables:
+            keys = _splitmix64(pixels ^ _key('grid', grid.resolution, variable))
+            factor_keys = _splitmix64(pixels ^ _key('grid', grid.resolution, variable, 'climate'))
+            location_factor = self._uniform(factor_keys, np.zeros(1, dtype=np.uint64), 0)[:, 0] * 2.0 - 1.0
+            
+            _, values = self._generate(keys, location_factor, variable, month, month, 'monthly')
+            fields[variable] = values[:, 0].reshape(grid.shape)
+        
+        return fields
+
+
+# Global engine instance
+mock_engine = MockDataEngine()
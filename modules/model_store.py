@@ -0,0 +1,306 @@
+"""
+Versioned forecast model artifacts per location and variable
+
+Each (location, variable) pair has its own directory under Config.MODEL_DIR
+holding numbered versions (v1.pkl, v2.pkl, ...) and a current.json pointer
+with the metadata of the published one. Artifacts and pointers are written
+to a temporary file in the same directory and moved into place with
+os.replace, so a reader in another process sees either the old version or
+the new one, never a partial file.
+
+Versions are stored uncompressed with joblib and loaded with memory-mapping,
+so the numpy arrays of a model are shared through the page cache by every
+worker process that has it loaded. ModelRegistry keeps a bounded LRU set of
+loaded versions per process.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import joblib
+from config import Config
+
+POINTER_FILE = 'current.json'
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.,-]', '_', str(name))
+
+
+def artifact_dir(location_id: str, variable: str, root: str = None) -> str:
+    return os.path.join(root or Config.MODEL_DIR, _safe_name(location_id), _safe_name(variable))
+
+
+def _atomic_write(path: str, write: Callable[[str], None]):
+    """Write to a temporary path in the target directory, then os.replace it into place"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def versions(location_id: str, variable: str, root: str = None) -> List[int]:
+    """Version numbers on disk, ascending"""
+    directory = artifact_dir(location_id, variable, root)
+    if not os.path.isdir(directory):
+        return []
+    found = [re.fullmatch(r'v(\d+)\.pkl', name) for name in os.listdir(directory)]
+    return sorted(int(match.group(1)) for match in found if match)
+
+
+def current(location_id: str, variable: str, root: str = None) -> Optional[Dict]:
+    """Metadata of the published version, or None when nothing has been published"""
+    path = os.path.join(artifact_dir(location_id, variable, root), POINTER_FILE)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def pointer_stamp(location_id: str, variable: str, root: str = None) -> Optional[Tuple[int, int]]:
+    """
+    (inode, mtime) of the pointer file; a cheap check for a newly published version
+    
+    Every publish replaces the pointer with a new file, so the inode changes
+    even when two versions land within the filesystem's mtime resolution.
+    """
+    try:
+        stat = os.stat(os.path.join(artifact_dir(location_id, variable, root), POINTER_FILE))
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def version_path(location_id: str, variable: str, version: int, root: str = None) -> str:
+    return os.path.join(artifact_dir(location_id, variable, root), f'v{version}.pkl')
+
+
+def load_version(location_id: str, variable: str, version: int, root: str = None, mmap_mode: str = 'r'):
+    """Load one version, memory-mapping its arrays (None when missing or unreadable)"""
+    path = version_path(location_id, variable, version, root)
+    try:
+        return joblib.load(path, mmap_mode=mmap_mode)
+    except Exception as e:
+        print(f"Could not load model {path}: {e}")
+        return None
+
+
+def load_latest(location_id: str, variable: str, root: str = None,
+                mmap_mode: str = 'r') -> Optional[Tuple[object, Dict]]:
+    """
+    The published model, falling back to older versions if it cannot be read
+    
+    Returns:
+        Tuple of (model, metadata), or None when no version is usable
+    """
+    meta = current(location_id, variable, root)
+    if meta is None:
+        return None
+    
+    candidates = [meta['version']] + [v for v in reversed(versions(location_id, variable, root))
+                                      if v < meta['version']]
+    for version in candidates:
+        model = load_version(location_id, variable, version, root, mmap_mode)
+        if model is not None:
+            return model, ({**meta, 'version': version} if version != meta['version'] else meta)
+    return None
+
+
+def publish(location_id: str, variable: str, model, meta: Dict, root: str = None) -> Dict:
+    """
+    Write a new version and point current.json at it
+    
+    Args:
+        location_id: Location identifier
+        variable: Climate variable
+        model: Fitted model (picklable)
+        meta: Training metadata stored alongside the version number
+        root: Model directory (default Config.MODEL_DIR)
+    
+    Returns:
+        The published metadata including 'version' and 'published_at'
+    """
+    directory = artifact_dir(location_id, variable, root)
+    existing = versions(location_id, variable, root)
+    version = (existing[-1] if existing else 0) + 1
+    
+    # Uncompressed, so the arrays can be memory-mapped on load
+    _atomic_write(version_path(location_id, variable, version, root),
+                  lambda path: joblib.dump(model, path))
+    
+    meta = {
+        **meta,
+        'location_id': location_id,
+        'variable': variable,
+        'version': version,
+        'published_at': datetime.now().isoformat(timespec='seconds')
+    }
+    
+    def write_pointer(path):
+        with open(path, 'w') as f:
+            json.dump(meta, f)
+    
+    _atomic_write(os.path.join(directory, POINTER_FILE), write_pointer)
+    
+    prune(location_id, variable, root=root)
+    return meta
+
+
+def prune(location_id: str, variable: str, keep: int = None, root: str = None):
+    """Delete all but the newest `keep` versions"""
+    keep = keep or Config.MODEL_KEEP_VERSIONS
+    directory = artifact_dir(location_id, variable, root)
+    for version in versions(location_id, variable, root)[:-keep]:
+        try:
+            os.remove(os.path.join(directory, f'v{version}.pkl'))
+        except OSError:
+            pass
+
+
+class ModelRegistry:
+    """
+    Loaded model versions keyed by (location, variable, version), LRU-bounded
+    
+    Models are loaded lazily on first use and memory-mapped. The published
+    version of a pair is re-checked through its pointer stamp on every get,
+    so a newly published version replaces the old one without a restart;
+    if it cannot be loaded (or fails validation) the resident version keeps
+    serving.
+    """
+    
+    def __init__(self, max_models: int = None, root: str = None, mmap_mode: str = None):
+        """
+        Args:
+            max_models: Loaded versions kept per process (default Config.MODEL_REGISTRY_SIZE)
+            root: Model directory (default Config.MODEL_DIR)
+            mmap_mode: joblib mmap mode (default Config.MODEL_MMAP_MODE)
+        """
+        self.max_models = max_models or Config.MODEL_REGISTRY_SIZE
+        self.root = root
+        self.mmap_mode = mmap_mode or Config.MODEL_MMAP_MODE
+        
+        self._models = OrderedDict()
+        # (location_id, variable) -> (pointer stamp, version) last resolved
+        self._published = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'loads': 0, 'evictions': 0, 'load_failures': 0}
+    
+    def _resident(self, key: Tuple[str, str, int]) -> Optional[Tuple[object, Dict]]:
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                self._counters['hits'] += 1
+            return entry
+    
+    def _insert(self, key: Tuple[str, str, int], entry: Tuple[object, Dict]):
+        with self._lock:
+            self._models[key] = entry
+            self._models.move_to_end(key)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+                self._counters['evictions'] += 1
+    
+    def _load(self, location_id: str, variable: str, version: int = None,
+              validate: Callable = None) -> Optional[Tuple[object, Dict]]:
+        """Load a version (default: the published one) with size and load-time metadata"""
+        started = time.perf_counter()
+        if version is None:
+            loaded = load_latest(location_id, variable, self.root, self.mmap_mode)
+        else:
+            model = load_version(location_id, variable, version, self.root, self.mmap_mode)
+            meta = current(location_id, variable, self.root) or {}
+            loaded = (model, {**meta, 'version': version}) if model is not None else None
+        
+        if loaded is None or (validate is not None and not validate(loaded[0])):
+            with self._lock:
+                self._counters['load_failures'] += 1
+            return None
+        
+        model, meta = loaded
+        path = version_path(location_id, variable, meta['version'], self.root)
+        meta = {
+            **meta,
+            'size_bytes': os.path.getsize(path) if os.path.exists(path) else None,
+            'load_seconds': round(time.perf_counter() - started, 4),
+            'loaded_at': datetime.now().isoformat(timespec='seconds'),
+            'mmap_mode': self.mmap_mode
+        }
+        with self._lock:
+            self._counters['loads'] += 1
+        self._insert((location_id, variable, meta['version']), (model, meta))
+        return model, meta
+    
+    def _get_known(self, pair: Tuple[str, str], version: int,
+                   validate: Callable = None) -> Optional[Tuple[object, Dict]]:
+        """A version already resolved for the pair, reloaded if it was evicted"""
+        entry = self._resident(pair + (version,))
+        if entry is None:
+            entry = self._load(pair[0], pair[1], version, validate)
+        return entry
+    
+    def get(self, location_id: str, variable: str,
+            validate: Callable = None) -> Optional[Tuple[object, Dict]]:
+        """
+        Published model of a location and variable
+        
+        Args:
+            location_id: Location identifier
+            variable: Climate variable
+            validate: Optional check a freshly loaded model must pass
+        
+        Returns:
+            Tuple of (model, metadata), or None when no usable version exists
+        """
+        pair = (location_id, variable)
+        stamp = pointer_stamp(location_id, variable, self.root)
+        known = self._published.get(pair)
+        
+        if known is not None and (stamp is None or known[0] == stamp):
+            return self._get_known(pair, known[1], validate)
+        
+        if stamp is None:
+            return None
+        
+        entry = self._load(location_id, variable, validate=validate)
+        if entry is None:
+            if known is None:
+                return None
+            # Keep serving the previous version until a loadable one is published
+            self._published[pair] = (stamp, known[1])
+            return self._get_known(pair, known[1], validate)
+        
+        self._published[pair] = (stamp, entry[1]['version'])
+        return entry
+    
+    def peek(self, location_id: str, variable: str) -> Optional[Tuple[object, Dict]]:
+        """The last resolved version if it is still resident, without touching disk or LRU order"""
+        known = self._published.get((location_id, variable))
+        if known is None:
+            return None
+        with self._lock:
+            return self._models.get((location_id, variable, known[1]))
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'resident': len(self._models),
+                'capacity': self.max_models,
+                'mmap_mode': self.mmap_mode,
+                **self._counters
+            }
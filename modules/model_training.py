@@ -0,0 +1,440 @@
+"""
+Background training service for the forecast models
+
+Models are trained per location and variable in a dedicated process pool,
+separate from the request-serving analytics pool, with one core per job.
+One scheduler per host (the web worker holding the scheduler lock)
+periodically checks every location's published version and queues
+retraining when there is none, when a new month of data has arrived
+since it was trained, or when the feature design changed. Each job either
+appends trees for the new months or retrains from scratch, as a drift
+check (update_plan) decides; without new months nothing is published.
+Requests for a location without a model are served climatologically and
+only enqueue training (request_training), which other workers forward to
+the scheduler through a spool directory; nothing trains inline.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from config import Config
+from modules import model_store
+from modules.task_pool import TaskPool, TaskPoolBusy
+from modules.utils import atomic_write, try_lock, release_lock
+from modules.mock_data import mock_engine
+from modules.ml_models import ClimateForecaster
+from modules.compact_forest import CompactForest
+from modules.forecast_features import epoch_months, month_dates, build_lag_features
+
+
+def _rmse(predicted: np.ndarray, actual: np.ndarray) -> float:
+    finite = np.isfinite(predicted)
+    return float(np.sqrt(np.mean((predicted[finite] - actual[finite]) ** 2))) if finite.any() else np.nan
+
+
+def update_plan(current: Optional[Tuple[object, Dict]], features: List[str], X: np.ndarray,
+                y: np.ndarray, row_months: np.ndarray, now: datetime = None) -> Tuple[str, Dict]:
+    """
+    Decide between an incremental update, a full retrain or no update
+    
+    The drift check scores the published model on the months that arrived
+    since it was trained, before any trees are fitted on them, and adds
+    those out-of-sample residuals to the ones kept from earlier updates.
+    Once Config.MODEL_DRIFT_MIN_MONTHS residuals have accumulated, the RMSE
+    over the last Config.MODEL_DRIFT_WINDOW of them is compared with the
+    out-of-bag RMSE of the last full fit.
+    
+    Args:
+        current: (model, metadata) of the published version, or None
+        features: Feature names of the current design
+        X, y: Training rows over the whole history
+        row_months: Epoch month of each row
+        now: Reference time (default now)
+    
+    Returns:
+        Tuple of ('full', 'incremental' or 'none', details with 'reason',
+        any drift figures and the 'residuals' to keep with the new version)
+    """
+    if current is None:
+        return 'full', {'reason': 'no_model'}
+    
+    model, meta = current
+    if not isinstance(model, CompactForest) or meta.get('features') != features:
+        return 'full', {'reason': 'design'}
+    
+    new_rows = row_months > epoch_months([meta['last_month']])[0]
+    if not new_rows.any():
+        return 'none', {'reason': 'no_new_data'}
+    if meta.get('incremental_updates', 0) >= Config.MODEL_MAX_INCREMENTAL_UPDATES:
+        return 'full', {'reason': 'update_limit'}
+    
+    now = now or datetime.now()
+    full_trained_at = datetime.fromisoformat(meta.get('full_trained_at', meta['trained_at']))
+    if full_trained_at < now - timedelta(days=Config.MODEL_FULL_RETRAIN_DAYS):
+        return 'full', {'reason': 'age'}
+    
+    residuals = model.predict(X[new_rows]) - y[new_rows]
+    residuals = (list(meta.get('drift_residuals', [])) +
+                 [round(float(r), 4) for r in residuals[np.isfinite(residuals)]])[-Config.MODEL_DRIFT_WINDOW:]
+    details = {'new_months': int(new_rows.sum()), 'residuals': residuals}
+    
+    baseline = meta.get('baseline_rmse')
+    if baseline and len(residuals) >= Config.MODEL_DRIFT_MIN_MONTHS:
+        details['recent_rmse'] = round(float(np.sqrt(np.mean(np.square(residuals)))), 4)
+        details['drift_ratio'] = round(details['recent_rmse'] / baseline, 3)
+        if not details['drift_ratio'] <= Config.MODEL_DRIFT_RATIO:
+            return 'full', {**details, 'reason': 'drift'}
+    
+    return 'incremental', {**details, 'reason': 'new_data'}
+
+
+def _full_fit(forecaster: ClimateForecaster, X: np.ndarray, y: np.ndarray,
+              row_months: np.ndarray, started: datetime) -> Tuple[Optional[CompactForest], Dict]:
+    model = forecaster.fit(X, y, oob_score=True)
+    if model is None:
+        return None, {}
+    
+    meta = {
+        'full_trained_at': started.isoformat(timespec='seconds'),
+        'first_month': month_dates(row_months[:1])[0][:7],
+        'baseline_rmse': round(_rmse(model.oob_prediction_, y), 4),
+        'incremental_updates': 0,
+        'drift_residuals': []
+    }
+    # Served as flat arrays: small, memory-mappable and quick to evaluate
+    return CompactForest.from_sklearn(model), meta
+
+
+def _incremental_fit(forecaster: ClimateForecaster, current: Tuple[CompactForest, Dict], X: np.ndarray,
+                     y: np.ndarray, row_months: np.ndarray,
+                     residuals: List[float]) -> Tuple[Optional[CompactForest], Dict]:
+    """Append trees fitted on the recent window, dropping the oldest beyond the tree cap"""
+    model, meta = current
+    recent = row_months > row_months.max() - Config.MODEL_INCREMENTAL_WINDOW
+    
+    # A new seed per version so successive updates draw different bootstrap samples
+    update = forecaster.fit(X[recent], y[recent], n_estimators=Config.MODEL_INCREMENTAL_TREES,
+                            random_state=42 + meta['version'])
+    if update is None:
+        return None, {}
+    
+    combined = CompactForest.concatenate([model, CompactForest.from_sklearn(update)])
+    return combined.newest(Config.MODEL_MAX_TREES), {
+        'full_trained_at': meta.get('full_trained_at', meta['trained_at']),
+        'first_month': meta['first_month'],
+        'baseline_rmse': meta.get('baseline_rmse'),
+        'incremental_updates': meta.get('incremental_updates', 0) + 1,
+        'drift_residuals': residuals
+    }
+
+
+def train_location(location_id: str, variable: str, full: bool = False) -> Optional[Dict]:
+    """
+    Update or retrain a location's model and publish a new version (runs in a training worker)
+    
+    New months are normally folded in by appending a few trees fitted on a
+    recent window to the published forest; update_plan falls back to a full
+    retrain over the whole history when the model drifts, is too old, has
+    had too many incremental updates, or when full is set. Without new
+    months the published version is kept as it is.
+    
+    Returns:
+        Published metadata (the current version's, with 'unchanged' set,
+        when there was nothing new), or None when there is too little history
+    """
+    end = datetime.now().strftime('%Y-%m-%d')
+    labels, values = mock_engine.generate([location_id], variable, Config.MODEL_TRAINING_START, end, 'monthly')
+    
+    forecaster = ClimateForecaster()
+    X, y, _, row_months = build_lag_features(epoch_months(labels), values, forecaster.lags, forecaster.rolling)
+    if not len(X):
+        return None
+    
+    started = datetime.now()
+    current = None
+    if full:
+        mode, details = 'full', {'reason': 'requested'}
+    else:
+        current = model_store.load_latest(location_id, variable)
+        mode, details = update_plan(current, forecaster.feature_names, X, y, row_months, started)
+    
+    if mode == 'none':
+        return {**current[1], 'unchanged': True}
+    
+    residuals = details.pop('residuals', [])
+    if mode == 'incremental':
+        model, fit_meta = _incremental_fit(forecaster, current, X, y, row_months, residuals)
+    else:
+        model, fit_meta = _full_fit(forecaster, X, y, row_months, started)
+    if model is None:
+        return None
+    
+    meta = {
+        **fit_meta,
+        'update': mode,
+        'update_details': details,
+        'trained_at': started.isoformat(timespec='seconds'),
+        'training_seconds': round((datetime.now() - started).total_seconds(), 2),
+        'samples': len(X),
+        'n_trees': model.n_estimators,
+        'last_month': month_dates(row_months[-1:])[0][:7],
+        'features': forecaster.feature_names
+    }
+    return model_store.publish(location_id, variable, model, meta)
+
+
+def training_reason(location_id: str, variable: str, features: List[str] = None,
+                    now: datetime = None) -> Optional[str]:
+    """
+    Why a location's model should be (re)trained, or None when it is current
+    
+    Returns:
+        'missing', 'features', 'new_data' or None
+    """
+    meta = model_store.current(location_id, variable)
+    if meta is None:
+        return 'missing'
+    
+    features = features if features is not None else ClimateForecaster().feature_names
+    if meta.get('features') != features:
+        return 'features'
+    
+    now = now or datetime.now()
+    # Age alone is no reason: the next new month decides on a full retrain (update_plan)
+    if meta.get('last_month', '') < now.strftime('%Y-%m'):
+        return 'new_data'
+    return None
+
+
+class TrainingScheduler:
+    """
+    Queues per location/variable training jobs on a dedicated process pool
+    
+    Every uvicorn worker creates a scheduler, but only the one holding the
+    host-wide scheduler lock under Config.MODEL_DIR starts the training
+    pool and scans for stale models. The others forward training requests
+    through a spool directory that the leader polls, and take over the
+    lock if the leader exits. Only the configured locations and variables
+    are trained.
+    """
+    
+    def __init__(self, list_locations: Callable[[], List[str]], variables=None,
+                 interval: float = None, pool: TaskPool = None):
+        """
+        Args:
+            list_locations: Callable returning the location ids to keep trained
+            variables: Variables to train (default Config.MODEL_TRAINING_VARIABLES)
+            interval: Seconds between staleness scans (default Config.MODEL_TRAINING_INTERVAL)
+            pool: Training pool (default a TaskPool of Config.TRAINING_WORKERS processes)
+        """
+        self.list_locations = list_locations
+        self.variables = tuple(variables or Config.MODEL_TRAINING_VARIABLES)
+        self.interval = interval or Config.MODEL_TRAINING_INTERVAL
+        self.pool = pool or TaskPool(
+            max_workers=Config.TRAINING_WORKERS,
+            max_queue=Config.TRAINING_MAX_QUEUE,
+            timeout=Config.MODEL_TRAINING_TIMEOUT,
+            preload=Config.TRAINING_PRELOAD
+        )
+        self.features = ClimateForecaster().feature_names
+        self.lock_path = os.path.join(Config.MODEL_DIR, 'scheduler')
+        self.spool_dir = os.path.join(Config.MODEL_DIR, '.requests')
+        
+        self._lock = None
+        self._locations = frozenset()
+        self._locations_loaded = 0.0
+        self._pending = {}
+        self._failed = {}
+        self._loop_task = None
+        self.history = deque(maxlen=100)
+    
+    @property
+    def is_leader(self) -> bool:
+        return self._lock is not None
+    
+    def start(self):
+        """Start the scheduler loop (call from within the event loop)"""
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+        for task in list(self._pending.values()):
+            task.cancel()
+        self.pool.shutdown()
+        if self._lock is not None:
+            release_lock(self._lock)
+            self._lock = None
+    
+    def known_locations(self) -> frozenset:
+        """Trainable location ids, re-read from list_locations at most once per interval"""
+        if time.monotonic() - self._locations_loaded > self.interval or not self._locations:
+            self._locations = frozenset(self.list_locations())
+            self._locations_loaded = time.monotonic()
+        return self._locations
+    
+    def _retry_blocked(self, key: Tuple[str, str], now: datetime = None) -> bool:
+        """Unsuccessful pairs wait a full interval before they are trained again"""
+        failed = self._failed.get(key)
+        return failed is not None and failed > (now or datetime.now()) - timedelta(seconds=self.interval)
+    
+    def request_training(self, location_id: str, variable: str, reason: str = 'requested') -> bool:
+        """
+        Queue a training job for a configured location and variable
+        
+        On the leader the job goes straight to the pool; elsewhere it is
+        written to the spool for the leader to pick up.
+        
+        Returns:
+            True when the job was queued or forwarded; False for unknown
+            pairs, pairs already pending or in their retry window, or a full pool
+        """
+        if variable not in self.variables or location_id not in self.known_locations():
+            return False
+        if not self.is_leader:
+            return self._spool(location_id, variable, reason)
+        
+        key = (location_id, variable)
+        if key in self._pending or self._retry_blocked(key):
+            return False
+        if len(self._pending) >= self.pool.max_workers + self.pool.max_queue:
+            return False
+        
+        self._pending[key] = asyncio.create_task(self._train(location_id, variable, reason))
+        return True
+    
+    def _spool(self, location_id: str, variable: str, reason: str) -> bool:
+        name = hashlib.sha1(f'{location_id}\0{variable}'.encode()).hexdigest()
+        path = os.path.join(self.spool_dir, f'{name}.json')
+        if os.path.exists(path):
+            return True
+        
+        def write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump({'location_id': location_id, 'variable': variable, 'reason': reason}, f)
+        
+        try:
+            atomic_write(path, write)
+        except OSError as e:
+            print(f"Could not forward training request for {location_id}: {e}")
+            return False
+        return True
+    
+    def _drain_spool(self):
+        """Queue requests forwarded by other workers; ones that do not fit stay for the next poll"""
+        try:
+            names = sorted(os.listdir(self.spool_dir))
+        except OSError:
+            return
+        
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            try:
+                with open(path) as f:
+                    request = json.load(f)
+            except (OSError, ValueError):
+                continue
+            
+            key = (request['location_id'], request['variable'])
+            if key not in self._pending and not self.request_training(*key, request.get('reason', 'requested')):
+                if len(self._pending) >= self.pool.max_workers + self.pool.max_queue:
+                    return
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    async def _train(self, location_id: str, variable: str, reason: str):
+        record = {'location_id': location_id, 'variable': variable, 'reason': reason,
+                  'queued_at': datetime.now().isoformat(timespec='seconds')}
+        try:
+            meta = await self.pool.run(train_location, location_id, variable)
+            if meta is None:
+                record['status'] = 'insufficient_data'
+            else:
+                record.update(status='unchanged' if meta.get('unchanged') else 'published',
+                              version=meta['version'])
+        except TaskPoolBusy:
+            record['status'] = 'rejected'
+        except asyncio.TimeoutError:
+            record['status'] = 'timed_out'
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Training {variable} for {location_id} failed: {e}")
+            record.update(status='failed', error=str(e))
+        finally:
+            self._pending.pop((location_id, variable), None)
+        
+        finished = datetime.now()
+        if record['status'] in ('published', 'unchanged'):
+            self._failed.pop((location_id, variable), None)
+        else:
+            self._failed[(location_id, variable)] = finished
+        record['finished_at'] = finished.isoformat(timespec='seconds')
+        self.history.append(record)
+    
+    def schedule_stale(self) -> Tuple[int, bool]:
+        """
+        Queue every location/variable whose model is missing or stale
+        
+        Returns:
+            Tuple of (jobs queued, whether the scan stopped early on a full pool)
+        """
+        queued = 0
+        now = datetime.now()
+        for location_id in sorted(self.known_locations()):
+            for variable in self.variables:
+                key = (location_id, variable)
+                if key in self._pending or self._retry_blocked(key, now):
+                    continue
+                reason = training_reason(location_id, variable, self.features, now)
+                if reason is None:
+                    continue
+                if not self.request_training(location_id, variable, reason):
+                    return queued, True
+                queued += 1
+        return queued, False
+    
+    async def _run(self):
+        next_scan = 0.0
+        while True:
+            try:
+                if not self.is_leader:
+                    # Followers keep trying, so a new leader takes over when the current one exits
+                    self._lock = try_lock(self.lock_path)
+                    if self.is_leader:
+                        self.pool.start()
+                        next_scan = 0.0
+                
+                if self.is_leader:
+                    self._drain_spool()
+                    if time.monotonic() >= next_scan:
+                        queued, full = self.schedule_stale()
+                        if queued:
+                            print(f"Queued {queued} forecast model training jobs")
+                        # A scan cut short by a full pool resumes at the next poll
+                        next_scan = time.monotonic() + (Config.MODEL_TRAINING_POLL if full else self.interval)
+            except Exception as e:
+                print(f"Training scheduler iteration failed: {e}")
+            
+            await asyncio.sleep(Config.MODEL_TRAINING_POLL)
+    
+    def status(self) -> Dict:
+        """Pending jobs, recent results and training pool metrics"""
+        return {
+            'running': self._loop_task is not None,
+            'leader': self.is_leader,
+            'interval_seconds': self.interval,
+            'variables': list(self.variables),
+            'pending': [{'location_id': loc, 'variable': var} for loc, var in self._pending],
+            'recent': list(self.history)[-20:],
+            'pool': self.pool.metrics()
+        }
@@ -0,0 +1,219 @@
+"""
+Mergeable quantile sketches for large daily/hourly archives
+
+A compact t-digest: values are summarised by weighted centroids whose
+size shrinks towards the tails (arcsine k-scale), so extreme percentiles
+stay accurate while a month of hourly data collapses to a few hundred
+numbers. Digests are built and merged with vectorized sorting and
+reduceat, persisted per location/variable/month, and percentiles over any
+range come from merging the months it covers instead of rescanning raw data.
+"""
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Sequence, Tuple
+from modules.aggregation import month_starts, month_ranges
+
+# Default compression (roughly half this many centroids per digest)
+DEFAULT_COMPRESSION = 200
+
+# Completed months never change; the current month is cached briefly
+SKETCH_TTL = 30 * 86400
+OPEN_MONTH_TTL = 3600
+
+
+class QuantileSketch:
+    """Weighted-centroid t-digest supporting batch updates, merging and quantile queries"""
+    
+    def __init__(self, means: np.ndarray = None, weights: np.ndarray = None,
+                 minimum: float = np.inf, maximum: float = -np.inf,
+                 compression: int = DEFAULT_COMPRESSION):
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self.min = float(minimum)
+        self.max = float(maximum)
+        self.compression = compression
+    
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+    
+    @classmethod
+    def from_values(cls, values, compression: int = DEFAULT_COMPRESSION) -> 'QuantileSketch':
+        """Build a digest from raw values (NaN is ignored)"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        sketch = cls(compression=compression)
+        if len(values):
+            sketch._compress(values, np.ones(len(values)), values.min(), values.max())
+        return sketch
+    
+    @classmethod
+    def merge_all(cls, sketches: Sequence['QuantileSketch'],
+                  compression: int = DEFAULT_COMPRESSION) -> 'QuantileSketch':
+        """Merge many digests into one"""
+        merged = cls(compression=compression)
+        sketches = [s for s in sketches if len(s.means)]
+        if sketches:
+            merged._compress(
+                np.concatenate([s.means for s in sketches]),
+                np.concatenate([s.weights for s in sketches]),
+                min(s.min for s in sketches),
+                max(s.max for s in sketches)
+            )
+        return merged
+    
+    def update(self, values):
+        """Add a batch of raw values"""
+        batch = QuantileSketch.from_values(values, self.compression)
+        merged = QuantileSketch.merge_all([self, batch], self.compression)
+        self.means, self.weights, self.min, self.max = merged.means, merged.weights, merged.min, merged.max
+    
+    def _compress(self, means: np.ndarray, weights: np.ndarray, minimum: float, maximum: float):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        
+        total = weights.sum()
+        # Arcsine k-scale: buckets hold ~q(1-q) of the mass, so the tails stay fine-grained
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * (np.arcsin(2 * q - 1) + np.pi / 2)
+        bucket = np.floor(k).astype(np.int64)
+        
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(bucket)) + 1])
+        bucket_weights = np.add.reduceat(weights, starts)
+        
+        self.means = np.add.reduceat(means * weights, starts) / bucket_weights
+        self.weights = bucket_weights
+        self.min = float(minimum)
+        self.max = float(maximum)
+    
+    def quantile(self, q) -> np.ndarray:
+        """
+        Approximate quantiles
+        
+        Args:
+            q: Quantile(s) in [0, 1]
+        
+        Returns:
+            Array of values (NaN for an empty sketch)
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if not len(self.means):
+            return np.full(q.shape, np.nan)
+        
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0.0], centers, [total]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(q * total, positions, values)
+    
+    def percentile(self, p) -> np.ndarray:
+        return self.quantile(np.asarray(p, dtype=np.float64) / 100)
+    
+    def mean(self) -> float:
+        return float(np.sum(self.means * self.weights) / self.weights.sum()) if len(self.means) else np.nan
+    
+    def to_dict(self) -> Dict:
+        return {
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+            'min': self.min,
+            'max': self.max,
+            'compression': self.compression
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'QuantileSketch':
+        return cls(data['means'], data['weights'], data['min'], data['max'], data['compression'])
+
+
+class SketchStore:
+    """Per location/variable/month digests kept in the cache"""
+    
+    def __init__(self, cache=None, compression: int = DEFAULT_COMPRESSION):
+        self.cache = cache
+        self.compression = compression
+    
+    @staticmethod
+    def _key(location_id: str, variable: str, aggregation: str, month: str) -> str:
+        return f'sketch:{variable}:{aggregation}:{location_id}:{month[:7]}'
+    
+    def range_sketch(self, location_id: str, variable: str, start_date: str, end_date: str,
+                     load_values: Callable[[str, str], Tuple[List[str], np.ndarray]],
+                     aggregation: str = 'daily') -> QuantileSketch:
+        """
+        Digest of every value in [start_date, end_date] built from monthly sketches
+        
+        Partially covered edge months are built from the requested days only
+        and not persisted; whole months are read from (or written to) the cache.
+        
+        Args:
+            location_id: Location identifier
+            variable: Climate variable name
+            start_date: Start date (YYYY-MM-DD)
+            end_date: End date (YYYY-MM-DD, inclusive)
+            load_values: Callable (start, end) -> (date labels, values) for the
+                         aggregation; end is exclusive
+            aggregation: 'daily' or 'hourly'
+        
+        Returns:
+            Merged QuantileSketch
+        """
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+        
+        # Whole months inside the range come from the store
+        first_full = start.to_period('M').to_timestamp()
+        if first_full < start:
+            first_full += pd.offsets.MonthBegin(1)
+        last_full_end = end.to_period('M').to_timestamp()
+        
+        full_months = []
+        if first_full < last_full_end:
+            full_months = month_starts(first_full.strftime('%Y-%m-%d'), last_full_end.strftime('%Y-%m-%d'))
+        
+        sketches = []
+        missing = []
+        for month in full_months:
+            key = self._key(location_id, variable, aggregation, month)
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached:
+                sketches.append(QuantileSketch.from_dict(cached))
+            else:
+                missing.append(month)
+        
+        for range_start, range_end in month_ranges(missing):
+            labels, values = load_values(range_start, range_end)
+            sketches.extend(self._store_months(location_id, variable, aggregation, labels, values))
+        
+        # Partially covered months at either edge
+        head_end = min(first_full, end)
+        tail_start = max(last_full_end, head_end)
+        for edge_start, edge_end in ((start, head_end), (tail_start, end)):
+            if edge_start < edge_end:
+                _, values = load_values(edge_start.strftime('%Y-%m-%d'), edge_end.strftime('%Y-%m-%d'))
+                sketches.append(QuantileSketch.from_values(values, self.compression))
+        
+        return QuantileSketch.merge_all(sketches, self.compression)
+    
+    def _store_months(self, location_id: str, variable: str, aggregation: str,
+                      labels: List[str], values: np.ndarray) -> List[QuantileSketch]:
+        """Split a loaded range into monthly digests and persist them"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        months = pd.DatetimeIndex(labels).to_period('M')
+        if not len(months):
+            return []
+        
+        starts = np.concatenate([[0], np.flatnonzero(months[1:] != months[:-1]) + 1])
+        ends = np.concatenate([starts[1:], [len(months)]])
+        current = pd.Timestamp.now().to_period('M')
+        
+        sketches = []
+        for s, e in zip(starts, ends):
+            sketch = QuantileSketch.from_values(values[s:e], self.compression)
+            sketches.append(sketch)
+            if self.cache is not None:
+                month = months[s].to_timestamp().strftime('%Y-%m-%d')
+                ttl = OPEN_MONTH_TTL if months[s] >= current else SKETCH_TTL
+                self.cache.set(self._key(location_id, variable, aggregation, month), sketch.to_dict(), ttl=ttl)
+        
+        return sketches
@@ -27,6 +27,26 @@ class SpatialProcessor:
         else:
             return self._get_boundaries_sqlite(level)
     
+    def get_levels(self) -> List[int]:
+        """Get the administrative levels present in administrative_units"""
+        if self.use_postgis:
+            db = SessionLocal()
+            try:
+                result = db.execute(text("SELECT DISTINCT level FROM administrative_units ORDER BY level"))
+                return [row[0] for row in result.fetchall()]
+            finally:
+                db.close()
+        
+        import sqlite3
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT DISTINCT level FROM administrative_units ORDER BY level')
+        levels = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        return levels
+    
     def _get_boundaries_postgis(self, level=1):
         """Get boundaries using PostGIS"""
         db = SessionLocal()
@@ -108,6 +128,41 @@ class SpatialProcessor:
             'features': features
         }
     
+    def get_unit(self, unit_id: str) -> Optional[Dict]:
+        """Get a single administrative unit with its GeoJSON geometry"""
+        if self.use_postgis:
+            db = SessionLocal()
+            try:
+                query = text("""
+                    SELECT id, name, level, ST_AsGeoJSON(geometry) as geometry
+                    FROM administrative_units
+                    WHERE id = :unit_id
+                """)
+                row = db.execute(query, {'unit_id': unit_id}).fetchone()
+            finally:
+                db.close()
+        else:
+            import sqlite3
+            
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT id, name, level, geometry FROM administrative_units WHERE id = ?',
+                (unit_id,)
+            )
+            row = cursor.fetchone()
+            conn.close()
+        
+        if not row:
+            return None
+        
+        return {
+            'id': row[0],
+            'name': row[1],
+            'level': row[2],
+            'geometry': json.loads(row[3]) if row[3] else None
+        }
+    
     def add_climate_values_to_geojson(self, geojson, climate_data, variable):
         climate_dict = {item['name']: item['value'] for item in climate_data}
         
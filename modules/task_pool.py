@@ -0,0 +1,182 @@
+"""
+Managed process pool for CPU-heavy analytics
+
+Distribution fits, PDSI and model training hold the GIL for hundreds of
+milliseconds or more; run inside an async handler they stall every other
+request on the worker. TaskPool runs such functions in warm worker
+processes (numpy/scipy/sklearn and the analytics modules imported once per
+worker) and lets handlers await them with a timeout. A bounded number of
+tasks may be in flight; beyond that submissions fail fast with
+TaskPoolBusy so callers can shed load instead of queueing indefinitely.
+"""
+import asyncio
+import importlib
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Sequence
+from config import Config
+
+
+class TaskPoolBusy(Exception):
+    """Raised when the pool already holds its maximum number of tasks"""
+
+
+def _warm_worker(preload: Sequence[str]):
+    """Process initializer: import heavy modules once per worker"""
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Task worker could not preload {name}: {e}")
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict):
+    """Run fn in the worker, returning (start time, duration, result)"""
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, time.time() - started, result
+
+
+def _ping():
+    return None
+
+
+class TaskPool:
+    """Process pool with per-task timeouts, queue metrics and backpressure"""
+    
+    def __init__(self, max_workers: int = None, max_queue: int = None, timeout: float = None,
+                 preload: Sequence[str] = None):
+        self.max_workers = max_workers or Config.TASK_POOL_WORKERS
+        self.max_queue = Config.TASK_POOL_MAX_QUEUE if max_queue is None else max_queue
+        self.timeout = timeout or Config.TASK_POOL_TIMEOUT
+        self.preload = tuple(preload if preload is not None else Config.TASK_POOL_PRELOAD)
+        
+        self.executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'timed_out': 0, 'rejected': 0, 'restarts': 0}
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+    
+    def start(self):
+        """Create the pool and spawn every worker up front"""
+        if self.executor is not None:
+            return
+        
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(Config.TASK_POOL_START_METHOD),
+            initializer=_warm_worker,
+            initargs=(self.preload,)
+        )
+        for _ in range(self.max_workers):
+            self.executor.submit(_ping)
+    
+    def shutdown(self, wait: bool = False):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=True)
+            self.executor = None
+    
+    def _restart(self, broken: ProcessPoolExecutor):
+        """
+        Replace a broken executor once
+        
+        Every task in flight fails when a worker dies, and each awaiting
+        caller lands here; only the first one still sees the broken executor
+        installed, the rest must not tear down its replacement.
+        """
+        with self._lock:
+            if self.executor is not broken:
+                return
+            self._counters['restarts'] += 1
+            self.executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.start()
+    
+    async def run(self, fn: Callable, *args, timeout: float = None, **kwargs):
+        """
+        Run a picklable module-level function in a worker process
+        
+        Args:
+            fn: Function to call
+            *args, **kwargs: Its arguments (must be picklable)
+            timeout: Seconds to wait for the result (default Config.TASK_POOL_TIMEOUT)
+        
+        Returns:
+            The function's result
+        
+        Raises:
+            TaskPoolBusy: When max_workers + max_queue tasks are already in flight
+            BrokenProcessPool: When a worker died; the pool has been restarted
+            asyncio.TimeoutError: When the result is not ready in time; the
+                                  worker finishes the task in the background
+        """
+        self.start()
+        
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._counters['rejected'] += 1
+                raise TaskPoolBusy(f"{self._in_flight} analytics tasks in flight")
+            self._in_flight += 1
+            self._counters['submitted'] += 1
+        
+        submitted = time.time()
+        executor = self.executor
+        try:
+            future = executor.submit(_timed_call, fn, args, kwargs)
+        except BrokenProcessPool:
+            with self._lock:
+                self._in_flight -= 1
+            self._restart(executor)
+            raise
+        future.add_done_callback(self._release)
+        
+        try:
+            started, duration, result = await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout or self.timeout
+            )
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._counters['timed_out'] += 1
+            raise
+        except BrokenProcessPool:
+            with self._lock:
+                self._counters['failed'] += 1
+            self._restart(executor)
+            raise
+        except Exception:
+            with self._lock:
+                self._counters['failed'] += 1
+            raise
+        
+        with self._lock:
+            self._counters['completed'] += 1
+            self._wait_total += max(started - submitted, 0.0)
+            self._run_total += duration
+            self._run_max = max(self._run_max, duration)
+        
+        return result
+    
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+    
+    def metrics(self) -> Dict:
+        """Queue depth, throughput counters and mean wait/run times in seconds"""
+        with self._lock:
+            completed = self._counters['completed']
+            return {
+                'workers': self.max_workers,
+                'started': self.executor is not None,
+                'in_flight': self._in_flight,
+                'queued': max(self._in_flight - self.max_workers, 0),
+                'capacity': self.max_workers + self.max_queue,
+                **self._counters,
+                'mean_wait_seconds': round(self._wait_total / completed, 4) if completed else None,
+                'mean_run_seconds': round(self._run_total / completed, 4) if completed else None,
+                'max_run_seconds': round(self._run_max, 4)
+            }
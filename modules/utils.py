@@ -1,10 +1,45 @@
 import sqlite3
 import json
+import os
+import sys
 import time
+import tempfile
+from contextlib import contextmanager
 from functools import wraps
 from datetime import datetime
 from config import Config
 
+# Advisory file locks: msvcrt byte-range locks on Windows, flock elsewhere
+if sys.platform == 'win32':
+    import msvcrt
+    
+    def _lock_file(handle, blocking):
+        handle.seek(0)
+        while True:
+            try:
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.05)
+    
+    def _unlock_file(handle):
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+    
+    def _lock_file(handle, blocking):
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    
+    def _unlock_file(handle):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+
 def create_database():
     conn = sqlite3.connect(Config.DATABASE_PATH)
     cursor = conn.cursor()
@@ -174,6 +209,37 @@ def get_cached_climate_data(location_id, variable, date, aggregation='monthly'):
     
     return result[0] if result else None
 
+def get_cached_climate_series(location_ids, variable, start_date, end_date, aggregation='monthly'):
+    """
+    Get cached values for many locations over a date range in one query, as {location_id: {date: value}}
+    
+    A None value marks a date the source had no data for when it was last
+    fetched; such rows expire after Config.CLIMATE_MISSING_TTL seconds.
+    """
+    if not location_ids:
+        return {}
+    
+    conn = sqlite3.connect(Config.DATABASE_PATH)
+    cursor = conn.cursor()
+    
+    placeholders = ','.join('?' * len(location_ids))
+    cursor.execute(f'''
+        SELECT location_id, date, value FROM climate_cache
+        WHERE location_id IN ({placeholders}) AND variable = ? AND aggregation = ?
+        AND date >= ? AND date < ?
+        AND created_at >= datetime('now', '-7 days')
+        AND (value IS NOT NULL OR created_at >= datetime('now', ?))
+    ''', (*location_ids, variable, aggregation, start_date, end_date, f'-{Config.CLIMATE_MISSING_TTL} seconds'))
+    
+    rows = cursor.fetchall()
+    conn.close()
+    
+    series = {location_id: {} for location_id in location_ids}
+    for location_id, date, value in rows:
+        series[location_id][date] = value
+    
+    return series
+
 def cache_climate_data(location_id, variable, date, value, aggregation='monthly'):
     conn = sqlite3.connect(Config.DATABASE_PATH)
     cursor = conn.cursor()
@@ -186,6 +252,19 @@ def cache_climate_data(location_id, variable, date, value, aggregation='monthly'
     conn.commit()
     conn.close()
 
+def cache_climate_data_bulk(rows, aggregation='monthly'):
+    """Cache many (location_id, variable, date, value) rows in one transaction"""
+    conn = sqlite3.connect(Config.DATABASE_PATH)
+    cursor = conn.cursor()
+    
+    cursor.executemany('''
+        INSERT OR REPLACE INTO climate_cache (location_id, variable, date, value, aggregation)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(location_id, variable, date, value, aggregation) for location_id, variable, date, value in rows])
+    
+    conn.commit()
+    conn.close()
+
 def clean_old_cache(days=30):
     conn = sqlite3.connect(Config.DATABASE_PATH)
     cursor = conn.cursor()
@@ -245,3 +324,63 @@ def rate_limit(max_requests=5, window=3600):
         
         return wrapper
     return decorator
+
+def atomic_write(path, write):
+    """
+    Write through a temporary file in the target directory, then os.replace it into place
+    
+    Args:
+        path: Destination file
+        write: Callable receiving the temporary path to write to
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Exclusive advisory lock on path + '.lock', shared by every process on the host
+    
+    Yields:
+        True when the lock is held; False if blocking is off and another process holds it
+    """
+    lock_path = f'{path}.lock'
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    with open(lock_path, 'a+') as handle:
+        if not _lock_file(handle, blocking):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            _unlock_file(handle)
+
+def try_lock(path):
+    """
+    Take the exclusive lock on path + '.lock' without waiting, held until release_lock
+    
+    Returns:
+        The open lock file, or None when another process holds the lock
+    """
+    lock_path = f'{path}.lock'
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    handle = open(lock_path, 'a+')
+    if not _lock_file(handle, blocking=False):
+        handle.close()
+        return None
+    return handle
+
+def release_lock(handle):
+    _unlock_file(handle)
+    handle.close()
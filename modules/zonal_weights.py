@@ -0,0 +1,375 @@
+"""
+Precomputed sparse zonal-weight matrices for fast local zonal statistics
+
+Every administrative unit is rasterized once onto the ERA5 grid covering
+Pakistan. Each matrix row holds the fractional pixel coverage of one zone,
+multiplied by cos(latitude) so that pixels are weighted by their true area.
+Zonal means for all zones and all timesteps then reduce to a single sparse
+matrix product instead of polygon clipping at request time.
+"""
+import os
+import json
+import numpy as np
+from scipy import sparse
+from typing import Dict, List, Optional
+from config import Config
+from modules.utils import atomic_write
+
+
+class GridSpec:
+    """Regular lat/lon grid aligned to the ERA5 pixel edges over Pakistan"""
+    
+    def __init__(self, resolution: float = None, bounds: Dict[str, float] = None):
+        self.resolution = resolution or Config.ERA5_GRID_RESOLUTION
+        bounds = bounds or Config.PAKISTAN_BOUNDS
+        
+        # ERA5 grid points sit on multiples of the resolution, so cell edges are
+        # offset by half a pixel. Snap the bounds outwards to those edges.
+        res = self.resolution
+        self.west = (np.floor(bounds['west'] / res - 0.5) + 0.5) * res
+        self.east = (np.ceil(bounds['east'] / res - 0.5) + 0.5) * res
+        self.south = (np.floor(bounds['south'] / res - 0.5) + 0.5) * res
+        self.north = (np.ceil(bounds['north'] / res - 0.5) + 0.5) * res
+        
+        self.nx = int(round((self.east - self.west) / res))
+        self.ny = int(round((self.north - self.south) / res))
+    
+    @property
+    def shape(self):
+        """Grid shape as (rows, cols), rows ordered north to south"""
+        return (self.ny, self.nx)
+    
+    @property
+    def n_pixels(self) -> int:
+        return self.ny * self.nx
+    
+    def lon_centers(self) -> np.ndarray:
+        return self.west + (np.arange(self.nx) + 0.5) * self.resolution
+    
+    def lat_centers(self) -> np.ndarray:
+        return self.north - (np.arange(self.ny) + 0.5) * self.resolution
+    
+    def nearest_index(self, lon, lat):
+        """
+        Flat pixel index of the grid cell containing each point
+        
+        Args:
+            lon: Longitude(s) in degrees
+            lat: Latitude(s) in degrees
+        
+        Returns:
+            Flat pixel index (row * nx + col), or -1 for points outside the grid
+        """
+        col = np.floor((np.asarray(lon, dtype=np.float64) - self.west) / self.resolution)
+        row = np.floor((self.north - np.asarray(lat, dtype=np.float64)) / self.resolution)
+        inside = (col >= 0) & (col < self.nx) & (row >= 0) & (row < self.ny)
+        return np.where(inside, row * self.nx + col, -1).astype(np.int64)
+    
+    def affine_transform(self) -> Dict[str, float]:
+        """Earth Engine pixel grid transform (top-left origin, north-up)"""
+        return {
+            'scaleX': self.resolution,
+            'shearX': 0,
+            'translateX': float(self.west),
+            'shearY': 0,
+            'scaleY': -self.resolution,
+            'translateY': float(self.north)
+        }
+    
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            'resolution': self.resolution,
+            'west': float(self.west),
+            'east': float(self.east),
+            'south': float(self.south),
+            'north': float(self.north)
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, float]) -> 'GridSpec':
+        return cls(data['resolution'], {
+            'west': data['west'],
+            'east': data['east'],
+            'south': data['south'],
+            'north': data['north']
+        })
+
+
+class ZonalWeights:
+    """Sparse (zones x pixels) area-weighted coverage matrix for one admin level"""
+    
+    def __init__(self, matrix: sparse.csr_matrix, zone_ids: List[str],
+                 zone_names: List[str], grid: GridSpec, level: int):
+        self.matrix = matrix.tocsr()
+        self.zone_ids = list(zone_ids)
+        self.zone_names = list(zone_names)
+        self.grid = grid
+        self.level = level
+    
+    @classmethod
+    def build(cls, boundaries: Dict, grid: GridSpec = None, level: int = 1) -> 'ZonalWeights':
+        """
+        Rasterize boundary polygons onto the grid with fractional coverage
+        
+        Args:
+            boundaries: GeoJSON FeatureCollection of administrative units
+            grid: Target grid (defaults to the ERA5 grid over Pakistan)
+            level: Administrative level the boundaries belong to
+        
+        Returns:
+            ZonalWeights with one row per feature
+        """
+        import shapely
+        from shapely.geometry import shape
+        
+        grid = grid or GridSpec()
+        res = grid.resolution
+        pixel_area = res * res
+        lat_centers = grid.lat_centers()
+        
+        rows, cols, weights = [], [], []
+        zone_ids, zone_names = [], []
+        
+        for zone, feature in enumerate(boundaries['features']):
+            props = feature.get('properties', {})
+            zone_ids.append(props.get('id'))
+            zone_names.append(props.get('name'))
+            
+            if not feature.get('geometry'):
+                continue
+            
+            geom = shape(feature['geometry'])
+            shapely.prepare(geom)
+            minx, miny, maxx, maxy = geom.bounds
+            
+            # Candidate pixels are those under the polygon's bounding box
+            c0 = max(int(np.floor((minx - grid.west) / res)), 0)
+            c1 = min(int(np.ceil((maxx - grid.west) / res)), grid.nx)
+            r0 = max(int(np.floor((grid.north - maxy) / res)), 0)
+            r1 = min(int(np.ceil((grid.north - miny) / res)), grid.ny)
+            if c0 >= c1 or r0 >= r1:
+                continue
+            
+            rr, cc = np.meshgrid(np.arange(r0, r1), np.arange(c0, c1), indexing='ij')
+            rr, cc = rr.ravel(), cc.ravel()
+            x0 = grid.west + cc * res
+            y1 = grid.north - rr * res
+            boxes = shapely.box(x0, y1 - res, x0 + res, y1)
+            
+            hit = shapely.intersects(geom, boxes)
+            coverage = np.zeros(len(boxes))
+            coverage[hit] = shapely.area(shapely.intersection(boxes[hit], geom)) / pixel_area
+            
+            keep = coverage > 0
+            rows.append(np.full(keep.sum(), zone, dtype=np.int64))
+            cols.append(rr[keep] * grid.nx + cc[keep])
+            weights.append(np.minimum(coverage[keep], 1.0) * np.cos(np.deg2rad(lat_centers[rr[keep]])))
+        
+        n_zones = len(zone_ids)
+        if rows:
+            matrix = sparse.csr_matrix(
+                (np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+                shape=(n_zones, grid.n_pixels)
+            )
+        else:
+            matrix = sparse.csr_matrix((n_zones, grid.n_pixels))
+        
+        return cls(matrix, zone_ids, zone_names, grid, level)
+    
+    def zonal_mean(self, values: np.ndarray) -> np.ndarray:
+        """
+        Area-weighted mean of every zone for every timestep
+        
+        Args:
+            values: Gridded values shaped (ny, nx), (time, ny, nx) or
+                    (n_pixels, time). Missing pixels (NaN) are excluded
+                    and the remaining weights renormalized.
+        
+        Returns:
+            Array of shape (n_zones,) for a single field, else (n_zones, time)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        single = values.shape == self.grid.shape
+        
+        if single:
+            pixels = values.reshape(-1, 1)
+        elif values.ndim == 3:
+            pixels = values.reshape(values.shape[0], -1).T
+        else:
+            pixels = values
+        
+        valid = ~np.isnan(pixels)
+        totals = self.matrix @ np.where(valid, pixels, 0.0)
+        norm = self.matrix @ valid.astype(np.float64)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(norm > 0, totals / norm, np.nan)
+        
+        return means[:, 0] if single else means
+    
+    def zonal_extrema(self, values: np.ndarray):
+        """
+        Minimum and maximum of a single field over the pixels touching each zone
+        
+        Args:
+            values: Gridded values shaped (ny, nx); NaN pixels are ignored
+        
+        Returns:
+            Tuple of (minima, maxima), each of shape (n_zones,), NaN for
+            zones without valid pixels
+        """
+        pixels = np.asarray(values, dtype=np.float64).ravel()[self.matrix.indices]
+        starts = self.matrix.indptr[:-1]
+        nonempty = np.diff(self.matrix.indptr) > 0
+        
+        minima = np.full(len(self.zone_ids), np.nan)
+        maxima = np.full(len(self.zone_ids), np.nan)
+        
+        if nonempty.any():
+            with np.errstate(invalid='ignore'):
+                minima[nonempty] = np.fmin.reduceat(pixels, starts[nonempty])
+                maxima[nonempty] = np.fmax.reduceat(pixels, starts[nonempty])
+        
+        return minima, maxima
+    
+    def zonal_class_counts(self, codes: np.ndarray, n_classes: int):
+        """
+        Per-zone histogram of a classified field
+        
+        Args:
+            codes: Integer class codes shaped (ny, nx), negative where missing
+            n_classes: Number of classes
+        
+        Returns:
+            Tuple of (pixel counts, area fractions), each of shape
+            (n_zones, n_classes). Counts include every pixel touching the
+            zone; fractions use the area weights.
+        """
+        codes = np.asarray(codes).ravel()
+        valid = codes >= 0
+        
+        one_hot = sparse.csr_matrix(
+            (np.ones(valid.sum()), (np.flatnonzero(valid), codes[valid])),
+            shape=(self.grid.n_pixels, n_classes)
+        )
+        
+        touched = self.matrix.copy()
+        touched.data = np.ones_like(touched.data)
+        counts = (touched @ one_hot).toarray().astype(np.int64)
+        
+        areas = (self.matrix @ one_hot).toarray()
+        totals = areas.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fractions = np.where(totals > 0, areas / totals, 0.0)
+        
+        return counts, fractions
+    
+    def to_records(self, means: np.ndarray, decimals: int = 2) -> List[Dict]:
+        """Format per-zone means as the [{'name', 'value'}] list used by the map API"""
+        return [
+            {
+                'id': zone_id,
+                'name': name,
+                'value': None if np.isnan(value) else round(float(value), decimals)
+            }
+            for zone_id, name, value in zip(self.zone_ids, self.zone_names, means)
+        ]
+    
+    def save(self, path: str):
+        """Persist as a single uncompressed .npz file, replaced atomically"""
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    data=self.matrix.data,
+                    indices=self.matrix.indices,
+                    indptr=self.matrix.indptr,
+                    shape=np.array(self.matrix.shape),
+                    zone_ids=np.array(self.zone_ids, dtype=str),
+                    zone_names=np.array(self.zone_names, dtype=str),
+                    grid=np.array(json.dumps(self.grid.to_dict())),
+                    level=np.array(self.level)
+                )
+        
+        atomic_write(path, write)
+    
+    @classmethod
+    def load(cls, path: str) -> 'ZonalWeights':
+        with np.load(path, allow_pickle=False) as f:
+            matrix = sparse.csr_matrix(
+                (f['data'], f['indices'], f['indptr']), shape=tuple(f['shape'])
+            )
+            return cls(
+                matrix,
+                f['zone_ids'].tolist(),
+                f['zone_names'].tolist(),
+                GridSpec.from_dict(json.loads(str(f['grid']))),
+                int(f['level'])
+            )
+
+
+# Loaded matrices, keyed by admin level
+_weights_cache: Dict[int, ZonalWeights] = {}
+
+
+def weights_path(level: int) -> str:
+    return os.path.join(Config.ZONAL_WEIGHTS_DIR, f'level_{level}.npz')
+
+
+def get_zonal_weights(level: int = 1) -> Optional[ZonalWeights]:
+    """Return the precomputed weights for a level, or None if not built yet"""
+    if level in _weights_cache:
+        return _weights_cache[level]
+    
+    path = weights_path(level)
+    if not os.path.exists(path):
+        return None
+    
+    try:
+        weights = ZonalWeights.load(path)
+    except Exception as e:
+        print(f"Failed to load zonal weights for level {level}: {e}")
+        return None
+    
+    _weights_cache[level] = weights
+    return weights
+
+
+def build_zonal_weights(spatial_processor=None, levels: List[int] = None,
+                        grid: GridSpec = None) -> Dict[int, ZonalWeights]:
+    """
+    Precompute and store weights for every administrative level
+    
+    Args:
+        spatial_processor: SpatialProcessor used to read administrative_units
+        levels: Levels to build (defaults to every level in the table)
+        grid: Target grid (defaults to the ERA5 grid over Pakistan)
+    
+    Returns:
+        Dictionary mapping level to its ZonalWeights
+    """
+    if spatial_processor is None:
+        from modules.spatial_processor import SpatialProcessor
+        spatial_processor = SpatialProcessor()
+    
+    grid = grid or GridSpec()
+    built = {}
+    
+    for level in levels or spatial_processor.get_levels():
+        boundaries = spatial_processor.get_boundaries(level)
+        if not boundaries['features']:
+            continue
+        
+        weights = ZonalWeights.build(boundaries, grid, level)
+        weights.save(weights_path(level))
+        _weights_cache[level] = weights
+        built[level] = weights
+        
+        print(f"Zonal weights for level {level}: {len(weights.zone_ids)} zones, "
+              f"{weights.matrix.nnz} weighted pixels")
+    
+    return built
+
+
+if __name__ == '__main__':
+    build_zonal_weights()